@@ -0,0 +1,5 @@
+"""
+Benchmarks for berry cam. Run them from the repository root, e.g. via
+
+    python -m benchmarks.bench_logging
+"""
@@ -0,0 +1,74 @@
+"""
+Measures the bandwidth saved by deduplicated uploads against the local stand-in server.
+The server loses some responses after storing the picture, and the backlog is enqueued a second time
+to simulate a restart.
+"""
+import logging
+import os
+import tempfile
+
+from benchmarks.standin_server import StandinServer
+from berry_cam.threads.uploader import Uploader
+from berry_cam.upload_scheduler import FIFO, UploadScheduler
+
+TESTIMAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_data', 'test.jpg')
+PICTURES = 20
+LOST_RESPONSE_RATE = 0.2
+
+
+def create_pictures(directory):
+    """
+    Creates pictures with different content.
+
+    :param directory: The directory to store the pictures in.
+    :return: The paths of the pictures.
+    """
+    with open(TESTIMAGE, 'rb') as image_file:
+        content = image_file.read()
+
+    pictures = []
+    for index in range(PICTURES):
+        path = os.path.join(directory, '{}.jpg'.format(1000 + index))
+        with open(path, 'wb') as picture_file:
+            picture_file.write(content + str(index).encode())
+        pictures.append(path)
+    return pictures
+
+
+def upload(pictures, dedup):
+    """
+    Uploads the pictures twice to a new stand-in server.
+
+    :param pictures: The pictures to upload.
+    :param dedup: If deduplication should be used.
+    :return: The stand-in server after all uploads.
+    """
+    with StandinServer(lost_response_rate=LOST_RESPONSE_RATE, seed=1) as server:
+        upload_queue = UploadScheduler(FIFO)
+        for picture in pictures + pictures:
+            upload_queue.put(picture)
+
+        uploader = Uploader(server.url + '/api/picture/', server.api_key, 10, upload_queue, dedup)
+        uploader.start()
+        upload_queue.join()
+        uploader.stop()
+        uploader.join()
+        return server
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    logging.getLogger('berry_cam').setLevel(logging.CRITICAL)  # Hide the expected connection errors
+    with tempfile.TemporaryDirectory() as directory:
+        pictures = create_pictures(directory)
+        for dedup in (False, True):
+            server = upload(pictures, dedup)
+            print("Deduplication {:3}: {:7.1f} kB sent in {:3} uploads, {} pictures stored".format(
+                'on' if dedup else 'off', server.bytes_received / 1000,
+                server.requests[('POST', '/api/picture/')], len(server.pictures)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Measures the time spent in logging calls with synchronous logging and with the queue based log pipeline.
+The output stream is slowed down to simulate a serial console or an SD card backed journal.
+"""
+import io
+import logging
+import time
+
+from berry_cam.log import LogPipeline
+
+# Time a single write to the slow stream takes
+WRITE_DELAY = 0.001
+MESSAGES = 500
+
+
+class SlowStream(io.StringIO):
+    """
+    A stream that takes some time for each write.
+    """
+
+    def write(self, text):
+        time.sleep(WRITE_DELAY)
+        return super().write(text)
+
+
+def measure(logger):
+    """
+    Measures the time spent in the logging calls.
+
+    :param logging.Logger logger: The logger to log to.
+    :return: The average time per logging call in seconds.
+    """
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        logger.info("Uploading picture %s", i)
+    return (time.perf_counter() - start) / MESSAGES
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    logger = logging.getLogger('benchmark')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    handler = logging.StreamHandler(SlowStream())
+    logger.addHandler(handler)
+    sync_time = measure(logger)
+    logger.removeHandler(handler)
+
+    pipeline = LogPipeline([logging.StreamHandler(SlowStream())], queue_size=MESSAGES)
+    pipeline.start()
+    logger.propagate = True
+    queued_time = measure(logger)
+    pipeline.stop()
+
+    print("Synchronous logging: {:8.1f} us per call".format(sync_time * 1e6))
+    print("Queued logging:      {:8.1f} us per call ({} dropped)".format(queued_time * 1e6, pipeline.dropped))
+
+
+if __name__ == '__main__':
+    main()
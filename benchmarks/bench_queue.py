@@ -0,0 +1,90 @@
+"""
+Measures the cost of passing captured images from the image capturing thread to the uploader:
+enqueuing and dequeuing path strings via the DeleteProtectedQueue compared to capture records via the
+UploadProducer handle, for a plain queue and the upload scheduler. Also measures the memory per queued item.
+"""
+import time
+import tracemalloc
+from queue import Queue
+
+from berry_cam.capture_record import IMAGE, CaptureRecord, as_record
+from berry_cam.threads.uploader import DeleteProtectedQueue, UploadProducer
+from berry_cam.upload_scheduler import NEWEST_EVENT_FIRST, UploadScheduler
+
+# 40 minutes of motion at 10 frames per second
+ITEMS = 24000
+FRAME_INTERVAL = 0.1
+START = 1591000000.0
+
+
+def create_items(records):
+    """
+    Creates the queued items of the captured images.
+
+    :param records: If set, capture records are created, otherwise path strings.
+    :return: The items.
+    """
+    items = []
+    for index in range(ITEMS):
+        capture_time = START + index * FRAME_INTERVAL
+        path = '/home/pi/images/2020-06-01/08/{}.jpg'.format(capture_time)
+        items.append(CaptureRecord(path, IMAGE, capture_time, 250000, index // 100) if records else path)
+    return items
+
+
+def measure(queue, handle, items):
+    """
+    Puts all items via the producer handle into the queue and takes them out again like the uploader does.
+
+    :param queue: The queue.
+    :param handle: The producer handle of the queue.
+    :param items: The items to queue.
+    :return: The time per put and per get in microseconds.
+    """
+    start = time.perf_counter()
+    for item in items:
+        handle.put(item)
+    put_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in items:
+        as_record(queue.get_nowait())
+        queue.task_done()
+    get_time = time.perf_counter() - start
+    return put_time / len(items) * 1e6, get_time / len(items) * 1e6
+
+
+def measure_memory(records):
+    """
+    Measures the memory of the queued items, including the path strings.
+
+    :param records: If set, capture records are measured, otherwise path strings.
+    :return: The bytes per item.
+    """
+    tracemalloc.start()
+    items = create_items(records)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return size / ITEMS
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    print("{} items, {:.0f} frames per second:".format(ITEMS, 1 / FRAME_INTERVAL))
+    for name, create_queue in (('queue', Queue), ('scheduler', lambda: UploadScheduler(NEWEST_EVENT_FIRST))):
+        for records, handle_type in ((False, DeleteProtectedQueue), (True, UploadProducer)):
+            queue = create_queue()
+            put_time, get_time = measure(queue, handle_type(queue), create_items(records))
+            print("  {:9} {:7} via {:20}: put {:5.2f} us, get {:5.2f} us".format(
+                name, 'records' if records else 'paths', handle_type.__name__, put_time, get_time))
+
+    print("Memory per queued item:")
+    print("  paths:   {:5.0f} bytes".format(measure_memory(False)))
+    print("  records: {:5.0f} bytes".format(measure_memory(True)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Measures the bandwidth saved and the cpu time spent by cropping the frames of a motion to the region of
+interest, on a recorded frame sequence.
+
+Pass a directory of recorded jpeg frames of a motion, named by capture time like the camera does, e.g.
+'python -m benchmarks.bench_roi /path/to/frames'. Without a directory, a sequence of an object moving
+through a static scene is synthesized in camera resolution.
+
+Needs Pillow, which is installed with the 'thumbnails' extra.
+"""
+import argparse
+import io
+import os
+import time
+
+from PIL import Image
+
+from berry_cam.images import capture_time
+from berry_cam.roi import RoiCropper
+
+TESTIMAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_data', 'test.jpg')
+RESOLUTION = (1024, 768)
+FRAMES = 40
+OBJECT_SIZE = (120, 200)
+
+
+def synthesize_frames():
+    """
+    Synthesizes a motion: a dark object walking through a static scene, with some sensor noise.
+
+    :return: The frames as jpeg in capture order.
+    """
+    with Image.open(TESTIMAGE) as image:
+        scene = image.convert('RGB').resize(RESOLUTION)
+
+    frames = []
+    for index in range(FRAMES):
+        frame = Image.blend(scene, Image.effect_noise(RESOLUTION, 10).convert('RGB'), 0.05)
+        left = index * (RESOLUTION[0] - OBJECT_SIZE[0]) // (FRAMES - 1)
+        top = RESOLUTION[1] // 2 - OBJECT_SIZE[1] // 2
+        frame.paste((40, 30, 30), (left, top, left + OBJECT_SIZE[0], top + OBJECT_SIZE[1]))
+        output = io.BytesIO()
+        frame.save(output, 'JPEG', quality=85)
+        frames.append(output.getvalue())
+    return frames
+
+
+def load_frames(directory):
+    """
+    Loads recorded frames.
+
+    :param directory: The directory of the frames.
+    :return: The frames as jpeg in capture order.
+    """
+    names = sorted((name for name in os.listdir(directory) if name.endswith('.jpg')),
+                   key=lambda name: capture_time(name) or 0)
+    frames = []
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as frame_file:
+            frames.append(frame_file.read())
+    return frames
+
+
+def measure(frames, **options):
+    """
+    Crops all frames of the motion.
+
+    :param frames: The frames as jpeg in capture order.
+    :param options: The options of the cropper.
+    :return: The uploaded bytes, the cpu time per frame in seconds and the cropper.
+    """
+    cropper = RoiCropper(**options)
+    cropper.start()
+    uploaded = 0
+    start = time.process_time()
+    for index, frame in enumerate(frames):
+        uploaded += len(cropper.crop('{}.jpg'.format(1000 + index * 0.5), frame)[1])
+    return uploaded, (time.process_time() - start) / len(frames), cropper
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    parser = argparse.ArgumentParser(description='Measures the region of interest cropping.')
+    parser.add_argument('directory', nargs='?', help='A directory of recorded frames of a motion.')
+    args = parser.parse_args()
+
+    frames = load_frames(args.directory) if args.directory else synthesize_frames()
+    full = sum(len(frame) for frame in frames)
+    print("{} frames, {:.0f} kB as full frames".format(len(frames), full / 1000))
+
+    for max_area in (0.25, 0.5):
+        for key_frame_interval in (10, 20):
+            uploaded, cpu_time, cropper = measure(frames, max_area=max_area, key_frame_interval=key_frame_interval)
+            print("  max area {:.2f}, key frame every {:2}: {:6.0f} kB ({:5.1%}), {:2} key frames, "
+                  "{:5.1f} ms cpu per frame".format(max_area, key_frame_interval, uploaded / 1000, uploaded / full,
+                                                    cropper.key_frames, cpu_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Measures the latency from a PIR trigger to the first usable image for each camera standby mode.
+Uses a simulated camera and clock: the scene brightness changes over time and the automatic exposure
+only adapts on captured frames.
+"""
+import math
+import random
+import statistics
+
+from berry_cam.camera_standby import MODES, CameraStandby
+
+# Simulated time of a single capture in seconds
+CAPTURE_TIME = 0.2
+# Interval of the capture loop in seconds
+LOOP_INTERVAL = 0.5
+# A frame is usable if its exposure is off by at most this ratio
+USABLE_ERROR = 0.1
+TRIGGERS = 200
+
+
+class SimulatedClock:
+    """
+    A manually advanced clock.
+    """
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class SimulatedCamera:
+    """
+    A camera whose automatic exposure converges towards the scene brightness with each captured frame.
+    """
+
+    def __init__(self, clock, seed):
+        self._clock = clock
+        self._random = random.Random(seed)
+        self._clouds = 0
+        self._clouds_time = 0
+        self.exposure = self.scene()
+        self.exposure_mode = 'auto'
+        self.awb_mode = 'auto'
+        self.awb_gains = (1.5, 1.2)
+        self.shutter_speed = 0
+        self.last_usable = False
+
+    def scene(self):
+        """
+        Returns the current scene brightness: a daily cycle with passing clouds.
+        """
+        now = self._clock()
+        while self._clouds_time < now:
+            self._clouds = max(-0.5, min(0.5, self._clouds + self._random.gauss(0, 0.02)))
+            self._clouds_time += 10
+        return 100 * (1.5 + math.sin(2 * math.pi * now / 86400)) * (1 + self._clouds)
+
+    @property
+    def exposure_speed(self):
+        return self.exposure
+
+    def capture(self, output, format=None, use_video_port=False, resize=None):
+        scene = self.scene()
+        if self.exposure_mode == 'auto':
+            self.exposure += 0.6 * (scene - self.exposure)
+        elif self.shutter_speed:
+            self.exposure = self.shutter_speed
+        self.last_usable = abs(self.exposure - scene) / scene <= USABLE_ERROR
+
+
+def simulate(mode, seed=1):
+    """
+    Simulates triggers after random idle times.
+
+    :param mode: The standby mode to use.
+    :param seed: The seed for the simulation.
+    :return: The latencies from trigger to first usable frame in seconds and the amount of metering frames.
+    """
+    clock = SimulatedClock()
+    camera = SimulatedCamera(clock, seed)
+    standby = CameraStandby(camera, mode, interval=30, settle_time=2, clock=clock)
+    idle_times = random.Random(seed)
+
+    latencies = []
+    for _ in range(TRIGGERS):
+        # Idle until the next motion
+        trigger = clock.now + idle_times.uniform(300, 1800)
+        while clock.now < trigger:
+            standby.idle()
+            clock.now += LOOP_INTERVAL
+
+        # Capture until the first usable frame
+        start = clock.now
+        while True:
+            clock.now += CAPTURE_TIME
+            camera.capture(None, 'jpeg')
+            standby.wake()
+            if camera.last_usable:
+                break
+            clock.now += LOOP_INTERVAL - CAPTURE_TIME
+        latencies.append(clock.now - start)
+
+    return latencies, standby.meterings
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    print("Trigger to first usable frame over {} triggers:".format(TRIGGERS))
+    for mode in MODES:
+        latencies, meterings = simulate(mode)
+        first_usable = sum(1 for latency in latencies if latency < LOOP_INTERVAL) / len(latencies)
+        print("{:6} mean {:5.2f} s, max {:5.2f} s, first frame usable {:5.1%}, {:6} metering frames".format(
+            mode, statistics.mean(latencies), max(latencies), first_usable, meterings))
+
+
+if __name__ == '__main__':
+    main()
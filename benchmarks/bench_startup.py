@@ -0,0 +1,48 @@
+"""
+Measures the import time of the berry cam modules in fresh interpreters.
+Importing the daemon module must stay cheap, the hardware and network libraries are only imported by main().
+"""
+import statistics
+import subprocess
+import sys
+
+RUNS = 10
+MODULES = [
+    'berry_cam.run_cam',
+    'berry_cam.threads.uploader',
+    'berry_cam.threads.heartbeat',
+    'berry_cam.threads.settings_loader',
+    'yaml',
+    'requests'
+]
+
+
+def import_time(module):
+    """
+    Measures the cumulative import time of a module via 'python -X importtime'.
+
+    :param module: The module to import.
+    :return: The median import time in seconds.
+    """
+    times = []
+    for _ in range(RUNS):
+        output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+        # Line format: 'import time: self [us] | cumulative | imported package'
+        for line in output.splitlines():
+            columns = line.split('|')
+            if len(columns) == 3 and columns[2].strip() == module:
+                times.append(int(columns[1]) / 1e6)
+    return statistics.median(times)
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    for module in MODULES:
+        print("{:40} {:8.1f} ms".format(module, import_time(module) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Measures the throughput of the thumbnail and upload stages on sample images of the camera resolution,
+and how long it takes until the server has a preview of each image of a motion event with and without
+thumbnails.
+
+Needs Pillow, which is installed with the 'thumbnails' extra.
+"""
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue
+
+from PIL import Image
+
+from benchmarks.standin_server import StandinServer
+from berry_cam.images import content_hash, create_thumbnail, thumbnail_path
+from berry_cam.threads.thumbnail_generator import ThumbnailGenerator
+from berry_cam.threads.uploader import Uploader
+from berry_cam.upload_scheduler import UploadScheduler
+
+TESTIMAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_data', 'test.jpg')
+RESOLUTION = (1024, 768)
+IMAGES = 20
+CAPTURE_INTERVAL = 0.25
+BANDWIDTH = 200000  # Bytes per second, a slow mobile uplink
+
+
+def create_images(directory):
+    """
+    Creates sample images in camera resolution with some noise, so they compress like camera images
+    and have different content.
+
+    :param directory: The directory to store the images in.
+    :return: The paths of the images.
+    """
+    with Image.open(TESTIMAGE) as image:
+        sample = image.resize(RESOLUTION)
+
+    images = []
+    for index in range(IMAGES):
+        path = os.path.join(directory, '{}.jpg'.format(1000 + index * CAPTURE_INTERVAL))
+        noise = Image.effect_noise(RESOLUTION, 20).convert('RGB')
+        Image.blend(sample, noise, 0.15).save(path, 'JPEG', quality=85)
+        images.append(path)
+    return images
+
+
+def measure_thumbnails(images, workers):
+    """
+    Creates the thumbnails of all images.
+
+    :param images: The images to create thumbnails of.
+    :param workers: The amount of worker processes, 0 to create them in this process.
+    :return: The thumbnails per second.
+    """
+    start = time.perf_counter()
+    if workers:
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(create_thumbnail, images))
+    else:
+        for image in images:
+            create_thumbnail(image)
+    return len(images) / (time.perf_counter() - start)
+
+
+def measure_uploads(pictures):
+    """
+    Uploads the pictures to a stand-in server.
+
+    :param pictures: The pictures to upload.
+    :return: The uploads per second.
+    """
+    with StandinServer(bandwidth=BANDWIDTH) as server:
+        upload_queue = Queue()
+        for picture in pictures:
+            upload_queue.put(picture)
+
+        start = time.perf_counter()
+        uploader = Uploader(server.url + '/api/picture/', server.api_key, 3, upload_queue)
+        uploader.start()
+        upload_queue.join()
+        duration = time.perf_counter() - start
+        uploader.stop()
+        uploader.join()
+        return len(pictures) / duration
+
+
+def measure_preview_latency(images, thumbnails):
+    """
+    Passes the images through the upload path to a server with limited bandwidth, capturing them in
+    real time. Measures per image how long it takes until the server has a preview. Without thumbnails,
+    the full resolution image is the preview.
+
+    :param images: The images of the motion event.
+    :param thumbnails: If thumbnails should be created.
+    :return: The mean and the maximum time until the preview was received in seconds.
+    """
+    with StandinServer(bandwidth=BANDWIDTH) as server:
+        upload_queue = UploadScheduler()
+        capture_queue = upload_queue
+        generator = None
+        if thumbnails:
+            capture_queue = Queue()
+            generator = ThumbnailGenerator(upload_queue, capture_queue)
+            generator.start()
+        uploader = Uploader(server.url + '/api/picture/', server.api_key, 3, upload_queue)
+        uploader.start()
+
+        captured = {}
+        for image in images:
+            captured[image] = time.monotonic()
+            capture_queue.put(image)
+            time.sleep(CAPTURE_INTERVAL)
+        capture_queue.join()
+        upload_queue.join()
+
+        if thumbnails:
+            generator.stop()
+            generator.join()
+            latencies = [server.thumbnails[os.path.basename(image)] - captured[image] for image in images]
+        else:
+            latencies = [server.upload_times[content_hash(image)] - captured[image] for image in images]
+        uploader.stop()
+        uploader.join()
+        return sum(latencies) / len(latencies), max(latencies)
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    logging.getLogger('berry_cam').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        images = create_images(directory)
+
+        print("Thumbnail stage ({} images of {}x{}):".format(IMAGES, *RESOLUTION))
+        print("  in process:  {:6.1f} images/s".format(measure_thumbnails(images, 0)))
+        for workers in sorted({1, os.cpu_count()}):
+            print("  {:2} workers:  {:6.1f} images/s".format(workers, measure_thumbnails(images, workers)))
+
+        thumbnails = [thumbnail_path(image) for image in images]
+        print("Upload stage ({:.0f} kB/s):".format(BANDWIDTH / 1000))
+        print("  full images: {:6.1f} images/s".format(measure_uploads(images)))
+        print("  thumbnails:  {:6.1f} images/s".format(measure_uploads(thumbnails)))
+
+        print("Preview on the server, capturing every {} s:".format(CAPTURE_INTERVAL))
+        for enabled in (False, True):
+            mean, worst = measure_preview_latency(images, enabled)
+            print("  thumbnails {:3}: {:.3f} s mean, {:.3f} s max".format('on' if enabled else 'off', mean, worst))
+
+
+if __name__ == '__main__':
+    main()
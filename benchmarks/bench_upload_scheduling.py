@@ -0,0 +1,89 @@
+"""
+Measures the time to the first uploaded image of each motion event while a backlog is uploaded,
+for each scheduling policy. Uses a simulated clock, so the benchmark runs instantly.
+"""
+import statistics
+
+from berry_cam.upload_scheduler import POLICIES, UploadScheduler
+
+# Simulated upload time per image in seconds
+UPLOAD_TIME = 0.5
+# Backlog after an outage: amount of events and frames per event
+BACKLOG_EVENTS = 30
+# New events during the upload of the backlog: an event every 60 seconds
+NEW_EVENT_INTERVAL = 60
+NEW_EVENTS = 10
+FRAMES_PER_EVENT = 20
+FRAME_INTERVAL = 0.5
+
+
+def event_frames(start):
+    """
+    Returns the image names of an event.
+
+    :param start: The capture time of the first frame.
+    :return: The capture time and image name of each frame.
+    """
+    return [(start + frame * FRAME_INTERVAL, '{}.jpg'.format(start + frame * FRAME_INTERVAL))
+            for frame in range(FRAMES_PER_EVENT)]
+
+
+def simulate(policy):
+    """
+    Simulates uploading the backlog and the new events.
+
+    :param policy: The scheduling policy to use.
+    :return: Two lists with the time to the first uploaded image of the backlog events and the new events.
+    """
+    scheduler = UploadScheduler(policy)
+    image_events = {}
+
+    # Backlog captured before the connection came back at time 0
+    event_starts = [-BACKLOG_EVENTS * NEW_EVENT_INTERVAL + event * NEW_EVENT_INTERVAL
+                    for event in range(BACKLOG_EVENTS)]
+    for start in event_starts:
+        for _, image in event_frames(start):
+            image_events[image] = start
+            scheduler.put(image)
+
+    # New events are captured while the backlog is uploaded
+    pending = []
+    for event in range(NEW_EVENTS):
+        start = 1 + event * NEW_EVENT_INTERVAL
+        event_starts.append(start)
+        for capture, image in event_frames(start):
+            image_events[image] = start
+            pending.append((capture, image))
+
+    first_uploads = {}
+    now = 0
+    while not scheduler.empty() or pending:
+        while pending and pending[0][0] <= now:
+            scheduler.put(pending.pop(0)[1])
+        if scheduler.empty():
+            now = pending[0][0]
+            continue
+
+        image = scheduler.get_nowait()
+        now += UPLOAD_TIME
+        start = image_events[image]
+        first_uploads.setdefault(start, now - max(start, 0))
+
+    latencies = [first_uploads[start] for start in event_starts]
+    return latencies[:BACKLOG_EVENTS], latencies[BACKLOG_EVENTS:]
+
+
+def main():
+    """
+    Runs the benchmark.
+    """
+    print("Time to first image per event ({} backlog events, {} new events, {} frames each):".format(
+        BACKLOG_EVENTS, NEW_EVENTS, FRAMES_PER_EVENT))
+    for policy in POLICIES:
+        backlog, new = simulate(policy)
+        print("{:20} new events: mean {:7.1f} s, max {:7.1f} s | backlog events: mean {:7.1f} s".format(
+            policy, statistics.mean(new), max(new), statistics.mean(backlog)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+"""
+Runs the berry cam daemon for a long time under a simulated workload and fails if resources leak or the
+throughput drifts, e.g. file descriptors not closed after failed uploads or threads piling up on reconnects.
+
+The daemon runs with all threads in a separate process, with fake_rpi, a fake camera capturing the test image
+and a PIR triggering on a fixed schedule. It uploads to a local stand-in server that loses some responses.
+Time is accelerated by triggering far more often than a real camera would, a simulated day is MOTIONS_PER_DAY
+motions. The push channel is disconnected and the configuration is reloaded regularly to exercise reconnects.
+
+The RSS, open file descriptors and threads of the daemon and the upload throughput are sampled regularly.
+They are compared between the start and the end of the run, after a warm up:
+
+    python -m benchmarks.soak --duration 3600
+
+Needs a Linux /proc filesystem and fake_rpi.
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.standin_server import StandinServer
+
+TESTIMAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_data', 'test.jpg')
+REPOSITORY = os.path.join(os.path.dirname(__file__), '..')
+# Motions a busy real camera sees per day
+MOTIONS_PER_DAY = 100
+
+CONFIG = """
+camera:
+  name: Soak-Camera
+  image_location: {image_location}
+  frame_interval: {frame_interval}
+image_server:
+  server_url: {server_url}
+  api_key: soak_key
+  retry_count: 3
+  timeout: 5
+  push: true
+pir:
+  number_type: BCM
+  pin: 23
+  reset_time: 0.5
+heartbeat:
+  interval: 1
+upload:
+  dedup: true
+thumbnails:
+  enabled: {thumbnails}
+thermal:
+  # The load of the host running the soak test would throttle the camera
+  enabled: false
+reload:
+  interval: 1
+"""
+
+
+class SoakCamera:
+    """
+    A fake PiCamera capturing the test image. Each frame gets a unique trailer, so every frame is a
+    new picture for the server.
+    """
+
+    def __init__(self, resolution=None, **kwargs):
+        with open(TESTIMAGE, 'rb') as image_file:
+            self._image = image_file.read()
+        self._frames = 0
+        self.exposure_speed = 10000
+        self.exposure_mode = 'auto'
+        self.awb_mode = 'auto'
+        self.awb_gains = (1.5, 1.2)
+        self.shutter_speed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def capture(self, output, format=None, use_video_port=False, resize=None, **options):
+        self._frames += 1
+        output.write(self._image)
+        output.write('{}:{}'.format(os.getpid(), self._frames).encode())
+
+
+class MotionSchedule:
+    """
+    A PIR input reporting a motion of a fixed length once per period. Starts without motion.
+    """
+
+    def __init__(self, period, length):
+        """
+        :param period: The time between the starts of two motions in seconds.
+        :param length: The length of a motion in seconds.
+        """
+        self._period = period
+        self._length = length
+        self._start = time.monotonic()
+
+    def __call__(self, channel):
+        return int((time.monotonic() - self._start) % self._period >= self._period - self._length)
+
+
+def run_daemon(config_path, motion_period, motion_length):
+    """
+    Runs the daemon with fake raspberry pi libraries, the fake camera and the motion schedule.
+    Called in the daemon process.
+
+    :param config_path: The path of the configuration.
+    :param motion_period: The time between the starts of two motions in seconds.
+    :param motion_length: The length of a motion in seconds.
+    """
+    import types
+    import fake_rpi
+
+    fake_rpi.toggle_print(False)
+    fake_rpi.RPi.GPIO.input = MotionSchedule(motion_period, motion_length)
+    picamera = types.ModuleType('picamera')
+    picamera.PiCamera = SoakCamera
+    sys.modules['RPi'] = fake_rpi.RPi
+    sys.modules['RPi.GPIO'] = fake_rpi.RPi.GPIO
+    sys.modules['picamera'] = picamera
+
+    from berry_cam.run_cam import main
+    main(['--config', config_path])
+
+
+def read_status(pid):
+    """
+    Reads the resource usage of a process from /proc.
+
+    :param pid: The process id.
+    :return: The RSS in kB, the number of open file descriptors and the number of threads.
+    """
+    status = {}
+    with open('/proc/{}/status'.format(pid)) as status_file:
+        for line in status_file:
+            key, _, value = line.partition(':')
+            status[key] = value.split()
+    return int(status['VmRSS'][0]), len(os.listdir('/proc/{}/fd'.format(pid))), int(status['Threads'][0])
+
+
+class Sample:
+    """
+    The resource usage and throughput of the daemon at a point in time.
+    """
+
+    __slots__ = ('time', 'rss', 'fds', 'threads', 'uploaded', 'throughput')
+
+    def __init__(self, time, rss, fds, threads, uploaded, throughput):
+        """
+        :param time: The time since the start in seconds.
+        :param rss: The resident set size in kB.
+        :param fds: The number of open file descriptors.
+        :param threads: The number of threads.
+        :param uploaded: The number of pictures the server received so far.
+        :param throughput: The pictures uploaded per second since the last sample.
+        """
+        self.time = time
+        self.rss = rss
+        self.fds = fds
+        self.threads = threads
+        self.uploaded = uploaded
+        self.throughput = throughput
+
+
+def check_limits(samples, warmup, max_rss_growth, max_fd_growth, max_thread_growth, min_throughput_ratio):
+    """
+    Compares the resource usage and throughput between the start and the end of the run.
+    The medians of the first and the last third of the samples after the warm up are compared,
+    so single spikes, e.g. during a retry, do not fail the run.
+
+    :param samples: The samples in order.
+    :param warmup: The time in seconds at the start that is not compared.
+    :param max_rss_growth: The maximum growth of the RSS in kB.
+    :param max_fd_growth: The maximum growth of the open file descriptors.
+    :param max_thread_growth: The maximum growth of the threads.
+    :param min_throughput_ratio: The minimum throughput at the end, relative to the start.
+    :return: A description of each exceeded limit, empty if all limits are kept.
+    """
+    samples = [sample for sample in samples if sample.time >= warmup]
+    if len(samples) < 3:
+        return ["Not enough samples after the warm up, run longer or sample more often."]
+
+    third = len(samples) // 3
+    first, last = samples[:third], samples[-third:]
+
+    failures = []
+    for name, attribute, limit in (('RSS (kB)', 'rss', max_rss_growth), ('open files', 'fds', max_fd_growth),
+                                   ('threads', 'threads', max_thread_growth)):
+        start = statistics.median(getattr(sample, attribute) for sample in first)
+        end = statistics.median(getattr(sample, attribute) for sample in last)
+        if end - start > limit:
+            failures.append("{} grew from {} to {}, limit is {}".format(name, start, end, limit))
+
+    start = statistics.median(sample.throughput for sample in first)
+    end = statistics.median(sample.throughput for sample in last)
+    if end < start * min_throughput_ratio:
+        failures.append("Throughput dropped from {:.2f} to {:.2f} pictures per second, limit is {:.0%}".format(
+            start, end, min_throughput_ratio))
+    return failures
+
+
+def soak(duration, sample_interval, motion_period, motion_length, frame_interval, lost_response_rate,
+         thumbnails, disturb_interval, output=None):
+    """
+    Runs the daemon under the simulated workload and samples it.
+
+    :param duration: The run time in seconds.
+    :param sample_interval: The time between two samples in seconds.
+    :param motion_period: The time between the starts of two motions in seconds.
+    :param motion_length: The length of a motion in seconds.
+    :param frame_interval: The frame interval of the camera in seconds.
+    :param lost_response_rate: The probability that the server loses the response to an upload.
+    :param thumbnails: If set, thumbnails are generated. Needs Pillow.
+    :param disturb_interval: The time in seconds between disconnecting the push channel and
+                             reloading the configuration.
+    :param output: A file object to write the samples to as csv, None to not write them.
+    :return: The samples and the exit code of the daemon.
+    """
+    samples = []
+    with tempfile.TemporaryDirectory() as directory, \
+            StandinServer('soak_key', lost_response_rate=lost_response_rate, seed=1) as server:
+        config_path = os.path.join(directory, 'conf.yaml')
+        image_location = os.path.join(directory, 'images')
+        with open(config_path, 'w') as config_file:
+            config_file.write(CONFIG.format(image_location=image_location, frame_interval=frame_interval,
+                                            server_url=server.url, thumbnails='true' if thumbnails else 'false'))
+
+        command = [sys.executable, '-c', 'import sys; from benchmarks.soak import run_daemon; '
+                                         'run_daemon(sys.argv[1], float(sys.argv[2]), float(sys.argv[3]))',
+                   config_path, str(motion_period), str(motion_length)]
+        with open(os.path.join(directory, 'daemon.log'), 'w') as log_file:
+            daemon = subprocess.Popen(command, cwd=REPOSITORY, stdout=log_file, stderr=subprocess.STDOUT)
+            try:
+                start = time.monotonic()
+                next_sample = start + sample_interval
+                next_disturbance = start + disturb_interval
+                last_time, last_uploaded = start, 0
+                if output:
+                    output.write('time,rss_kb,fds,threads,uploaded,throughput\n')
+
+                while time.monotonic() - start < duration and daemon.poll() is None:
+                    time.sleep(max(0, min(next_sample, next_disturbance) - time.monotonic()))
+                    now = time.monotonic()
+                    if now >= next_disturbance:
+                        server.disconnect_subscribers()
+                        daemon.send_signal(signal.SIGHUP)
+                        next_disturbance += disturb_interval
+                    if now < next_sample:
+                        continue
+                    next_sample += sample_interval
+
+                    rss, fds, threads = read_status(daemon.pid)
+                    uploaded = len(server.pictures)
+                    sample = Sample(now - start, rss, fds, threads, uploaded,
+                                    (uploaded - last_uploaded) / (now - last_time))
+                    last_time, last_uploaded = now, uploaded
+                    samples.append(sample)
+                    print("{:7.0f} s ({:5.2f} days): {:7} kB RSS, {:3} files, {:3} threads, {:6} uploaded, "
+                          "{:5.2f} pictures/s".format(sample.time, sample.time / motion_period / MOTIONS_PER_DAY,
+                                                      rss, fds, threads, uploaded, sample.throughput))
+                    if output:
+                        output.write('{:.1f},{},{},{},{},{:.3f}\n'.format(sample.time, rss, fds, threads, uploaded,
+                                                                          sample.throughput))
+                        output.flush()
+            finally:
+                if daemon.poll() is None:
+                    daemon.send_signal(signal.SIGTERM)
+                try:
+                    daemon.wait(30)
+                except subprocess.TimeoutExpired:
+                    daemon.kill()
+                    daemon.wait()
+
+        if daemon.returncode != 0:
+            with open(os.path.join(directory, 'daemon.log')) as log_file:
+                print(log_file.read()[-5000:])
+    return samples, daemon.returncode
+
+
+def main():
+    """
+    Runs the soak test. Exits with 1 if a limit was exceeded or the daemon failed.
+    """
+    parser = argparse.ArgumentParser(description='Runs the daemon under a simulated workload to find leaks.')
+    parser.add_argument('--duration', type=float, default=3600, help='The run time in seconds.')
+    parser.add_argument('--sample-interval', type=float, default=10, help='The time between samples in seconds.')
+    parser.add_argument('--warmup', type=float, default=None,
+                        help='The time in seconds not compared at the start, by default a tenth of the duration.')
+    parser.add_argument('--motion-period', type=float, default=6, help='The time between motions in seconds.')
+    parser.add_argument('--motion-length', type=float, default=2, help='The length of a motion in seconds.')
+    parser.add_argument('--frame-interval', type=float, default=0.1, help='The frame interval in seconds.')
+    parser.add_argument('--lost-response-rate', type=float, default=0.05,
+                        help='The probability that the server loses the response to an upload.')
+    parser.add_argument('--thumbnails', action='store_true', help='Generates thumbnails, needs Pillow.')
+    parser.add_argument('--disturb-interval', type=float, default=60,
+                        help='The time between push channel disconnects and configuration reloads in seconds.')
+    parser.add_argument('--max-rss-growth', type=int, default=20000, help='The maximum RSS growth in kB.')
+    parser.add_argument('--max-fd-growth', type=int, default=5, help='The maximum growth of open files.')
+    parser.add_argument('--max-thread-growth', type=int, default=3, help='The maximum growth of threads.')
+    parser.add_argument('--min-throughput-ratio', type=float, default=0.8,
+                        help='The minimum throughput at the end relative to the start.')
+    parser.add_argument('--output', help='A csv file to write the samples to.')
+    args = parser.parse_args()
+
+    print("Soaking for {:.0f} s, {:.1f} simulated days:".format(
+        args.duration, args.duration / args.motion_period / MOTIONS_PER_DAY))
+    output = open(args.output, 'w') if args.output else None
+    try:
+        samples, returncode = soak(args.duration, args.sample_interval, args.motion_period, args.motion_length,
+                                   args.frame_interval, args.lost_response_rate, args.thumbnails,
+                                   args.disturb_interval, output)
+    finally:
+        if output:
+            output.close()
+
+    failures = check_limits(samples, args.warmup if args.warmup is not None else args.duration / 10,
+                            args.max_rss_growth, args.max_fd_growth, args.max_thread_growth,
+                            args.min_throughput_ratio)
+    if returncode != 0:
+        failures.append("The daemon exited with {}".format(returncode))
+    for failure in failures:
+        print("FAILED: {}".format(failure))
+    if not failures:
+        print("Passed.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""
+A local stand-in for the image server, used by the benchmarks and tests.
+
+Implements the parts of the image server api used by berry cam:
+
+* GET /api/camera/?name=...&api_key=... returns the camera settings as json, e.g. {"enabled": true}
+* POST /api/camera/ with form data name, api_key and enabled is a heartbeat
+* POST /api/picture/ with form data api_key (and optionally checksum) and a multipart 'file' uploads a picture.
+  Thumbnails are uploaded the same way with the name of their full resolution image as 'thumbnail_of'.
+* HEAD /api/picture/?api_key=...&checksum=... returns 200 if a picture with this checksum exists, 404 otherwise
+* POST /api/event/?name=...&api_key=... with a (gzip compressed) tar archive as body uploads the frames of
+  a motion event, see berry_cam.event_archive for the format. The frames are stored like uploaded pictures.
+* GET /api/camera/events/?name=...&api_key=... streams settings changes as server-sent events of type 'settings'.
+  The event ids count the settings changes. Without a Last-Event-ID header, the current settings are sent first,
+  otherwise all changes after the given id. Keep alive comments are sent regularly.
+
+The server can simulate a flaky connection by dropping the response after a picture was stored,
+and a slow connection by limiting the bandwidth of the received request bodies.
+"""
+import email.parser
+import email.policy
+import hashlib
+import io
+import json
+import tarfile
+import random
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def parse_form(content_type, body):
+    """
+    Parses an url encoded or multipart form.
+
+    :param content_type: The content type header of the request.
+    :param body: The request body.
+    :return: A dict of field name to value. Values of multipart forms are bytes.
+    """
+    if content_type.startswith('multipart/form-data'):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        return {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+                for part in message.iter_parts()}
+
+    return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """
+    Handles the requests of the stand-in server.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def standin(self):
+        return self.server.standin
+
+    def _query(self):
+        return {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return body
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _respond(self, status, content=None):
+        body = json.dumps(content).encode() if content is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _dispatch(self):
+        body = self._read_body() if self.command == 'POST' else b''
+        self.body = body
+        if self.standin.bandwidth:
+            time.sleep(len(body) / self.standin.bandwidth)
+        self.standin.count(self.command, urlparse(self.path).path, len(body))
+
+        handler = self.standin.routes.get((self.command, urlparse(self.path).path))
+        if handler is None:
+            self._respond(HTTPStatus.NOT_FOUND, {'message': 'Not found'})
+            return
+
+        params = self._query()
+        if body and self.headers.get('Content-Type', '').startswith(
+                ('multipart/form-data', 'application/x-www-form-urlencoded')):
+            params.update(parse_form(self.headers.get('Content-Type', ''), body))
+        api_key = params.get('api_key')
+        if isinstance(api_key, bytes):
+            api_key = api_key.decode()
+        if api_key != self.standin.api_key:
+            self._respond(HTTPStatus.FORBIDDEN, {'message': 'Access denied'})
+            return
+
+        response = handler(self, params)
+        if response is None:
+            # Response already streamed or simulated lost response
+            self.close_connection = True
+            return
+        self._respond(*response)
+
+    do_GET = _dispatch
+    do_HEAD = _dispatch
+    do_POST = _dispatch
+
+
+class StandinServer:
+    """
+    A local stand-in for the image server running in a background thread.
+    """
+
+    def __init__(self, api_key='valid_key', enabled=True, lost_response_rate=0, seed=None, keepalive_interval=15,
+                 bandwidth=None):
+        """
+        Creates a new stand-in server.
+
+        :param api_key: The api key the clients need to send.
+        :param enabled: The 'enabled' setting of the camera.
+        :param lost_response_rate: The probability that the response to a picture upload is lost after
+                                   the picture was stored.
+        :param seed: The seed for the random lost responses.
+        :param keepalive_interval: The interval in seconds to send keep alive comments on the push channel.
+        :param bandwidth: The simulated bandwidth for request bodies in bytes per second, None for unlimited.
+        """
+        self.api_key = api_key
+        self.enabled = enabled
+        self.lost_response_rate = lost_response_rate
+        self.pictures = {}  # Checksum -> picture content
+        self.thumbnails = {}  # Name of the full resolution image -> time the thumbnail was received
+        self.upload_times = {}  # Checksum -> time the picture was first received
+        self.events = []  # The manifests of the uploaded event archives
+        self.heartbeats = 0
+        self.requests = Counter()  # (method, path) -> count
+        self.bytes_received = 0
+        self.keepalive_interval = keepalive_interval
+        self.bandwidth = bandwidth
+
+        self._settings_events = []  # The settings after each change, event id is the index + 1
+        self._push_condition = threading.Condition()
+        self._push_generation = 0  # Incremented to disconnect all push subscribers
+        self.push_subscriptions = []  # The Last-Event-ID header of each subscription
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self.routes = {
+            ('GET', '/api/camera/'): self._get_settings,
+            ('POST', '/api/camera/'): self._heartbeat,
+            ('HEAD', '/api/picture/'): self._picture_exists,
+            ('POST', '/api/picture/'): self._upload_picture,
+            ('GET', '/api/camera/events/'): self._stream_settings,
+            ('POST', '/api/event/'): self._upload_event,
+        }
+
+    @property
+    def url(self):
+        """
+        Returns the server url to use as 'server_url' in the configuration.
+
+        :return: The url of the running server.
+        """
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def start(self):
+        """
+        Starts the server on a free port.
+        """
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), StandinHandler)
+        self._server.standin = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        """
+        Stops the server.
+        """
+        self.disconnect_subscribers()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def count(self, method, path, body_size):
+        """
+        Counts a request.
+
+        :param method: The http method.
+        :param path: The requested path.
+        :param body_size: The size of the request body in bytes.
+        """
+        with self._lock:
+            self.requests[(method, path)] += 1
+            self.bytes_received += body_size
+
+    def push_settings(self, enabled):
+        """
+        Changes the settings and pushes them to all subscribers.
+
+        :param enabled: The new 'enabled' setting of the camera.
+        """
+        with self._push_condition:
+            self.enabled = enabled
+            self._settings_events.append({'enabled': enabled})
+            self._push_condition.notify_all()
+
+    def disconnect_subscribers(self):
+        """
+        Closes all push channel connections.
+        """
+        with self._push_condition:
+            self._push_generation += 1
+            self._push_condition.notify_all()
+
+    def _stream_settings(self, request, params):
+        request.send_response(HTTPStatus.OK)
+        request.send_header('Content-Type', 'text/event-stream')
+        request.send_header('Cache-Control', 'no-cache')
+        request.send_header('Connection', 'close')
+        request.end_headers()
+
+        with self._push_condition:
+            generation = self._push_generation
+            last_event_id = request.headers.get('Last-Event-ID')
+            self.push_subscriptions.append(last_event_id)
+            if last_event_id is None:
+                # New subscriber, send the current settings
+                sent = len(self._settings_events)
+                events = [(sent, {'enabled': self.enabled})]
+            else:
+                sent = int(last_event_id)
+                events = []
+
+        try:
+            while True:
+                with self._push_condition:
+                    events += list(enumerate(self._settings_events, 1))[sent:]
+                    if not events:
+                        self._push_condition.wait(self.keepalive_interval)
+                        events = list(enumerate(self._settings_events, 1))[sent:]
+                    if self._push_generation != generation:
+                        return None
+
+                for event_id, settings in events:
+                    request.wfile.write('id: {}\nevent: settings\ndata: {}\n\n'.format(
+                        event_id, json.dumps(settings)).encode())
+                    sent = max(sent, event_id)
+                if not events:
+                    request.wfile.write(b':\n\n')
+                request.wfile.flush()
+                events = []
+        except OSError:
+            return None
+
+    def _get_settings(self, request, params):
+        return HTTPStatus.OK, {'enabled': self.enabled}
+
+    def _heartbeat(self, request, params):
+        with self._lock:
+            self.heartbeats += 1
+        return HTTPStatus.OK, {}
+
+    def _picture_exists(self, request, params):
+        return (HTTPStatus.OK if params.get('checksum') in self.pictures else HTTPStatus.NOT_FOUND), None
+
+    def _upload_picture(self, request, params):
+        content = params.get('file')
+        if not content:
+            return HTTPStatus.BAD_REQUEST, {'message': 'No file', 'errors': 'file is required'}
+
+        with self._lock:
+            self.pictures[hashlib.sha256(content).hexdigest()] = content
+            self.upload_times.setdefault(hashlib.sha256(content).hexdigest(), time.monotonic())
+            if params.get('thumbnail_of'):
+                self.thumbnails[params['thumbnail_of'].decode()] = time.monotonic()
+            lost = self._random.random() < self.lost_response_rate
+        return None if lost else (HTTPStatus.OK, {})
+
+    def _upload_event(self, request, params):
+        try:
+            with tarfile.open(fileobj=io.BytesIO(request.body), mode='r:*') as archive:
+                manifest = json.loads(archive.extractfile('event.json').read().decode())
+                frames = [archive.extractfile(frame).read() for frame in manifest['frames']]
+        except (tarfile.TarError, KeyError, ValueError) as error:
+            return HTTPStatus.BAD_REQUEST, {'message': 'Invalid archive', 'errors': str(error)}
+
+        with self._lock:
+            self.events.append(manifest)
+            for content in frames:
+                checksum = hashlib.sha256(content).hexdigest()
+                self.pictures[checksum] = content
+                self.upload_times.setdefault(checksum, time.monotonic())
+        return HTTPStatus.OK, {}
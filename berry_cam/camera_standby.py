@@ -0,0 +1,115 @@
+"""
+Keeps the camera exposure and white balance converged while no motion is detected,
+so the first image after a PIR trigger is usable right away.
+"""
+import io
+import logging
+import time
+
+LOG = logging.getLogger(__name__)
+
+# No standby handling, exposure and white balance adapt only while capturing
+OFF = 'off'
+# Regularly capture small metering frames to let exposure and white balance follow the scene
+METER = 'meter'
+# Lock exposure and white balance to metered values, refreshed regularly
+LOCK = 'lock'
+
+MODES = (OFF, METER, LOCK)
+
+
+class CameraStandby:
+    """
+    Standby handling for an opened camera. idle() needs to be called regularly while no images are captured,
+    wake() when the capturing starts.
+    """
+
+    def __init__(self, camera, mode=OFF, interval=30, settle_time=2, metering_resolution=(64, 48),
+                 clock=time.monotonic):
+        """
+        Creates a new camera standby.
+
+        :param camera: The opened PiCamera.
+        :param mode: The standby mode, one of MODES.
+        :param interval: The interval in seconds to meter (METER) or refresh the locked values (LOCK).
+        :param settle_time: The time in seconds exposure and white balance need to converge after unlocking.
+        :param metering_resolution: The resolution of the metering frames.
+        :param clock: The monotonic clock to use.
+        """
+        if mode not in MODES:
+            raise ValueError("Invalid standby mode '{}'. Can be one of {}".format(mode, MODES))
+
+        self._camera = camera
+        self._mode = mode
+        self._interval = interval
+        self._settle_time = settle_time
+        self._metering_resolution = metering_resolution
+        self._clock = clock
+
+        self._next_metering = clock()
+        self._settled_at = None  # Time the unlocked camera has settled, None if not unlocked
+        self.meterings = 0
+
+    def _meter(self):
+        """
+        Captures a small frame, so the camera adapts exposure and white balance to the scene.
+        """
+        self._camera.capture(io.BytesIO(), format='jpeg', use_video_port=True, resize=self._metering_resolution)
+        self.meterings += 1
+
+    def _unlock(self):
+        """
+        Lets the camera control exposure and white balance automatically.
+        """
+        self._camera.shutter_speed = 0
+        self._camera.exposure_mode = 'auto'
+        self._camera.awb_mode = 'auto'
+
+    def _lock(self):
+        """
+        Fixes exposure and white balance to the current automatic values.
+        """
+        self._camera.shutter_speed = self._camera.exposure_speed
+        self._camera.exposure_mode = 'off'
+        gains = self._camera.awb_gains
+        self._camera.awb_mode = 'off'
+        self._camera.awb_gains = gains
+        LOG.debug("Camera locked to shutter speed %s, white balance gains %s", self._camera.shutter_speed, gains)
+
+    def wake(self):
+        """
+        Leaves the standby on motion. Locked values are released after the first image, so the camera adapts
+        during the motion. They are locked again after the motion.
+        """
+        if self._mode == LOCK:
+            self._unlock()
+            self._settled_at = None
+            self._next_metering = self._clock()
+
+    def idle(self):
+        """
+        Meters or refreshes the locked values if due. Returns fast if nothing needs to be done.
+        """
+        if self._mode == OFF:
+            return
+
+        now = self._clock()
+        if self._settled_at is not None:
+            # Camera unlocked for refresh, lock it again once it has settled
+            if now >= self._settled_at:
+                self._meter()
+                self._lock()
+                self._settled_at = None
+                self._next_metering = now + self._interval
+            return
+
+        if now < self._next_metering:
+            return
+
+        if self._mode == METER:
+            self._meter()
+            self._next_metering = now + self._interval
+        else:
+            self._unlock()
+            self._meter()
+            self._settled_at = now + self._settle_time
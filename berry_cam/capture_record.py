@@ -0,0 +1,105 @@
+"""
+The records passed through the upload pipeline, from capturing to uploading.
+"""
+import os
+
+from berry_cam.event_archive import is_manifest
+from berry_cam.images import capture_time, is_roi, is_thumbnail, original_path, parse_roi, thumbnail_path
+
+# A full resolution image or a cropped region of interest of it
+IMAGE = 'image'
+# The thumbnail of an image
+THUMBNAIL = 'thumbnail'
+# The manifest of a motion event, uploaded as event archive
+MANIFEST = 'manifest'
+
+KINDS = (IMAGE, THUMBNAIL, MANIFEST)
+
+
+class CaptureRecord:
+    """
+    A captured file queued for upload, with its metadata. Uses slots, as a backlog can hold many records.
+
+    The kind and crop of a file are also encoded in its name, see images, so a record can be restored
+    from the path, e.g. for images recovered from the image store.
+    """
+
+    __slots__ = ('path', 'kind', 'capture_time', 'size', 'event', 'thumbnail_of', 'roi_of', 'roi', 'protected',
+                 'retries')
+
+    def __init__(self, path, kind=IMAGE, capture_time=None, size=None, event=None, thumbnail_of=None,
+                 roi_of=None, roi=None, protected=False):
+        """
+        Creates a new capture record.
+
+        :param path: The path of the file.
+        :param kind: The kind of the file, one of KINDS.
+        :param capture_time: The capture time as unix timestamp, None if unknown.
+        :param size: The size of the file in bytes, None if unknown.
+        :param event: The number of the motion event the file belongs to, None if unknown.
+        :param thumbnail_of: The file name of the full resolution image of a thumbnail.
+        :param roi_of: The file name of the key frame of a cropped image.
+        :param roi: The crop box of a cropped image as (left, top, right, bottom).
+        :param protected: If set, the image is never dropped by the upload queue, e.g. because cropped
+                          images need it as key frame.
+        """
+        self.path = path
+        self.kind = kind
+        self.capture_time = capture_time
+        self.size = size
+        self.event = event
+        self.thumbnail_of = thumbnail_of
+        self.roi_of = roi_of
+        self.roi = roi
+        self.protected = protected
+        self.retries = 0  # Failed uploads of this file
+
+    @classmethod
+    def from_path(cls, path):
+        """
+        Creates a record from the path of a file.
+
+        :param path: The path of the file.
+        :return: The record.
+        """
+        record = cls(path, capture_time=capture_time(path))
+        if is_thumbnail(path):
+            record.kind = THUMBNAIL
+            record.thumbnail_of = os.path.basename(original_path(path))
+        elif is_manifest(path):
+            record.kind = MANIFEST
+        elif is_roi(path):
+            record.roi_of, record.roi = parse_roi(path)
+        return record
+
+    def thumbnail(self):
+        """
+        Creates the record of the thumbnail of this image.
+
+        :return: The record of the thumbnail.
+        """
+        return CaptureRecord(thumbnail_path(self.path), THUMBNAIL, self.capture_time, event=self.event,
+                             thumbnail_of=os.path.basename(self.path))
+
+    def __fspath__(self):
+        """
+        Lets the record be used like its path, e.g. by open().
+
+        :return: The path of the file.
+        """
+        return self.path
+
+    def __repr__(self):
+        return 'CaptureRecord({!r}, {!r})'.format(self.path, self.kind)
+
+
+def as_record(item):
+    """
+    Returns the record of a queued item. Paths are still accepted as items, e.g. from older producers.
+
+    :param item: A CaptureRecord or the path of a file.
+    :return: The record.
+    """
+    if isinstance(item, CaptureRecord):
+        return item
+    return CaptureRecord.from_path(item)
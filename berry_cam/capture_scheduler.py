@@ -0,0 +1,131 @@
+"""
+Schedules the image captures during a motion on a monotonic clock, so the frame rate does not drift
+with the capture time.
+"""
+import time
+
+
+class CaptureScheduler:
+    """
+    Schedules the captures of a motion. start() needs to be called when the motion starts, captured()
+    after each capture and finish() when the motion ends.
+
+    Captures are scheduled relative to the start of the motion instead of the end of the previous
+    capture. If a capture takes longer than the interval, the missed frames are skipped instead of
+    capturing them in a burst.
+
+    Optionally, the interval grows from the target interval at the start of the motion to a maximum
+    interval while the PIR stays high, so the start of a motion is captured densely, but long motions
+    do not fill the upload queue.
+
+    The interval can be multiplied by a throttle factor, e.g. while the upload queue is full.
+    """
+
+    def __init__(self, interval=0.5, max_interval=None, ramp_time=10, clock=time.monotonic):
+        """
+        Creates a new capture scheduler.
+
+        :param interval: The target time between two captures in seconds.
+        :param max_interval: The time between two captures after the PIR was high for ramp_time seconds.
+                             The interval is fixed if not set.
+        :param ramp_time: The time in seconds the interval needs to grow to max_interval.
+        :param clock: The monotonic clock to use.
+        """
+        if interval <= 0:
+            raise ValueError("Invalid capture interval {}, needs to be positive.".format(interval))
+        if max_interval is not None and max_interval < interval:
+            raise ValueError("Invalid maximum capture interval {}, needs to be at least the interval {}.".format(
+                max_interval, interval))
+
+        self._interval = interval
+        self._max_interval = max_interval
+        self._ramp_time = ramp_time
+        self._clock = clock
+
+        self._motion_start = None
+        self._next_capture = None
+        self._first_capture = None
+        self._last_capture = None
+        self._last_slot = None  # The scheduled time of the last capture
+        self._skipping = 0
+        self.throttle = 1  # Factor for the interval, increase to reduce the capture rate
+        self.frames = 0  # Captured frames of the current motion
+        self.skipped = 0  # Frames of the current motion skipped since a capture took too long
+
+    @property
+    def interval(self):
+        """
+        Returns the current time between two captures.
+
+        :return: The interval in seconds.
+        """
+        if self._max_interval is None or self._motion_start is None:
+            return self._interval * self.throttle
+
+        progress = min(1, (self._clock() - self._motion_start) / self._ramp_time) if self._ramp_time > 0 else 1
+        return (self._interval + (self._max_interval - self._interval) * progress) * self.throttle
+
+    def start(self):
+        """
+        Starts the schedule of a new motion. The first capture is due immediately.
+        """
+        self._motion_start = self._clock()
+        self._next_capture = self._motion_start
+        self.frames = 0
+        self.skipped = 0
+        self._skipping = 0
+
+    def due(self):
+        """
+        Checks if the next capture is due.
+
+        :return: True if an image should be captured now.
+        """
+        return self._next_capture is not None and self._clock() >= self._next_capture
+
+    def wait_time(self):
+        """
+        Returns the time until the next capture is due.
+
+        :return: The time in seconds, 0 if the capture is due.
+        """
+        if self._next_capture is None:
+            return self._interval
+        return max(0, self._next_capture - self._clock())
+
+    def captured(self):
+        """
+        Schedules the next capture after an image was captured.
+        """
+        now = self._clock()
+        if self.frames == 0:
+            self._first_capture = now
+        else:
+            self.skipped += self._skipping
+        self.frames += 1
+        self._last_capture = now
+        self._last_slot = self._next_capture
+
+        interval = self.interval
+        self._next_capture += interval
+        # Skipped frames are only counted once the next frame is captured, they are not missed if the motion ends
+        self._skipping = 0
+        while self._next_capture <= now:
+            self._next_capture += interval
+            self._skipping += 1
+
+    def finish(self):
+        """
+        Finishes the schedule of the current motion.
+
+        :return: The achieved and the target frame rate of the motion in frames per second,
+                 None if less than two frames were captured.
+        """
+        rates = None
+        if self.frames > 1 and self._last_capture > self._first_capture and self._last_slot > self._motion_start:
+            rates = ((self.frames - 1) / (self._last_capture - self._first_capture),
+                     (self.frames - 1 + self.skipped) / (self._last_slot - self._motion_start))
+
+        self._motion_start = None
+        self._next_capture = None
+        return rates
@@ -0,0 +1,153 @@
+"""
+A circuit breaker shared by all threads talking to the image server, so an unreachable server is
+detected once instead of by each thread on its own. Also tracks when the server was last reached.
+"""
+import logging
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+# Requests are sent
+CLOSED = 'closed'
+# The server is unreachable, no requests are sent until the reset timeout passed
+OPEN = 'open'
+# A single probe request is sent, all other requests wait for its result
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Tracks the health of the image server.
+
+    Before each request, acquire() needs to be called and afterwards record_success() or record_failure().
+    After failure_threshold failed requests in a row, the circuit opens and acquire() blocks. Once the reset
+    timeout passed, a single caller gets to send a probe request. If it succeeds, all waiting callers
+    continue. Otherwise, the circuit opens again with a doubled reset timeout.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=5, max_reset_timeout=300, probe_timeout=60):
+        """
+        Creates a new circuit breaker.
+
+        :param failure_threshold: The amount of failed requests in a row to open the circuit.
+                                  The circuit never opens if None.
+        :param reset_timeout: The time in seconds to wait before the first probe.
+        :param max_reset_timeout: The maximum time in seconds between two probes.
+        :param probe_timeout: Another probe is allowed if the result of a probe was not recorded within
+                              this time in seconds, e.g. because the probing thread was stopped.
+        """
+        self._failure_threshold = failure_threshold
+        self._initial_reset_timeout = reset_timeout
+        self._reset_timeout = reset_timeout
+        self._max_reset_timeout = max_reset_timeout
+        self._probe_timeout = probe_timeout
+
+        self._condition = threading.Condition()
+        self._state = CLOSED
+        self._failures = 0
+        self._open_until = 0
+        self._probe_started = 0
+        self.trips = 0  # How often the circuit opened
+        self.last_success = None  # Monotonic time of the last request the server accepted
+
+    @property
+    def state(self):
+        """
+        Returns the current state.
+
+        :return: One of CLOSED, OPEN or HALF_OPEN.
+        """
+        return self._state
+
+    def acquire(self, timeout=None):
+        """
+        Waits until a request may be sent.
+
+        :param timeout: The maximum time to wait in seconds, None to wait forever.
+        :return: True if the request may be sent, False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self._state == CLOSED:
+                    return True
+
+                if (self._state == OPEN and now >= self._open_until) or \
+                        (self._state == HALF_OPEN and now >= self._probe_started + self._probe_timeout):
+                    LOG.info("Probing if the image server is reachable again...")
+                    self._state = HALF_OPEN
+                    self._probe_started = now
+                    return True
+
+                wait_time = None if deadline is None else deadline - now
+                if wait_time is not None and wait_time <= 0:
+                    return False
+                next_change = self._open_until if self._state == OPEN else self._probe_started + self._probe_timeout
+                wait_time = next_change - now if wait_time is None else min(wait_time, next_change - now)
+                self._condition.wait(wait_time)
+
+    def acquire_while(self, running, poll_interval=0.5):
+        """
+        Waits until a request may be sent, as long as the caller is running.
+
+        :param running: A callable returning False if the caller was stopped.
+        :param poll_interval: The interval in seconds to check if the caller is still running.
+        :return: True if the request may be sent, False if the caller was stopped.
+        """
+        while running():
+            if self.acquire(poll_interval):
+                return True
+        return False
+
+    def record_success(self, accepted=True):
+        """
+        Records a request that reached the server. Closes the circuit and resumes all waiting callers.
+
+        :param accepted: If set, the server accepted the request. Only accepted requests update last_success,
+                         e.g. rejected requests do not prove to the server that the camera is alive.
+        """
+        if accepted:
+            self.last_success = time.monotonic()
+        if self._state == CLOSED and not self._failures:
+            return  # Nothing to change, avoid the lock
+
+        with self._condition:
+            if self._state != CLOSED:
+                LOG.info("Image server reachable again, resuming.")
+            self._state = CLOSED
+            self._failures = 0
+            self._reset_timeout = self._initial_reset_timeout
+            self._condition.notify_all()
+
+    def record_failure(self):
+        """
+        Records a request that could not reach the server.
+
+        :return: True if the circuit is open, so the caller should wait in acquire() instead of retrying.
+        """
+        if self._failure_threshold is None:
+            return False
+
+        with self._condition:
+            if self._state == HALF_OPEN:
+                self._reset_timeout = min(self._reset_timeout * 2, self._max_reset_timeout)
+                self._open(time.monotonic())
+            elif self._state == CLOSED:
+                self._failures += 1
+                if self._failures >= self._failure_threshold:
+                    self.trips += 1
+                    self._open(time.monotonic())
+            return self._state == OPEN
+
+    def _open(self, now):
+        """
+        Opens the circuit. Needs to be called with the lock held.
+
+        :param now: The current monotonic time.
+        """
+        LOG.warning("Image server unreachable, pausing requests for %s s.", self._reset_timeout)
+        self._state = OPEN
+        self._open_until = now + self._reset_timeout
+        self._condition.notify_all()
@@ -0,0 +1,147 @@
+"""
+Loading and validation of the configuration file, and updating a running configuration in place.
+
+The settings in APPLIED_AT_RUNTIME are applied to the running threads via their reconfigure() methods.
+All other settings need a restart, e.g. those of the upload queue or the camera. The configuration dict is
+updated in place, so threads restarted by the supervisor read the new values anyway.
+"""
+import numbers
+
+from berry_cam.camera_standby import MODES
+from berry_cam.event_archive import COMPRESSIONS
+from berry_cam.upload_scheduler import OVERFLOW_POLICIES, POLICIES, STALE_POLICIES
+
+# The pin numbering schemes of RPi.GPIO
+PIN_NUMBER_TYPES = ('BCM', 'BOARD')
+
+# Optional sections, they are created if missing so threads keep a reference to the updated section
+SECTIONS = ('supervisor', 'tracing', 'upload', 'heartbeat', 'thumbnails', 'thermal', 'reload')
+
+# Settings applied to the running threads, all other settings are only applied after a restart
+APPLIED_AT_RUNTIME = ('camera.name', 'camera.backpressure_factor', 'image_server.server_url', 'image_server.api_key',
+                      'image_server.retry_count', 'image_server.timeout', 'image_server.push', 'pir.reset_time',
+                      'heartbeat.interval', 'heartbeat.skip_while_active', 'upload.dedup',
+                      'upload.archive_compression')
+
+
+class ConfigError(Exception):
+    """
+    Raised if the configuration is invalid.
+    """
+
+
+def load_config(path):
+    """
+    Loads and validates the configuration file.
+
+    :param path: The path of the yaml configuration.
+    :return: The configuration as dict.
+    :raises ConfigError: If the configuration can not be read or is invalid.
+    """
+    import yaml
+
+    try:
+        with open(path) as config_file:
+            config = yaml.safe_load(config_file)
+    except (OSError, yaml.YAMLError) as error:
+        raise ConfigError("Can not read {}: {}".format(path, error))
+
+    validate_config(config)
+    for section in SECTIONS:
+        if config.get(section) is None:
+            config[section] = {}
+    return config
+
+
+def _get(config, key):
+    """
+    Returns a setting by its dotted key.
+
+    :param config: The configuration dict.
+    :param key: The dotted key, e.g. 'image_server.api_key'.
+    :return: The value or None if not set.
+    """
+    value = config
+    for part in key.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def validate_config(config):
+    """
+    Validates the settings that are needed to run the camera.
+
+    :param config: The configuration dict.
+    :raises ConfigError: If the configuration is invalid.
+    """
+    if not isinstance(config, dict):
+        raise ConfigError("The configuration needs to be a mapping.")
+
+    for key in ('camera.name', 'camera.image_location', 'image_server.server_url', 'image_server.api_key'):
+        if not isinstance(_get(config, key), str) or not _get(config, key):
+            raise ConfigError("'{}' needs to be set.".format(key))
+
+    def check_number(key, minimum, required=False, integer=False):
+        value = _get(config, key)
+        if value is None and not required:
+            return
+        expected = numbers.Integral if integer else numbers.Real
+        if isinstance(value, bool) or not isinstance(value, expected) or value < minimum:
+            raise ConfigError("'{}' needs to be {} of at least {}, found {!r}.".format(
+                key, 'an integer' if integer else 'a number', minimum, value))
+
+    check_number('image_server.retry_count', 1, required=True, integer=True)
+    check_number('pir.pin', 0, required=True, integer=True)
+    check_number('pir.reset_time', 0, required=True)
+    check_number('image_server.timeout', 0)
+    check_number('camera.frame_interval', 0.001)
+    check_number('heartbeat.interval', 1)
+    check_number('upload.max_queued', 0, integer=True)
+    check_number('upload.max_age', 0)
+
+    if _get(config, 'pir.number_type') not in PIN_NUMBER_TYPES:
+        raise ConfigError("Invalid 'pir.number_type' {!r}. Can be one of {}".format(
+            _get(config, 'pir.number_type'), PIN_NUMBER_TYPES))
+
+    for key, choices in (('camera.standby', MODES), ('upload.scheduling', POLICIES),
+                         ('upload.overflow', OVERFLOW_POLICIES), ('upload.stale_policy', STALE_POLICIES),
+                         ('upload.archive_compression', COMPRESSIONS)):
+        value = _get(config, key)
+        if value is not None and value not in choices:
+            raise ConfigError("Invalid '{}' {!r}. Can be one of {}".format(key, value, choices))
+
+
+def update_config(config, new_config, prefix=''):
+    """
+    Updates a configuration in place. Nested sections are updated in place as well, so references to
+    them stay valid.
+
+    :param config: The configuration dict to update.
+    :param new_config: The new configuration dict.
+    :param prefix: The dotted key of the updated section.
+    :return: The dotted keys of the changed settings.
+    """
+    changed = []
+    for key in list(config):
+        if key not in new_config:
+            changed.append(prefix + key)
+            del config[key]
+    for key, value in new_config.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            changed += update_config(config[key], value, prefix + key + '.')
+        elif key not in config or config[key] != value:
+            changed.append(prefix + key)
+            config[key] = value
+    return changed
+
+
+def needs_restart(changed):
+    """
+    Returns the changed settings that are only applied after a restart.
+
+    :param changed: The dotted keys of the changed settings.
+    :return: The keys that need a restart.
+    """
+    return [key for key in changed if key not in APPLIED_AT_RUNTIME]
@@ -0,0 +1,136 @@
+"""
+Packing of the frames of a motion event into a single archive, to save the per request and multipart
+overhead on expensive links.
+
+When a motion ends, the captured frames are described by an event manifest, a json file named by the
+capture time of the first frame, e.g. 1591000000.0.event.json::
+
+    {"start": 1591000000.0, "end": 1591000004.5, "frames": ["1591000000.0.jpg", ...],
+     "achieved_fps": 1.98, "target_fps": 2.0}
+
+The manifest is queued for upload instead of the frames. The uploader streams the archive directly into
+the request body, no temporary file is written.
+
+Server format: the archive is sent as POST request with chunked transfer encoding to the archive url
+(/api/event/ on the image server) with the query parameters 'api_key' and 'name' (the camera name).
+The body is a tar archive (content type application/x-tar), or a gzip compressed tar archive
+(application/gzip). The first member is 'event.json', the manifest, followed by the frames in capture
+order, named as listed in the manifest. The server responds with 200 if the event was stored.
+"""
+import json
+import os
+import tarfile
+
+# Manifests are stored next to their frames, e.g. 1591000000.0.event.json
+MANIFEST_SUFFIX = '.event.json'
+
+# Tar archive without compression, jpeg frames hardly compress
+NONE = 'none'
+# Gzip compressed tar archive, only the manifest and the tar headers compress well
+GZIP = 'gz'
+
+COMPRESSIONS = (NONE, GZIP)
+
+CONTENT_TYPES = {NONE: 'application/x-tar', GZIP: 'application/gzip'}
+
+
+def is_manifest(path):
+    """
+    Checks if a queued item is an event manifest.
+
+    :param path: The path of the queued item.
+    :return: True if the item is an event manifest.
+    """
+    return path.endswith(MANIFEST_SUFFIX)
+
+
+def write_manifest(frames, end, achieved_fps=None, target_fps=None):
+    """
+    Writes the manifest of a finished motion event next to its frames.
+
+    :param frames: The paths of the frames in capture order, named by capture time.
+    :param end: The end of the motion as unix timestamp.
+    :param achieved_fps: The achieved frame rate of the event, if known.
+    :param target_fps: The target frame rate of the event, if known.
+    :return: The path of the manifest.
+    """
+    name = os.path.splitext(os.path.basename(frames[0]))[0]
+    path = os.path.join(os.path.dirname(frames[0]), name + MANIFEST_SUFFIX)
+    manifest = {
+        'start': float(name),
+        'end': end,
+        'frames': [os.path.basename(frame) for frame in frames],
+        'achieved_fps': achieved_fps,
+        'target_fps': target_fps
+    }
+    # Written atomically, so a partially written manifest is never uploaded
+    with open(path + '.part', 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(path + '.part', path)
+    return path
+
+
+def read_manifest(path):
+    """
+    Reads an event manifest.
+
+    :param path: The path of the manifest.
+    :return: The manifest as dict.
+    """
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+class _ChunkBuffer:
+    """
+    A write only file collecting the written data until it is taken.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        """
+        Returns and clears the written data.
+
+        :return: The written data.
+        """
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_archive(manifest_path, compression=NONE):
+    """
+    Packs the manifest and the frames of an event into an archive as stream. Only a single frame is held
+    in memory at a time.
+
+    :param manifest_path: The path of the event manifest.
+    :param compression: The compression of the archive, one of COMPRESSIONS.
+    :return: A generator of the archive data, e.g. to be used as request body.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError("Invalid archive compression '{}'. Can be one of {}".format(compression, COMPRESSIONS))
+
+    directory = os.path.dirname(manifest_path)
+    frames = read_manifest(manifest_path)['frames']
+
+    output = _ChunkBuffer()
+    with tarfile.open(fileobj=output, mode='w|' if compression == NONE else 'w|gz') as archive:
+        archive.add(manifest_path, 'event.json')
+        for frame in frames:
+            archive.add(os.path.join(directory, frame), frame)
+            # Empty chunks would end a chunked request body
+            data = output.take()
+            if data:
+                yield data
+    data = output.take()
+    if data:
+        yield data
@@ -0,0 +1,203 @@
+"""
+The on-disk storage of the captured images.
+
+Images are sharded into one directory per hour (UTC), e.g. 2020-06-01/08/1591000000.0.jpg, so single
+directories stay small even after weeks of outages and old images can be cleaned up by removing whole
+directories. Files are written to a temporary '.part' file first and renamed once complete, so partially
+written images are never uploaded.
+
+The images that still need to be uploaded are tracked in an append-only index file in the root directory,
+one line per change: '+<path>' if an image was queued, '-<path>' if it was uploaded, with paths relative
+to the root directory. On startup, the pending images are read from the index instead of walking all
+directories. The index is compacted on startup and regularly while running, so it only grows with the
+pending images and not with the uptime.
+"""
+import logging
+import os
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+# Suffix of files that are still being written
+PART_SUFFIX = '.part'
+
+ADDED = '+'
+UPLOADED = '-'
+
+
+class ImageStore:
+    """
+    Stores the captured images and tracks the ones pending for upload.
+    Can be shared between threads.
+    """
+
+    def __init__(self, root, sharded=True, index_name='pending.idx', compact_after=1000):
+        """
+        Creates a new image store.
+
+        :param root: The directory to store the images in.
+        :param sharded: If set, the images are stored in one directory per hour. Otherwise,
+                        all images are stored directly in the root directory.
+        :param index_name: The name of the index file of the pending images in the root directory.
+                           Pending images are not tracked if None.
+        :param compact_after: The index is compacted after this many uploaded images, or more if more
+                              images are pending. Only done after recover() was called.
+        """
+        self._root = root
+        self._sharded = sharded
+        self._index_path = os.path.join(root, index_name) if index_name else None
+
+        self._lock = threading.Lock()
+        self._index_file = None
+        self._compact_after = compact_after
+        self._pending = None  # Relative paths of the pending images, known once recovered
+        self._uploaded = 0  # Uploaded images recorded in the index since it was compacted
+        self._directories = set()  # Directories known to exist, to avoid a lookup per image
+
+    @property
+    def root(self):
+        """
+        Returns the root directory.
+
+        :return: The directory the images are stored in.
+        """
+        return self._root
+
+    def path_for(self, timestamp, shard_time=None, suffix='.jpg'):
+        """
+        Returns the path for a new image and creates its directory if needed.
+
+        :param timestamp: The capture time as unix timestamp, used as name of the image.
+        :param shard_time: The unix timestamp to select the directory by. Uses the capture time if not set,
+                           e.g. set it to the start of a motion to keep all frames of a motion together.
+        :param suffix: The file suffix of the image.
+        :return: The path of the image.
+        """
+        directory = self._root
+        if self._sharded:
+            shard = time.gmtime(timestamp if shard_time is None else shard_time)
+            directory = os.path.join(self._root, time.strftime('%Y-%m-%d', shard), time.strftime('%H', shard))
+        if directory not in self._directories:
+            os.makedirs(directory, exist_ok=True)
+            self._directories.add(directory)
+        return os.path.join(directory, '{}{}'.format(timestamp, suffix))
+
+    def write(self, path, data):
+        """
+        Writes a file atomically. The file is written to a temporary file first and renamed once complete.
+
+        :param path: The path of the file.
+        :param data: The content of the file as bytes-like object.
+        """
+        part_path = path + PART_SUFFIX
+        with open(part_path, 'wb') as part_file:
+            part_file.write(data)
+        os.replace(part_path, path)
+
+    def add_pending(self, path):
+        """
+        Records that an image was queued for upload.
+
+        :param path: The path of the image.
+        """
+        self._append(ADDED, path)
+
+    def mark_uploaded(self, path):
+        """
+        Records that an image was uploaded, so it is not queued again on the next start.
+
+        :param path: The path of the image.
+        """
+        self._append(UPLOADED, path)
+
+    def _append(self, change, path):
+        """
+        Appends a change to the index.
+
+        :param change: ADDED or UPLOADED.
+        :param path: The path of the changed image.
+        """
+        if self._index_path is None:
+            return
+
+        relative_path = os.path.relpath(path, self._root)
+        line = '{}{}\n'.format(change, relative_path)
+        with self._lock:
+            if self._index_file is None:
+                self._index_file = open(self._index_path, 'a')
+            self._index_file.write(line)
+            # Keep the index up to date if the process is killed
+            self._index_file.flush()
+
+            if self._pending is None:
+                return
+            if change == ADDED:
+                self._pending[relative_path] = True
+            else:
+                self._pending.pop(relative_path, None)
+                self._uploaded += 1
+                if self._uploaded >= max(self._compact_after, len(self._pending)):
+                    self._compact()
+
+    def _compact(self):
+        """
+        Rewrites the index with only the pending images. Needs to be called with the lock held.
+        """
+        # Images may have been dropped from the full upload queue in the meantime
+        self._pending = {path: True for path in self._pending if os.path.exists(os.path.join(self._root, path))}
+        self._close_index()
+        part_path = self._index_path + PART_SUFFIX
+        with open(part_path, 'w') as index_file:
+            index_file.writelines('{}{}\n'.format(ADDED, path) for path in self._pending)
+        os.replace(part_path, self._index_path)
+        self._uploaded = 0
+
+    def recover(self):
+        """
+        Reads the images that were queued, but not uploaded before the last stop, and compacts the index.
+        Needs to be called before any image is added.
+
+        :return: The paths of the pending images that still exist, in the order they were queued.
+        """
+        if self._index_path is None:
+            return []
+        if not os.path.exists(self._index_path):
+            self._pending = {}
+            return []
+
+        # Dicts keep the insertion order, so the images are recovered in capture order
+        pending = {}
+        with open(self._index_path) as index_file:
+            for line in index_file:
+                # A line is incomplete if the process was killed while appending it
+                if not line.endswith('\n') or len(line) < 3:
+                    continue
+                change, path = line[0], line[1:-1]
+                if change == ADDED:
+                    pending[path] = True
+                elif change == UPLOADED:
+                    pending.pop(path, None)
+
+        with self._lock:
+            self._pending = pending
+            self._compact()
+            pending = list(self._pending)
+
+        LOG.info("Image store: %s images pending for upload.", len(pending))
+        return [os.path.join(self._root, path) for path in pending]
+
+    def close(self):
+        """
+        Closes the index file. It is opened again on the next change.
+        """
+        with self._lock:
+            self._close_index()
+
+    def _close_index(self):
+        """
+        Closes the index file. Needs to be called with the lock held.
+        """
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
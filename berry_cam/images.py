@@ -0,0 +1,134 @@
+"""
+Helpers for the images stored by berry cam.
+"""
+import hashlib
+import os
+
+from berry_cam.event_archive import MANIFEST_SUFFIX
+
+# Thumbnails are stored next to their image, e.g. 1591000000.0.thumb.jpg for 1591000000.0.jpg
+THUMBNAIL_SUFFIX = '.thumb.jpg'
+# Cropped follow-up frames name their key frame and crop box (left, top, right, bottom),
+# e.g. 1591000000.5.roi_1591000000.0_128_96_512_384.jpg
+ROI_MARKER = '.roi_'
+
+
+def capture_time(image_path):
+    """
+    Returns the capture time of an image. Images are named by their capture time as unix timestamp.
+
+    :param image_path: The path of the image.
+    :return: The capture time as unix timestamp or None if the image name is not a timestamp.
+    """
+    if is_thumbnail(image_path):
+        image_path = original_path(image_path)
+    elif image_path.endswith(MANIFEST_SUFFIX):
+        # Event manifests are named by the capture time of the first frame
+        image_path = image_path[:-len(MANIFEST_SUFFIX)] + '.jpg'
+    if is_roi(image_path):
+        image_path = image_path[:image_path.rindex(ROI_MARKER)] + '.jpg'
+    try:
+        return float(os.path.splitext(os.path.basename(image_path))[0])
+    except ValueError:
+        return None
+
+
+def content_hash(image_path):
+    """
+    Calculates the checksum of an image.
+
+    :param image_path: The path of the image.
+    :return: The sha256 checksum as hex string.
+    """
+    checksum = hashlib.sha256()
+    with open(image_path, 'rb') as image_file:
+        for block in iter(lambda: image_file.read(65536), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def thumbnail_path(image_path):
+    """
+    Returns the path of the thumbnail of an image.
+
+    :param image_path: The path of the image.
+    :return: The path of the thumbnail.
+    """
+    return os.path.splitext(image_path)[0] + THUMBNAIL_SUFFIX
+
+
+def is_thumbnail(image_path):
+    """
+    Checks if an image is a thumbnail.
+
+    :param image_path: The path of the image.
+    :return: True if the image is a thumbnail.
+    """
+    return image_path.endswith(THUMBNAIL_SUFFIX)
+
+
+def original_path(thumbnail):
+    """
+    Returns the path of the image a thumbnail was created from.
+
+    :param thumbnail: The path of the thumbnail.
+    :return: The path of the full resolution image.
+    """
+    return thumbnail[:-len(THUMBNAIL_SUFFIX)] + '.jpg'
+
+
+def create_thumbnail(image_path, size=(160, 120), quality=75):
+    """
+    Creates the thumbnail of an image. Needs Pillow, which is installed with the 'thumbnails' extra.
+    Called in worker processes, so it needs to stay a module level function.
+
+    :param image_path: The path of the image.
+    :param size: The maximum width and height of the thumbnail. The aspect ratio is kept.
+    :param quality: The jpeg quality of the thumbnail.
+    :return: The path of the created thumbnail.
+    """
+    from PIL import Image
+
+    path = thumbnail_path(image_path)
+    with Image.open(image_path) as image:
+        # Let the jpeg decoder downscale already, that is a lot faster than decoding the full image
+        image.draft('RGB', size)
+        image.thumbnail(size)
+        image.save(path, 'JPEG', quality=quality)
+    return path
+
+
+def roi_path(image_path, key_frame, box):
+    """
+    Returns the path of the cropped region of interest of an image.
+
+    :param image_path: The path of the full image.
+    :param key_frame: The path of the full key frame the crop is relative to.
+    :param box: The crop box as (left, top, right, bottom) in pixels of the full image.
+    :return: The path of the cropped image.
+    """
+    key_time = os.path.splitext(os.path.basename(key_frame))[0]
+    return '{}{}{}_{}.jpg'.format(os.path.splitext(image_path)[0], ROI_MARKER, key_time,
+                                  '_'.join(str(coordinate) for coordinate in box))
+
+
+def is_roi(image_path):
+    """
+    Checks if an image is a cropped region of interest.
+
+    :param image_path: The path of the image.
+    :return: True if the image is cropped.
+    """
+    return ROI_MARKER in os.path.basename(image_path)
+
+
+def parse_roi(image_path):
+    """
+    Returns the key frame and crop box of a cropped region of interest.
+
+    :param image_path: The path of the cropped image.
+    :return: The file name of the key frame and the crop box as (left, top, right, bottom).
+    """
+    name = os.path.splitext(os.path.basename(image_path))[0]
+    key_time, *box = name[name.rindex(ROI_MARKER) + len(ROI_MARKER):].split('_')
+    return key_time + '.jpg', tuple(int(coordinate) for coordinate in box)
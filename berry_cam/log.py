@@ -0,0 +1,191 @@
+"""
+Non-blocking logging for berry cam.
+
+All threads only put their log records into a bounded queue. The records are written to the real
+handlers (e.g. stderr) by a separate listener thread, so a slow console or journal can not block
+capturing or uploading anymore.
+"""
+import logging
+import logging.handlers
+import time
+from queue import Queue, Full
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    A queue handler that never blocks. If the queue is full, the record is dropped and counted.
+    """
+
+    def __init__(self, queue):
+        """
+        Creates a new dropping queue handler.
+
+        :param queue: The bounded queue to put the log records into.
+        """
+        super().__init__(queue)
+        self.dropped = 0
+        self._unreported = 0
+
+    def enqueue(self, record):
+        """
+        Puts the record into the queue without blocking.
+        If records were dropped before, a warning about the dropped records is enqueued first,
+        if the record fits into the queue as well.
+
+        :param logging.LogRecord record: The record to enqueue.
+        """
+        try:
+            if self._unreported and self.queue.qsize() < self.queue.maxsize - 1:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__,
+                    'levelno': logging.WARNING,
+                    'levelname': logging.getLevelName(logging.WARNING),
+                    'msg': '{} log messages dropped'.format(self._unreported)
+                }))
+                self._unreported = 0
+
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+            self._unreported += 1
+
+
+class RepeatSuppressionFilter(logging.Filter):
+    """
+    Suppresses identical log messages that are repeated within a given interval.
+    Used to rate limit the error lines written on every retry while the server is unreachable.
+    """
+
+    def __init__(self, interval, level=logging.WARNING):
+        """
+        Creates a new repeat suppression filter.
+
+        :param interval: The time in seconds in which identical messages are suppressed.
+        :param level: Only messages with at least this level are suppressed.
+        """
+        super().__init__()
+        self._interval = interval
+        self._level = level
+        self._last_seen = {}  # Message key -> (time of last emitted message, suppressed count)
+        self.suppressed = 0
+
+    def filter(self, record):
+        """
+        Checks if the given record should be logged.
+
+        :param logging.LogRecord record: The record to check.
+        :return: False if the record is a repetition within the interval, True otherwise.
+        """
+        if record.levelno < self._level:
+            return True
+
+        now = time.monotonic()
+        key = (record.name, record.levelno, record.getMessage())
+        last_emitted, count = self._last_seen.get(key, (None, 0))
+        if last_emitted is not None and now - last_emitted < self._interval:
+            self._last_seen[key] = (last_emitted, count + 1)
+            self.suppressed += 1
+            return False
+
+        if count:
+            record.msg = '{} (repeated {} times)'.format(record.getMessage(), count)
+            record.args = None
+
+        if len(self._last_seen) > 256:
+            self._last_seen = {entry_key: entry for entry_key, entry in self._last_seen.items()
+                               if now - entry[0] < self._interval}
+        self._last_seen[key] = (now, 0)
+        return True
+
+
+class _BlockingSentinelListener(logging.handlers.QueueListener):
+    """
+    A queue listener that can be stopped even if the bounded queue is full.
+    """
+
+    def enqueue_sentinel(self):
+        """
+        Blocks until the stop sentinel could be put into the queue.
+        The listener thread is still draining the queue, so this will not block forever.
+        """
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    """
+    A queue based logging setup. Replaces logging.basicConfig for the berry cam daemon.
+    """
+
+    def __init__(self, handlers, queue_size=1000, repeat_interval=0):
+        """
+        Creates a new logging pipeline.
+
+        :param handlers: The handlers that will write the log records, e.g. a stream handler.
+        :param queue_size: The maximum amount of records buffered. Further records are dropped.
+        :param repeat_interval: If set, identical warnings and errors are only logged once in this
+                                amount of seconds.
+        """
+        self._queue = Queue(queue_size)
+        self._queue_handler = DroppingQueueHandler(self._queue)
+        self._repeat_filter = None
+        if repeat_interval:
+            self._repeat_filter = RepeatSuppressionFilter(repeat_interval)
+            self._queue_handler.addFilter(self._repeat_filter)
+
+        self._listener = _BlockingSentinelListener(self._queue, *handlers, respect_handler_level=True)
+
+    @property
+    def dropped(self):
+        """
+        Returns the amount of dropped log records.
+
+        :return: The amount of records dropped since the queue was full.
+        """
+        return self._queue_handler.dropped
+
+    @property
+    def suppressed(self):
+        """
+        Returns the amount of suppressed repeated log records.
+
+        :return: The amount of records suppressed by the repeat filter.
+        """
+        if self._repeat_filter:
+            return self._repeat_filter.suppressed
+        return 0
+
+    def start(self, level=logging.INFO):
+        """
+        Attaches the pipeline to the root logger and starts writing the records.
+
+        :param level: The log level to set on the root logger.
+        """
+        root_logger = logging.getLogger()
+        root_logger.setLevel(level)
+        root_logger.addHandler(self._queue_handler)
+        self._listener.start()
+
+    def stop(self):
+        """
+        Detaches the pipeline from the root logger and writes all pending records.
+        """
+        logging.getLogger().removeHandler(self._queue_handler)
+        self._listener.stop()
+
+
+def setup_logging(level=logging.INFO, fmt='%(asctime)s %(message)s', queue_size=1000, repeat_interval=0):
+    """
+    Sets up non-blocking logging to stderr.
+
+    :param level: The log level to use.
+    :param fmt: The format of the log lines.
+    :param queue_size: The maximum amount of buffered log records.
+    :param repeat_interval: If set, identical warnings and errors are only logged once in this amount of seconds.
+    :return: The started LogPipeline. Needs to be stopped on shutdown to flush the pending records.
+    """
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(fmt))
+
+    pipeline = LogPipeline([stream_handler], queue_size, repeat_interval)
+    pipeline.start(level)
+    return pipeline
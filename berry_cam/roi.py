@@ -0,0 +1,129 @@
+"""
+Cropping of the frames of a motion to the region of interest, to save bandwidth on static scenes.
+
+The first frame of a motion is a key frame and stored in full. For the following frames, the region that
+differs from the key frame is detected on low resolution grayscale versions of both frames, and only this
+region is stored and uploaded. A new key frame is stored if the region gets too large or after a maximum
+amount of cropped frames.
+
+Server format: cropped frames are uploaded like full frames, with the additional form fields 'roi_of',
+the file name of the key frame, and 'roi', the crop box in pixels of the key frame as
+'left,top,right,bottom'. The full frame is restored by pasting the crop onto the key frame at the box.
+
+Needs Pillow, which is installed with the 'thumbnails' extra.
+"""
+import io
+
+from berry_cam.images import roi_path
+
+
+class RoiCropper:
+    """
+    Crops the frames of a motion to their region of interest. start() needs to be called when the motion starts,
+    then crop() for each captured frame in capture order.
+    """
+
+    def __init__(self, diff_size=(64, 48), threshold=24, margin=32, max_area=0.5, key_frame_interval=20,
+                 quality=85):
+        """
+        Creates a new region of interest cropper.
+
+        :param diff_size: The resolution to compare the frames in.
+        :param threshold: The minimum difference of a grayscale pixel (0-255) to count as changed.
+        :param margin: The margin in pixels to add around the changed region.
+        :param max_area: A new key frame is stored if the region is larger than this part of the frame.
+        :param key_frame_interval: A new key frame is stored after this many cropped frames.
+        :param quality: The jpeg quality of the cropped frames.
+        """
+        self._diff_size = tuple(diff_size)
+        self._threshold = threshold
+        self._margin = margin
+        self._max_area = max_area
+        self._key_frame_interval = key_frame_interval
+        self._quality = quality
+
+        self._key_frame = None  # The path of the current key frame
+        self._key_small = None  # The low resolution version of the current key frame
+        self._key_size = None  # The resolution of the current key frame
+        self._cropped = 0  # Cropped frames since the last key frame
+        self.key_frames = 0
+        self.cropped_frames = 0
+
+    def start(self):
+        """
+        Starts a new motion. The next frame is a key frame.
+        """
+        self._key_frame = None
+        self._key_small = None
+        self._key_size = None
+
+    def _small(self, image):
+        """
+        Returns the low resolution grayscale version of a frame.
+
+        :param image: The decoded frame.
+        :return: The low resolution frame.
+        """
+        # Let the jpeg decoder downscale already, that is a lot faster than decoding the full frame
+        image.draft('L', self._diff_size)
+        return image.convert('L').resize(self._diff_size)
+
+    def _changed_box(self, small, size):
+        """
+        Returns the region that changed compared to the key frame.
+
+        :param small: The low resolution version of the frame.
+        :param size: The resolution of the full frame.
+        :return: The region as (left, top, right, bottom) in pixels of the full frame.
+        """
+        from PIL import ImageChops
+
+        threshold = self._threshold
+        mask = ImageChops.difference(small, self._key_small).point(lambda value: 255 if value > threshold else 0)
+        box = mask.getbbox()
+        if box is None:
+            # Nothing changed, a single block is enough to keep the frame
+            return 0, 0, 16, 16
+
+        scale_x = size[0] / self._diff_size[0]
+        scale_y = size[1] / self._diff_size[1]
+        # Aligned to the 16 pixel blocks of the jpeg encoder, so block edges do not shift in the crop
+        left = max(0, int(box[0] * scale_x - self._margin) // 16 * 16)
+        top = max(0, int(box[1] * scale_y - self._margin) // 16 * 16)
+        right = min(size[0], -(-int(box[2] * scale_x + self._margin) // 16) * 16)
+        bottom = min(size[1], -(-int(box[3] * scale_y + self._margin) // 16) * 16)
+        return left, top, right, bottom
+
+    def crop(self, image_path, data):
+        """
+        Crops a frame to the region that changed since the key frame, if that is worth it.
+
+        :param image_path: The path the full frame would be stored at.
+        :param data: The full frame as jpeg.
+        :return: The path and the jpeg data to store, either the full frame or the cropped one.
+        """
+        from PIL import Image
+
+        with Image.open(io.BytesIO(data)) as image:
+            size = image.size
+            small = self._small(image)
+
+        box = None
+        # A crop can only be restored onto a key frame of the same resolution, e.g. capture_resize may change
+        if self._key_small is not None and self._key_size == size and self._cropped < self._key_frame_interval:
+            box = self._changed_box(small, size)
+        if box is None or (box[2] - box[0]) * (box[3] - box[1]) > self._max_area * size[0] * size[1]:
+            self._key_frame = image_path
+            self._key_small = small
+            self._key_size = size
+            self._cropped = 0
+            self.key_frames += 1
+            return image_path, data
+
+        # Decoded again, the draft mode only decodes the low resolution version
+        with Image.open(io.BytesIO(data)) as image:
+            output = io.BytesIO()
+            image.crop(box).save(output, 'JPEG', quality=self._quality)
+        self._cropped += 1
+        self.cropped_frames += 1
+        return roi_path(image_path, self._key_frame, box), output.getbuffer()
@@ -1,110 +1,383 @@
+"""
+The berry cam daemon. Started via the 'berry_cam' console script or 'python -m berry_cam.run_cam'.
+
+Hardware and network libraries are only imported when needed, so this module can be imported cheaply
+e.g. by tools and tests.
+"""
+import argparse
+import importlib.util
 import logging
 import os
 import signal
+import threading
 import time
+from queue import Queue
+
+from berry_cam.capture_record import CaptureRecord
+from berry_cam.circuit_breaker import CircuitBreaker
+from berry_cam.config import ConfigError, load_config, needs_restart, update_config
+from berry_cam.image_store import ImageStore
+from berry_cam.log import setup_logging
+from berry_cam.roi import RoiCropper
+from berry_cam.supervisor import Supervisor
+from berry_cam.tracing import PROFILER, TRACER
+from berry_cam.upload_scheduler import NEWEST_EVENT_FIRST, STALE_ARCHIVE, THIN, UploadScheduler
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(__file__), 'conf.yaml')
+
+
+class StartupTimer:
+    """
+    Measures and logs the time of the startup phases.
+    """
 
-import RPi.GPIO as GPIO
-import yaml
+    def __init__(self):
+        """
+        Creates a new startup timer, starting the first phase.
+        """
+        self._start = time.monotonic()
+        self._phase_start = self._start
+        self.phases = []
 
-from berry_cam.threads.heartbeat import Heartbeat
-from berry_cam.threads.image_capturing import ImageCapturing
-from berry_cam.threads.settings_loader import SettingsLoader
-from berry_cam.threads.uploader import Uploader
+    def phase(self, name):
+        """
+        Finishes the current phase.
 
-logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
+        :param name: The name of the finished phase.
+        """
+        now = time.monotonic()
+        self.phases.append((name, now - self._phase_start))
+        logging.info("Startup: %s took %.3f s", name, now - self._phase_start)
+        self._phase_start = now
 
-threads = []
+    @property
+    def total(self):
+        """
+        Returns the total time of all finished phases.
 
+        :return: The startup time in seconds.
+        """
+        return self._phase_start - self._start
 
-def stop(signum=None, frame=None):
+
+def queue_pending_images(image_store, upload_queue):
+    """
+    Queues the images that were not uploaded before the last stop. Only queues as many images as fit,
+    so the overflow policy does not drop any of them. The others stay pending for the next start.
+
+    :param ImageStore image_store: The image store to recover the images from.
+    :param upload_queue: The upload queue.
+    :return: The amount of queued images.
     """
-    Will stop the camera. Parameters are required for signal handling.
+    pending = image_store.recover()
+    for index, image in enumerate(pending):
+        if upload_queue.full():
+            logging.warning("Upload queue full, %s pending images are queued on the next start.",
+                            len(pending) - index)
+            return index
+        upload_queue.put_nowait(CaptureRecord.from_path(image))
+    return len(pending)
+
 
-    :param signum: The number of the raised signal
-    :param frame: The current stack frame
+def main(argv=None):
     """
-    logging.info("Stopping...")
-    for curr_thread in threads:
-        curr_thread.stop()
-
-
-logging.info("Starting...")
-
-# Init signal handling
-signal.signal(signal.SIGTERM, stop)
-signal.signal(signal.SIGINT, stop)
-
-# Open config file
-yaml_path = os.path.join(os.path.dirname(__file__), 'conf.yaml')
-with open(yaml_path) as config_file:
-    config = yaml.safe_load(config_file)
-
-    # Init heartbeat thread to notify the server that the camera is up
-    heartbeat = Heartbeat(
-        config['camera']['name'],
-        '{}/api/camera/'.format(config['image_server']['server_url']),
-        config['image_server']['api_key'],
-        config['image_server']['retry_count'])
-    threads.append(heartbeat)
-
-    # Init uploader thread that will upload new images
-    uploader = Uploader(
-        '{}/api/picture/'.format(config['image_server']['server_url']),
-        config['image_server']['api_key'],
-        config['image_server']['retry_count'])
-    threads.append(uploader)
-
-    # Check PIR config
-    pin_number_type = None
-    if config['pir']['number_type'] == "BCM":
-        pin_number_type = GPIO.BCM
-    elif config['pir']['number_type'] == "BOARD":
-        pin_number_type = GPIO.BOARD
-    else:
-        logging.error("Invalid pir number type found. Can be either BOARD or BCM."
-                      "Instead, found %s", config['pir']['number_type'])
-        stop()
-
-    # Init image capturing thread that will read out the camera
-    image_capturing = ImageCapturing(
-        pin_number_type,
-        config['pir']['pin'],
-        config['camera']['image_location'],
-        config['pir']['reset_time'],
-        uploader.upload_queue)
-    threads.append(image_capturing)
-
-    # Init settings refresh thread that will regularly fetch configuration from image server
-    threads.append(
-        SettingsLoader(
-            config['camera']['name'],
-            '{}/api/camera/'.format(config['image_server']['server_url']),
-            config['image_server']['api_key'],
-            config['image_server']['retry_count'],
-            (heartbeat, image_capturing)))
-
-    # Start the threads
-    logging.info("Running...")
-    for thread in threads:
-        thread.start()
-
-    # Wait until one thread is finished, then stop the others.
-    while True:
-        all_alive = True
-        for thread in threads:
-            if not thread.is_alive():
-                all_alive = False
-
-        if not all_alive:
-            break
-
-        time.sleep(0.5)
-
-    stop()
-    logging.info("Waiting for threads to stop...")
-    while threads:
-        thread = threads.pop()
-        thread.join()
-        logging.info("%s threads left...", len(threads))
-
-logging.info("Finished")
+    Runs the camera until it is stopped via SIGTERM or SIGINT.
+    The upload path is brought up first, so pending uploads and heartbeats do not wait for the camera.
+    The configuration is reloaded on SIGHUP.
+
+    :param argv: The command line arguments. Uses sys.argv if not set.
+    """
+    parser = argparse.ArgumentParser(description='Captures images on motion and uploads them to a server.')
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='The yaml configuration file.')
+    args = parser.parse_args(argv)
+
+    startup = StartupTimer()
+
+    # Log via a queue so slow consoles can not block the threads. Retry errors are only logged every 10 seconds.
+    log_pipeline = setup_logging(repeat_interval=10)
+    logging.info("Starting...")
+
+    try:
+        config = load_config(args.config)
+    except ConfigError as error:
+        logging.error("Invalid configuration: %s", error)
+        log_pipeline.stop()
+        return
+    startup.phase('loading config')
+
+    # Restarts failed threads with increasing delays. Stops everything if a thread fails too often.
+    supervisor_config = config.get('supervisor', {})
+    supervisor = Supervisor(supervisor_config.get('max_restarts', 5),
+                            supervisor_config.get('restart_window', 600),
+                            supervisor_config.get('backoff', 1),
+                            supervisor_config.get('max_backoff', 60))
+
+    def stop(signum=None, frame=None):
+        """
+        Will stop the camera. Parameters are required for signal handling.
+
+        :param signum: The number of the raised signal
+        :param frame: The current stack frame
+        """
+        logging.info("Stopping...")
+        supervisor.stop()
+
+    # Init signal handling
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Optional tracing of the processing stages. Profiling can be started at runtime via SIGUSR1.
+    tracing_config = config.get('tracing', {})
+    TRACER.enabled = tracing_config.get('enabled', False)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: PROFILER.start(
+        tracing_config.get('profile_window', 60), tracing_config.get('profile_dir')))
+
+    from berry_cam.threads.heartbeat import Heartbeat
+    from berry_cam.threads.uploader import UploadProducer, Uploader
+    startup.phase('importing network libraries')
+
+    # The upload queue is shared by all uploader instances, so pending images survive uploader restarts.
+    # By default, the first images of the newest motion events are uploaded first.
+    upload_config = config.get('upload', {})
+    # The queue is bounded, so a long outage can not fill memory and disk. By default, images from the
+    # middle of long events are dropped if it is full, and capturing is slowed down.
+    # Optionally, images older than a maximum age are uploaded last, as thumbnail or not at all.
+    upload_queue = UploadScheduler(upload_config.get('scheduling', NEWEST_EVENT_FIRST),
+                                   upload_config.get('event_gap', 2),
+                                   upload_config.get('key_frames', 1),
+                                   upload_config.get('max_queued', 1000),
+                                   upload_config.get('overflow', THIN),
+                                   upload_config.get('delete_dropped', True),
+                                   upload_config.get('max_age'),
+                                   upload_config.get('stale_policy', STALE_ARCHIVE))
+
+    # Images are stored in one directory per hour. Images that were not uploaded before the last stop are
+    # queued again, read from the index of the image store instead of walking all directories.
+    image_store = ImageStore(config['camera']['image_location'], config['camera'].get('sharded', True))
+    queue_pending_images(image_store, upload_queue)
+    startup.phase('recovering pending images')
+
+    # Shared by all threads using the server, so an unreachable server is detected once and all threads
+    # wait for a single probe instead of using up their retries
+    breaker_config = config['image_server'].get('circuit_breaker', {})
+    breaker = CircuitBreaker(breaker_config.get('failure_threshold', 3),
+                             breaker_config.get('reset_timeout', 5),
+                             breaker_config.get('max_reset_timeout', 300))
+
+    # Init heartbeat thread to notify the server that the camera is up. Optionally, heartbeats are skipped
+    # while other requests reached the server, if the server counts them as sign of life.
+    # The settings that can be changed at runtime are read from the latest configuration, see apply_config().
+    heartbeat_config = config.get('heartbeat', {})
+
+    def heartbeat_settings():
+        return dict(name=config['camera']['name'],
+                    url='{}/api/camera/'.format(config['image_server']['server_url']),
+                    api_key=config['image_server']['api_key'],
+                    retry_count=config['image_server']['retry_count'],
+                    interval=heartbeat_config.get('interval', 30),
+                    skip_while_active=heartbeat_config.get('skip_while_active', False))
+
+    heartbeat = supervisor.add('Heartbeat', lambda: Heartbeat(breaker=breaker, **heartbeat_settings()))
+
+    # Init uploader thread that will upload new images. Optionally, the frames of each motion are uploaded
+    # as a single archive, to save the per request overhead on expensive links.
+    def uploader_settings():
+        return dict(url='{}/api/picture/'.format(config['image_server']['server_url']),
+                    api_key=config['image_server']['api_key'],
+                    retry_count=config['image_server']['retry_count'],
+                    dedup=upload_config.get('dedup', False),
+                    timeout=config['image_server'].get('timeout'),
+                    archive_url='{}/api/event/'.format(config['image_server']['server_url']),
+                    archive_compression=upload_config.get('archive_compression', 'none'),
+                    name=config['camera']['name'])
+
+    uploader = supervisor.add('Uploader', lambda: Uploader(
+        upload_queue=upload_queue, breaker=breaker, image_store=image_store, **uploader_settings()))
+
+    # Optionally create thumbnails of the captured images in worker processes. The thumbnails are
+    # uploaded before the full resolution images, so a preview is available on the server fast.
+    capture_queue = upload_queue
+    thumbnail_config = config.get('thumbnails', {})
+    if thumbnail_config.get('enabled', False):
+        if importlib.util.find_spec('PIL') is None:
+            logging.error("Thumbnails need Pillow, please install the 'thumbnails' extra. "
+                          "Uploading without thumbnails.")
+        else:
+            from berry_cam.threads.thumbnail_generator import ThumbnailGenerator
+
+            # Shared by all generator instances, so pending images survive generator restarts.
+            # Bounded like the upload queue, so capturing is blocked if the generator can not keep up.
+            capture_queue = Queue(upload_config.get('max_queued', 1000))
+            supervisor.add('Thumbnail generator', lambda: ThumbnailGenerator(
+                UploadProducer(upload_queue),
+                capture_queue,
+                thumbnail_config.get('size', (160, 120)),
+                thumbnail_config.get('quality', 75),
+                thumbnail_config.get('workers')))
+
+    supervisor.start()
+    startup.phase('starting upload path')
+
+    try:
+        import RPi.GPIO as GPIO
+        from berry_cam.threads.image_capturing import ImageCapturing
+        from berry_cam.threads.settings_loader import SettingsLoader
+        startup.phase('importing hardware libraries')
+
+        # Check PIR config
+        pin_number_type = None
+        if config['pir']['number_type'] == "BCM":
+            pin_number_type = GPIO.BCM
+        elif config['pir']['number_type'] == "BOARD":
+            pin_number_type = GPIO.BOARD
+        else:
+            logging.error("Invalid pir number type found. Can be either BOARD or BCM."
+                          "Instead, found %s", config['pir']['number_type'])
+            stop()
+
+        # Optionally only the region that changed is uploaded for the frames of a motion after the first one
+        roi_enabled = config['camera'].get('roi', {}).get('enabled', False)
+        if roi_enabled and importlib.util.find_spec('PIL') is None:
+            logging.error("Cropping to the region of interest needs Pillow, "
+                          "please install the 'thumbnails' extra. Uploading full frames.")
+            roi_enabled = False
+
+        def create_roi_cropper():
+            """
+            Creates the region of interest cropper for a new image capturing thread.
+
+            :return: The cropper or None if cropping is disabled.
+            """
+            if not roi_enabled:
+                return None
+            roi_config = config['camera'].get('roi', {})
+            return RoiCropper(roi_config.get('diff_size', (64, 48)),
+                              roi_config.get('threshold', 24),
+                              roi_config.get('margin', 32),
+                              roi_config.get('max_area', 0.5),
+                              roi_config.get('key_frame_interval', 20),
+                              roi_config.get('quality', 85))
+
+        def image_capturing_settings():
+            return dict(reset_time=config['pir']['reset_time'],
+                        backpressure_factor=config['camera'].get('backpressure_factor', 4))
+
+        # Optionally subscribes to settings changes pushed by the server instead of polling.
+        def settings_loader_settings():
+            push_url = None
+            if config['image_server'].get('push', False):
+                push_url = '{}/api/camera/events/'.format(config['image_server']['server_url'])
+            return dict(name=config['camera']['name'],
+                        url='{}/api/camera/'.format(config['image_server']['server_url']),
+                        api_key=config['image_server']['api_key'],
+                        retry_count=config['image_server']['retry_count'],
+                        push_url=push_url)
+
+        image_capturing = None
+        settings_loader = None
+
+        def apply_config(new_config):
+            """
+            Applies a reloaded configuration. Running threads are updated in place, so the camera stays
+            initialized and no queued image is lost. Restarted threads are created from the updated configuration.
+
+            :param new_config: The validated configuration dict.
+            """
+            changed = update_config(config, new_config)
+            if not changed:
+                logging.info("Config: Reloaded, nothing changed.")
+                return
+            logging.info("Config: Reloaded, changed %s.", ', '.join(changed))
+            restart = needs_restart(changed)
+            if restart:
+                logging.warning("Config: Changes of %s are only applied after a restart.", ', '.join(restart))
+
+            for handle, settings in ((heartbeat, heartbeat_settings), (uploader, uploader_settings),
+                                     (image_capturing, image_capturing_settings),
+                                     (settings_loader, settings_loader_settings)):
+                if handle is not None and handle.worker is not None:
+                    handle.worker.reconfigure(**settings())
+
+        # Reload the configuration on SIGHUP and, optionally, when the file changed
+        from berry_cam.threads.config_watcher import ConfigWatcher
+        reload_config = config.get('reload', {})
+        reload_requested = threading.Event()  # Shared by all watcher instances, so no request is lost
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload_requested.set())
+        supervisor.add('Config watcher', lambda: ConfigWatcher(
+            args.config,
+            apply_config,
+            reload_requested,
+            reload_config.get('watch', True),
+            reload_config.get('interval', 5)))
+
+        if pin_number_type is not None:
+            # Init image capturing thread that will read out the camera
+            image_capturing = supervisor.add('Image capturing', lambda: ImageCapturing(
+                pin_number_type,
+                config['pir']['pin'],
+                config['camera']['image_location'],
+                image_capturing_settings()['reset_time'],
+                UploadProducer(capture_queue),
+                config['camera'].get('standby', 'off'),
+                config['camera'].get('standby_interval', 30),
+                config['camera'].get('frame_interval', 0.5),
+                config['camera'].get('max_frame_interval'),
+                config['camera'].get('frame_interval_ramp', 10),
+                UploadProducer(upload_queue),
+                image_capturing_settings()['backpressure_factor'],
+                upload_config.get('archive_events', False),
+                image_store=image_store,
+                roi_cropper=create_roi_cropper()))
+
+            # Init settings refresh thread that will regularly fetch configuration from image server.
+            # The handles are updated instead of the threads, so the 'enabled' state survives thread restarts.
+            settings_loader = supervisor.add('Settings loader', lambda: SettingsLoader(
+                enabled_updater=(heartbeat, image_capturing),
+                breaker=breaker,
+                **settings_loader_settings()))
+
+            # Throttle capturing and uploading if the SoC gets too hot or the system is overloaded
+            thermal_config = config.get('thermal', {})
+            if thermal_config.get('enabled', True):
+                from berry_cam.threads.thermal_monitor import ThermalMonitor
+                supervisor.add('Thermal monitor', lambda: ThermalMonitor(
+                    image_capturing,
+                    uploader,
+                    thermal_config.get('temperature_path', '/sys/class/thermal/thermal_zone0/temp'),
+                    thermal_config.get('load_path', '/proc/loadavg'),
+                    thermal_config.get('warm_temperature', 70),
+                    thermal_config.get('hot_temperature', 78),
+                    thermal_config.get('max_load', 1.5),
+                    thermal_config.get('hysteresis', 5),
+                    thermal_config.get('interval', 10),
+                    thermal_config.get('warm_throttle', 2),
+                    thermal_config.get('hot_throttle', 4),
+                    thermal_config.get('hot_resolution', (640, 480)),
+                    thermal_config.get('warm_upload_pause', 0.5),
+                    thermal_config.get('hot_upload_pause', 2)))
+
+            supervisor.start()
+            startup.phase('starting camera')
+            logging.info("Running... (startup took %.3f s)", startup.total)
+
+        # Wait until the threads are stopped
+        supervisor.run()
+    finally:
+        # The upload path is already running, do not leave its threads behind if the camera setup failed
+        logging.info("Waiting for threads to stop...")
+        supervisor.stop()
+        supervisor.join()
+
+    if TRACER.enabled:
+        TRACER.export(tracing_config.get('output', os.path.join(os.path.dirname(__file__), 'trace.jsonl')),
+                      tracing_config.get('format', 'jsonl'))
+
+    logging.info("Finished (%s images dropped from the full upload queue, %s stale images replaced by thumbnails, "
+                 "%s archived, %s dropped, %s log messages dropped, %s suppressed)",
+                 upload_queue.dropped, upload_queue.downgraded, upload_queue.archived, upload_queue.expired,
+                 log_pipeline.dropped, log_pipeline.suppressed)
+    log_pipeline.stop()
+
+
+if __name__ == '__main__':
+    main()
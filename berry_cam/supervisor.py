@@ -0,0 +1,221 @@
+"""
+Supervision of the berry cam threads.
+"""
+import logging
+import time
+from collections import deque
+from queue import Queue, Empty
+
+LOG = logging.getLogger(__name__)
+
+
+class WorkerHandle:
+    """
+    Refers to the current instance of a supervised worker thread.
+    Threads can not be started twice, so a restart creates a new instance. The 'enabled' state and other
+    attributes set via the handle are applied to every new instance, so they survive restarts.
+    """
+
+    def __init__(self, name, factory):
+        """
+        Creates a new worker handle.
+
+        :param name: The name of the worker, used for logging.
+        :param factory: A callable returning a new, not yet started worker thread.
+        """
+        self.name = name
+        self.worker = None
+        self.restart_times = deque()
+        self._factory = factory
+        self._attributes = {}
+
+    @property
+    def enabled(self):
+        """
+        Returns the enabled state of the worker.
+
+        :return: The enabled state of the current worker instance.
+        """
+        return self.worker.enabled
+
+    @enabled.setter
+    def enabled(self, enabled):
+        """
+        Sets the enabled state of the current and all future worker instances.
+
+        :param enabled: The new enabled state.
+        """
+        self.configure(enabled=enabled)
+
+    def configure(self, **attributes):
+        """
+        Sets attributes of the current and all future worker instances.
+
+        :param attributes: The attribute names and values.
+        """
+        self._attributes.update(attributes)
+        if self.worker is not None:
+            for name, value in attributes.items():
+                setattr(self.worker, name, value)
+
+    def create(self):
+        """
+        Creates a new worker instance.
+
+        :return: The new worker.
+        """
+        self.worker = self._factory()
+        for name, value in self._attributes.items():
+            setattr(self.worker, name, value)
+        return self.worker
+
+
+class Supervisor:
+    """
+    Starts the worker threads and restarts them if they exit unexpectedly.
+    Exits are reported by the workers themselves, so no polling is required.
+    """
+
+    def __init__(self, max_restarts=5, restart_window=600, backoff=1, max_backoff=60):
+        """
+        Creates a new supervisor.
+
+        :param max_restarts: The maximum amount of restarts of a single worker within the restart window.
+                             If exceeded, all workers are stopped.
+        :param restart_window: The restart window in seconds.
+        :param backoff: The delay in seconds before the first restart. Doubled on each further restart
+                        within the restart window.
+        :param max_backoff: The maximum delay before a restart in seconds.
+        """
+        self._max_restarts = max_restarts
+        self._restart_window = restart_window
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+
+        self._handles = []
+        self._exits = Queue()
+        self._pending_restarts = []  # List of (restart time, handle)
+        self._running = 0
+        self._stopping = False
+
+    def add(self, name, factory):
+        """
+        Adds a worker to supervise.
+
+        :param name: The name of the worker.
+        :param factory: A callable returning a new, not yet started worker thread.
+        :return: The handle of the worker.
+        """
+        handle = WorkerHandle(name, factory)
+        self._handles.append(handle)
+        return handle
+
+    def _start_worker(self, handle):
+        """
+        Starts a new instance of the given worker.
+
+        :param WorkerHandle handle: The worker to start.
+        """
+        worker = handle.create()
+        run = worker.run
+
+        def supervised_run():
+            try:
+                run()
+            except Exception:
+                LOG.exception("Supervisor: %s failed", handle.name)
+            finally:
+                self._exits.put(handle)
+
+        worker.run = supervised_run
+        self._running += 1
+        worker.start()
+
+    def start(self):
+        """
+        Starts all workers that were not started yet. Can be called again after adding further workers.
+        """
+        for handle in self._handles:
+            if handle.worker is None:
+                self._start_worker(handle)
+
+    def stop(self):
+        """
+        Stops all workers. Can be called from a signal handler.
+        """
+        self._stopping = True
+        for handle in self._handles:
+            if handle.worker is not None:
+                handle.worker.stop()
+
+    def _schedule_restart(self, handle):
+        """
+        Schedules the restart of an exited worker.
+
+        :param WorkerHandle handle: The exited worker.
+        :return: False if the restart budget of the worker is exceeded.
+        """
+        now = time.monotonic()
+        while handle.restart_times and now - handle.restart_times[0] > self._restart_window:
+            handle.restart_times.popleft()
+
+        if len(handle.restart_times) >= self._max_restarts:
+            LOG.error("Supervisor: %s exited %s times within %s seconds, giving up.",
+                      handle.name, len(handle.restart_times) + 1, self._restart_window)
+            return False
+
+        delay = min(self._backoff * 2 ** len(handle.restart_times), self._max_backoff)
+        handle.restart_times.append(now)
+        self._pending_restarts.append((now + delay, handle))
+        LOG.warning("Supervisor: %s exited, restarting in %s seconds.", handle.name, delay)
+        return True
+
+    def _restart_due_workers(self):
+        """
+        Restarts all workers whose backoff time is over.
+
+        :return: The time in seconds until the next pending restart, None if no restart is pending.
+        """
+        if self._stopping:
+            self._pending_restarts = []
+            return None
+
+        now = time.monotonic()
+        for restart in [restart for restart in self._pending_restarts if restart[0] <= now]:
+            self._pending_restarts.remove(restart)
+            LOG.info("Supervisor: Restarting %s", restart[1].name)
+            self._start_worker(restart[1])
+
+        if not self._pending_restarts:
+            return None
+        return max(0, min(restart[0] for restart in self._pending_restarts) - now)
+
+    def run(self):
+        """
+        Supervises the workers until all of them are stopped.
+        Blocks until stop() was called or a worker exceeded its restart budget.
+        """
+        while True:
+            timeout = self._restart_due_workers()
+            if self._stopping and self._running == 0:
+                return
+
+            try:
+                handle = self._exits.get(True, timeout)
+            except Empty:
+                continue
+
+            self._running -= 1
+            if self._stopping:
+                continue
+
+            if not self._schedule_restart(handle):
+                self.stop()
+
+    def join(self):
+        """
+        Waits until all workers are finished.
+        """
+        for handle in self._handles:
+            if handle.worker is not None and handle.worker.is_alive():
+                handle.worker.join()
@@ -0,0 +1,95 @@
+import logging
+import os
+import threading
+import time
+from threading import Thread
+
+from berry_cam.config import ConfigError, load_config
+from berry_cam.tracing import PROFILER
+
+LOG = logging.getLogger(__name__)
+
+
+class ConfigWatcher(Thread):
+    """
+    This thread reloads the configuration file if it was changed or a reload was requested, e.g. via SIGHUP.
+    The new configuration is only applied if it is valid, otherwise the running configuration is kept.
+    """
+
+    def __init__(self, path, apply, reload_requested=None, watch=True, interval=5):
+        """
+        Creates a new config watcher thread.
+
+        :param path: The path of the configuration file.
+        :param apply: A callable applying a validated configuration dict.
+        :param reload_requested: An event to set to request a reload, e.g. from a signal handler. Passing the
+                                 event of a previous watcher keeps pending requests e.g. when restarting
+                                 the watcher.
+        :param watch: If set, the file is reloaded when its modification time changes.
+        :param interval: The time in seconds between two checks of the modification time.
+        """
+        super().__init__()
+        self._path = path
+        self._apply = apply
+        self._reload_requested = reload_requested if reload_requested is not None else threading.Event()
+        self._watch = watch
+        self._interval = interval
+        self._mtime = self._modification_time()
+
+        self.reloads = 0  # Applied configurations
+        self.rejected = 0  # Invalid configurations that were not applied
+
+        self._run_watcher = True
+
+    def stop(self):
+        """
+        Signals this thread to stop as soon as possible.
+        """
+        self._run_watcher = False
+
+    def _modification_time(self):
+        """
+        Returns the modification time of the configuration file.
+
+        :return: The modification time or None if the file does not exist.
+        """
+        try:
+            return os.stat(self._path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self):
+        """
+        Reloads the configuration file and applies it if it is valid.
+
+        :return: True if the configuration was applied.
+        """
+        self._mtime = self._modification_time()
+        try:
+            config = load_config(self._path)
+        except ConfigError as error:
+            LOG.error("Config watcher: Invalid configuration, keeping the running configuration: %s", error)
+            self.rejected += 1
+            return False
+
+        self._apply(config)
+        self.reloads += 1
+        return True
+
+    def run(self):
+        """
+        Runs the thread.
+        """
+        LOG.info("Config watcher started...")
+        next_check = time.monotonic() + self._interval
+        while self._run_watcher:
+            PROFILER.poll()
+            if self._reload_requested.wait(0.5):
+                self._reload_requested.clear()
+                LOG.info("Config watcher: Reload requested.")
+                self.reload()
+            elif self._watch and time.monotonic() >= next_check:
+                next_check = time.monotonic() + self._interval
+                if self._modification_time() != self._mtime:
+                    LOG.info("Config watcher: %s changed, reloading.", self._path)
+                    self.reload()
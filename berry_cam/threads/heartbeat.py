@@ -5,15 +5,21 @@ from threading import Thread
 
 import requests
 
+from berry_cam.circuit_breaker import CircuitBreaker
+
 LOG = logging.getLogger(__name__)
 
 
 class Heartbeat(Thread):
     """
     A heartbeat thread. Will regularly send 'alive' information to the image server.
+
+    Optionally, heartbeats are skipped while other requests reached the server within the heartbeat interval
+    and the 'enabled' state did not change since the last heartbeat. The server then still gets a request
+    at least once per interval, but needs to count all authenticated requests of the camera as sign of life.
     """
 
-    def __init__(self, name, url, api_key, retry_count):
+    def __init__(self, name, url, api_key, retry_count, breaker=None, interval=30, skip_while_active=False):
         """
         Creates a new heartbeat thread.
 
@@ -21,14 +27,25 @@ class Heartbeat(Thread):
         :param url: The url to send the heartbeat to
         :param api_key: The api key for authentication
         :param retry_count: How often sending should be retried before failing.
+        :param breaker: The circuit breaker shared by all threads using the server. While the server is
+                        unreachable, the heartbeat waits instead of using up the retries.
+                        Also tells when the other threads reached the server the last time.
+        :param interval: The time between two heartbeats in seconds.
+        :param skip_while_active: If set, heartbeats are skipped while other requests prove that the camera
+                                  is alive.
         """
         super().__init__()
         self._name = name
         self._url = url
         self._api_key = api_key
         self._retry_count = retry_count
+        self._breaker = breaker if breaker is not None else CircuitBreaker(None)
+        self._interval = interval
+        self._skip_while_active = skip_while_active
 
         self.enabled = False  # Will be updated by settings loader
+        self._sent_enabled = None  # The 'enabled' state sent with the last heartbeat
+        self.skipped_heartbeats = 0  # Requests saved since other requests reached the server
 
         self._run_heartbeat = True
 
@@ -38,48 +55,99 @@ class Heartbeat(Thread):
         """
         self._run_heartbeat = False
 
+    def reconfigure(self, name, url, api_key, retry_count, interval=30, skip_while_active=False):
+        """
+        Updates the settings of the running thread. Applied from the next heartbeat on.
+
+        :param name: The name of the current camera.
+        :param url: The url to send the heartbeat to
+        :param api_key: The api key for authentication
+        :param retry_count: How often sending should be retried before failing.
+        :param interval: The time between two heartbeats in seconds.
+        :param skip_while_active: If set, heartbeats are skipped while other requests prove that the camera
+                                  is alive.
+        """
+        self._name = name
+        self._url = url
+        self._api_key = api_key
+        self._retry_count = retry_count
+        self._interval = interval
+        self._skip_while_active = skip_while_active
+
+    def _skip(self):
+        """
+        Checks if the next heartbeat can be skipped, since other requests recently reached the server.
+
+        :return: True if the heartbeat should not be sent.
+        """
+        last_success = self._breaker.last_success
+        return self._skip_while_active and self.enabled == self._sent_enabled and \
+            last_success is not None and time.monotonic() - last_success < self._interval
+
+    def _send(self):
+        """
+        Sends a single heartbeat, retrying on connection errors.
+
+        :return: False if the heartbeat should stop, e.g. because the retries are exceeded.
+        """
+        LOG.info("Heartbeat sending...")
+        try_count = 0
+        while try_count < self._retry_count:
+            if not self._breaker.acquire_while(lambda: self._run_heartbeat):
+                return False
+
+            try:
+                enabled = self.enabled
+                response = requests.post(self._url,
+                                         data={'name': self._name,
+                                               'api_key': self._api_key,
+                                               'enabled': enabled})
+                self._breaker.record_success(response.status_code == HTTPStatus.OK)
+                self._sent_enabled = enabled
+                if response.status_code == HTTPStatus.OK:
+                    LOG.debug("Heartbeat sent.")
+
+                if response.status_code == HTTPStatus.FORBIDDEN:
+                    LOG.error(
+                        "Heartbeat: Access denied. Please check your api key.")
+                    return False
+
+                return True
+
+            except requests.exceptions.ConnectionError as error:
+                LOG.error(
+                    "Heartbeat: Error while connecting to server. Retrying...")
+                LOG.error(error)
+                # If the server is known to be unreachable, wait for it without using up the retries
+                if not self._breaker.record_failure():
+                    try_count += 1
+                    time.sleep(1)
+
+        # Retries exceeded, stop heartbeat
+        LOG.error("Heartbeat: Failed to send heartbeat after %s tries, giving up. "
+                  "Are you sure the server is up?", self._retry_count)
+        self._run_heartbeat = False
+        return False
+
     def run(self):
         """
         Runs the thread.
         """
         LOG.info("Heartbeat started...")
         while self._run_heartbeat:
-            LOG.info("Heartbeat sending...")
-            try_count = 0
-            for try_count in range(self._retry_count):
-                if not self._run_heartbeat:
-                    break
-
-                try:
-                    response = requests.post(self._url,
-                                             data={'name': self._name,
-                                                   'api_key': self._api_key,
-                                                   'enabled': self.enabled})
-                    if response.status_code == HTTPStatus.OK:
-                        LOG.debug("Heartbeat sent.")
-
-                    if response.status_code == HTTPStatus.FORBIDDEN:
-                        LOG.error(
-                            "Heartbeat: Access denied. Please check your api key.")
-                        return
-
-                    break
-
-                except requests.exceptions.ConnectionError as error:
-                    LOG.error(
-                        "Heartbeat: Error while connecting to server. Retrying...")
-                    LOG.error(error)
-                    time.sleep(1)
-
-            # Retries exceeded, stop uploader
-            if try_count == self._retry_count - 1:
-                LOG.error("Heartbeat: Failed to send heartbeat after %s tries, giving up. "
-                          "Are you sure the server is up?", self._retry_count)
-                self._run_heartbeat = False
-                return
+            if self._skip():
+                LOG.debug("Heartbeat skipped, other requests reached the server.")
+                self.skipped_heartbeats += 1
+                # Check again once the interval passed since the last request, not since the skip
+                next_check = self._breaker.last_success + self._interval
+            elif not self._send():
+                break
+            else:
+                next_check = time.monotonic() + self._interval
 
             # Wait until next iteration
-            for _ in range(30):
-                time.sleep(1)
-                if not self._run_heartbeat:
-                    break
+            while self._run_heartbeat and time.monotonic() < next_check:
+                time.sleep(max(0, min(1, next_check - time.monotonic())))
+
+        if self._skip_while_active:
+            LOG.info("Heartbeat stopped, %s heartbeats skipped.", self.skipped_heartbeats)
@@ -1,10 +1,16 @@
+import io
 import logging
-import os
 import time
+from queue import Full
 from threading import Thread
 
-import RPi.GPIO as GPIO
-from picamera import PiCamera
+from berry_cam.camera_standby import OFF, CameraStandby
+from berry_cam.capture_record import IMAGE, MANIFEST, CaptureRecord
+from berry_cam.capture_scheduler import CaptureScheduler
+from berry_cam.event_archive import write_manifest
+from berry_cam.image_store import ImageStore
+from berry_cam.images import capture_time, is_roi, parse_roi
+from berry_cam.tracing import PROFILER, TRACER, trace_id_for
 
 LOG = logging.getLogger(__name__)
 
@@ -15,7 +21,10 @@ class ImageCapturing(Thread):
     into an upload queue.
     """
 
-    def __init__(self, port_type, pin, image_location, reset_time, upload_queue):
+    def __init__(self, port_type, pin, image_location, reset_time, upload_queue, standby_mode=OFF,
+                 standby_interval=30, frame_interval=0.5, max_frame_interval=None, frame_interval_ramp=10,
+                 backpressure_queue=None, backpressure_factor=4, archive_events=False, camera_factory=None,
+                 image_store=None, roi_cropper=None):
         """
         Creates a new image capturing thread.
 
@@ -23,20 +32,57 @@ class ImageCapturing(Thread):
         :param pin: The pin on which the PIR is connected.
         :param image_location: The location where the images should be stored.
         :param reset_time: Reset time after which the PIR is able to detect motion again.
-        :param upload_queue: New images will be stored in this queue and can e.g. be processed in another thread.
+        :param upload_queue: The records of new images will be stored in this queue and can e.g. be processed
+                             in another thread.
+        :param standby_mode: How to keep exposure and white balance converged between motions.
+                             One of the camera_standby modes.
+        :param standby_interval: The interval in seconds to meter or refresh the locked values in standby.
+        :param frame_interval: The target time between two captures in seconds.
+        :param max_frame_interval: If set, the time between two captures grows to this value while the PIR
+                                   stays high, so long motions are captured with a lower frame rate.
+        :param frame_interval_ramp: The time in seconds the PIR needs to be high to reach max_frame_interval.
+        :param backpressure_queue: The capture rate is reduced while this queue is full. Uses the upload queue
+                                   if not set.
+        :param backpressure_factor: The factor to increase the frame interval by while the queue is full.
+        :param archive_events: If set, the frames of a motion are queued as a whole once the motion ended,
+                               by queuing an event manifest instead of the single images.
+        :param camera_factory: A callable returning the camera to use as context manager. Uses a PiCamera
+                               with a resolution of 1024x768 if not set.
+        :param image_store: The store to write the images to and to record the queued images in.
+                            Uses an ImageStore in image_location if not set.
+        :param roi_cropper: If set, the frames of a motion after the key frame are cropped to the region
+                            that changed, see roi.RoiCropper.
         """
         super().__init__()
 
-        self._image_location = image_location
+        # Hardware libraries are imported on first use to keep importing this module fast.
+        import RPi.GPIO as GPIO
+        self._gpio = GPIO
+
+        self._image_store = image_store if image_store is not None else ImageStore(image_location)
         self._reset_time = reset_time
         self._GPIO_PIR = pin
         self._upload_queue = upload_queue
+        self._standby_mode = standby_mode
+        self._standby_interval = standby_interval
+        self._camera_factory = camera_factory
+        self._roi_cropper = roi_cropper
+        self._capture_scheduler = CaptureScheduler(frame_interval, max_frame_interval, frame_interval_ramp)
+        self._backpressure_queue = backpressure_queue if backpressure_queue is not None else upload_queue
+        self._backpressure_factor = backpressure_factor
+        self._archive_events = archive_events
+        self._event_frames = []  # The frames of the current motion if archiving events
+        self._motion_start = None  # All frames of a motion are stored in the same directory
+        self._event = 0  # The number of the current motion
 
         # Set pin as input
         GPIO.setmode(port_type)
         GPIO.setup(self._GPIO_PIR, GPIO.IN)
 
         self.enabled = False  # Will be updated by settings loader
+        self.throttle = 1  # Factor for the frame interval, e.g. updated by the thermal monitor
+        self.capture_resize = None  # Resolution to scale the images to, e.g. updated by the thermal monitor
+        self._queue_full = False
 
         self._run_camera = True
 
@@ -46,13 +92,111 @@ class ImageCapturing(Thread):
         """
         self._run_camera = False
 
+    def reconfigure(self, reset_time, backpressure_factor=4):
+        """
+        Updates the settings of the running thread. The camera and the PIR stay initialized.
+
+        :param reset_time: Reset time after which the PIR is able to detect motion again.
+        :param backpressure_factor: The factor to increase the frame interval by while the queue is full.
+        """
+        self._reset_time = reset_time
+        self._backpressure_factor = backpressure_factor
+
+    def _capture(self, camera):
+        """
+        Captures an image and puts it into the upload queue.
+
+        :param camera: The camera to capture the image with.
+        """
+        timestamp = time.time()
+        if self._motion_start is None:
+            self._motion_start = timestamp
+        image_path = self._image_store.path_for(timestamp, self._motion_start)
+        trace_id = trace_id_for(image_path)
+
+        # Capture into memory first to be able to measure capturing and writing separately
+        image = io.BytesIO()
+        with TRACER.span('capture', trace_id):
+            if self.capture_resize:
+                camera.capture(image, format='jpeg', resize=self.capture_resize)
+            else:
+                camera.capture(image, format='jpeg')
+        data = image.getbuffer()
+        if self._roi_cropper is not None:
+            with TRACER.span('crop', trace_id):
+                image_path, data = self._roi_cropper.crop(image_path, data)
+        with TRACER.span('write', trace_id):
+            self._image_store.write(image_path, data)
+        if self._archive_events:
+            # Queued as a whole once the motion ended
+            self._event_frames.append(image_path)
+            return
+
+        with TRACER.span('enqueue', trace_id):
+            record = CaptureRecord(image_path, IMAGE, timestamp, len(data), self._event)
+            if is_roi(image_path):
+                record.roi_of, record.roi = parse_roi(image_path)
+            elif self._roi_cropper is not None:
+                # The following cropped frames can only be restored with their key frame
+                record.protected = True
+            self._enqueue(record)
+
+    def _enqueue(self, record):
+        """
+        Puts an image or event manifest into the upload queue.
+
+        :param CaptureRecord record: The record of the queued file.
+        """
+        # Recorded before queuing, so it can not be marked as uploaded before
+        self._image_store.add_pending(record.path)
+
+        # Blocks if the upload queue is full and configured to block, so keep checking for stop requests
+        while True:
+            try:
+                self._upload_queue.put(record, True, 0.5)
+                return
+            except Full:
+                if not self._run_camera:
+                    LOG.warning("Thread stopped while upload queue was full, %s not queued.", record.path)
+                    return
+
+    def _finish_event(self, rates=None):
+        """
+        Queues the frames of a finished motion as event archive, if archiving is enabled.
+
+        :param rates: The achieved and target frame rates of the motion, if known.
+        """
+        self._motion_start = None
+        if not self._event_frames:
+            return
+
+        manifest = write_manifest(self._event_frames, time.time(), *(rates or (None, None)))
+        start = capture_time(self._event_frames[0])
+        self._event_frames = []
+        LOG.debug("Queuing event archive %s", manifest)
+        self._enqueue(CaptureRecord(manifest, MANIFEST, start, event=self._event))
+
+    def _update_backpressure(self):
+        """
+        Reduces the capture rate while the upload queue is full or the camera is throttled.
+        """
+        queue_full = self._backpressure_queue.full()
+        if queue_full != self._queue_full:
+            if queue_full:
+                LOG.warning("Upload queue full, reducing capture rate.")
+            else:
+                LOG.info("Upload queue has space again, restoring capture rate.")
+            self._queue_full = queue_full
+
+        self._capture_scheduler.throttle = (self._backpressure_factor if queue_full else 1) * self.throttle
+
     def run(self):
         """
         Runs the thread.
         """
         LOG.info("Image capturing started...")
         LOG.info("Wait for PIR to be in sleep state ...")
-        while self._run_camera and GPIO.input(self._GPIO_PIR) != 0:
+        while self._run_camera and self._gpio.input(self._GPIO_PIR) != 0:
             time.sleep(0.1)
 
         if not self._run_camera:
@@ -61,33 +205,67 @@ class ImageCapturing(Thread):
 
         LOG.info("Ready...")
 
+        camera_factory = self._camera_factory
+        if camera_factory is None:
+            from picamera import PiCamera
+
+            # Load camera with resolution of 1024x768 to save some space.
+            def camera_factory():
+                return PiCamera(resolution=(1024, 768))
+
         last_state = 0
 
-        # Load camera with resolution of 1024x768 to save some space.
-        with PiCamera(resolution=(1024, 768)) as camera:
+        with camera_factory() as camera:
+            standby = CameraStandby(camera, self._standby_mode, self._standby_interval)
             while self._run_camera:
+                PROFILER.poll()
+                # Time until the next check of the PIR
+                wait_time = 0.5
                 if self.enabled:
                     # Read pir state
-                    pir_state = GPIO.input(self._GPIO_PIR)
+                    pir_state = self._gpio.input(self._GPIO_PIR)
 
-                    # If motion is recognized, capture a picture and store it in upload queue
                     if pir_state == 1:
-                        image_path = os.path.join(
-                            self._image_location, '{}.jpg'.format(time.time()))
-                        camera.capture(image_path)
-                        self._upload_queue.put(image_path)
+                        # Only print the info msg on raising flank for pir state = switch from non motion to motion
+                        if last_state == 0:
+                            LOG.info("Movement recognized, taking pictures.")
+                            self._capture_scheduler.start()
+                            self._event += 1
+                            if self._roi_cropper is not None:
+                                self._roi_cropper.start()
 
-                    # Only print the info msg on raising flank for pir state = switch from non motion to motion
-                    if pir_state == 1 and last_state == 0:
-                        LOG.info("Movement recognized, taking pictures.")
-                        last_state = 1
+                        # If motion is recognized, capture a picture and store it in upload queue
+                        self._update_backpressure()
+                        if self._capture_scheduler.due():
+                            self._capture(camera)
+                            self._capture_scheduler.captured()
+
+                        if last_state == 0:
+                            # Locked exposure is only released after the first image
+                            standby.wake()
+                            last_state = 1
+
+                        # Capture the next image in time, independent of the time the capture took
+                        wait_time = min(wait_time, self._capture_scheduler.wait_time())
 
                     # The PIR needs ~5 seconds until it is ready again, so wait some time on a falling flank.
-                    elif pir_state == 0 and last_state == 1:
+                    elif last_state == 1:
                         LOG.info("No more movement, stop capturing.")
+                        rates = self._capture_scheduler.finish()
+                        if rates:
+                            LOG.info("Captured %s images at %.2f fps (target %.2f fps).",
+                                     self._capture_scheduler.frames, *rates)
+                        self._finish_event(rates)
                         time.sleep(self._reset_time)
                         LOG.info("Ready...")
                         last_state = 0
 
+                    # Keep the camera ready for the next motion
+                    else:
+                        standby.idle()
+
                 # Sleep some time until next check
-                time.sleep(0.5)
+                time.sleep(wait_time)
+
+        # Do not lose the frames of a motion that was still going on
+        self._finish_event()
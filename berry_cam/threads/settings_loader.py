@@ -5,16 +5,56 @@ from http import HTTPStatus
 from threading import Thread
 
 import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from berry_cam.circuit_breaker import CLOSED, CircuitBreaker
 
 LOG = logging.getLogger(__name__)
 
 
+def parse_server_sent_events(lines):
+    """
+    Parses a stream of server-sent events.
+
+    :param lines: An iterable of the received text lines.
+    :return: A generator of (event id, event type, data) tuples. The event id is None if not sent.
+    """
+    event_id = None
+    event_type = 'message'
+    data = []
+    for line in lines:
+        if not line:
+            # An empty line dispatches the event
+            if data:
+                yield event_id, event_type, '\n'.join(data)
+            event_type = 'message'
+            data = []
+            continue
+
+        if line.startswith(':'):
+            continue  # Comment, e.g. to keep the connection alive
+
+        field, _, value = line.partition(':')
+        if value.startswith(' '):
+            value = value[1:]
+
+        if field == 'id':
+            event_id = value
+        elif field == 'event':
+            event_type = value
+        elif field == 'data':
+            data.append(value)
+
+
 class SettingsLoader(Thread):
     """
     This thread regularly checks on image server for settings updates (e.g. camera enabling).
+    If a push url is given, the thread subscribes to settings changes via server-sent events instead and
+    only falls back to polling while the push channel is not available.
     """
 
-    def __init__(self, name, url, api_key, retry_count, enabled_updater=None):
+    def __init__(self, name, url, api_key, retry_count, enabled_updater=None, push_url=None,
+                 push_read_timeout=90, max_push_backoff=300, breaker=None):
         """
         Creates a new settings loader thread
 
@@ -23,6 +63,12 @@ class SettingsLoader(Thread):
         :param api_key: The api key to authenticate at the server.
         :param retry_count: Retry this often if connection fails.
         :param enabled_updater: A list of elements to update 'enabled' property on changes.
+        :param push_url: The url to subscribe to settings changes via server-sent events. Polling only if not set.
+        :param push_read_timeout: Reconnect if the server did not send anything for this amount of seconds.
+                                  The server should send keep alive comments more often.
+        :param max_push_backoff: The maximum time in seconds to wait before resubscribing.
+        :param breaker: The circuit breaker shared by all threads using the server. While the server is
+                        unreachable, the settings loader waits instead of using up the retries.
         """
 
         super().__init__()
@@ -30,12 +76,20 @@ class SettingsLoader(Thread):
         self._url = url
         self._api_key = api_key
         self._retry_count = retry_count
+        self._push_url = push_url
+        self._push_read_timeout = push_read_timeout
+        self._max_push_backoff = max_push_backoff
+        self._breaker = breaker if breaker is not None else CircuitBreaker(None)
 
         if enabled_updater:
             self.enabled_updater = enabled_updater
         else:
             self.enabled_updater = []
 
+        self._last_event_id = None
+        self._push_backoff = 1
+        self._next_push_attempt = 0
+
         self._run_settings_loader = True
 
     def stop(self):
@@ -44,50 +98,159 @@ class SettingsLoader(Thread):
         """
         self._run_settings_loader = False
 
-    def run(self):
+    def reconfigure(self, name, url, api_key, retry_count, push_url=None):
         """
-        Runs the thread.
+        Updates the settings of the running thread. Applied from the next request on, an open push
+        subscription is kept until it is reconnected.
+
+        :param name: The name of the camera to read the settings for.
+        :param url: The url to read the data from.
+        :param api_key: The api key to authenticate at the server.
+        :param retry_count: Retry this often if connection fails.
+        :param push_url: The url of the push channel, None to poll the settings.
         """
-        LOG.info("Settings loader started...")
-        while self._run_settings_loader:
-            try_count = 0
-            for try_count in range(self._retry_count):
-                if not self._run_settings_loader:
-                    break
+        self._name = name
+        self._url = url
+        self._api_key = api_key
+        self._retry_count = retry_count
+        self._push_url = push_url
 
-                try:
-                    # Try to read settings from server
-                    response = requests.get(self._url,
-                                            params={'name': self._name,
-                                                    'api_key': self._api_key})
-                    if response.status_code == HTTPStatus.FORBIDDEN:
-                        LOG.error(
-                            "Settings loader: Access denied. Please check your api key.")
-                        return
-
-                    # Try to read enabled state from settings and update elements with read state
-                    new_enabled = response.json().get('enabled', False)
-                    LOG.debug("Settings loader: Read setting 'enabled': %s", new_enabled)
-                    for entry in self.enabled_updater:
-                        entry.enabled = new_enabled
+    def _apply_settings(self, settings):
+        """
+        Updates the elements with the read settings.
 
-                    break
+        :param settings: The settings read from the server as dict.
+        """
+        # Try to read enabled state from settings and update elements with read state
+        new_enabled = settings.get('enabled', False)
+        LOG.debug("Settings loader: Read setting 'enabled': %s", new_enabled)
+        for entry in self.enabled_updater:
+            entry.enabled = new_enabled
+
+    def _load_settings(self):
+        """
+        Reads the settings once from the server.
+
+        :return: False if the settings could not be read and the thread should stop.
+        """
+        try_count = 0
+        while try_count < self._retry_count:
+            if not self._breaker.acquire_while(lambda: self._run_settings_loader):
+                break
 
-                except (requests.exceptions.ConnectionError, json.decoder.JSONDecodeError) as error:
+            try:
+                # Try to read settings from server
+                response = requests.get(self._url,
+                                        params={'name': self._name,
+                                                'api_key': self._api_key})
+                self._breaker.record_success(response.status_code == HTTPStatus.OK)
+                if response.status_code == HTTPStatus.FORBIDDEN:
                     LOG.error(
-                        "Settings loader: Error while connecting to server. Retrying...")
-                    LOG.error(error)
+                        "Settings loader: Access denied. Please check your api key.")
+                    return False
+
+                self._apply_settings(response.json())
+                break
+
+            except (requests.exceptions.ConnectionError, json.decoder.JSONDecodeError) as error:
+                LOG.error(
+                    "Settings loader: Error while connecting to server. Retrying...")
+                LOG.error(error)
+                # If the server is known to be unreachable, wait for it without using up the retries.
+                # Invalid json was sent by a reachable server.
+                if isinstance(error, json.decoder.JSONDecodeError) or not self._breaker.record_failure():
+                    try_count += 1
                     time.sleep(1)
+        else:
+            # Retries exceeded, stop settings loader
+            LOG.error("Settings loader: Failed to get settings after %s tries, giving up. "
+                      "Are you sure the server is up?", self._retry_count)
+            self._run_settings_loader = False
+            return False
+
+        return True
+
+    def _receive_pushes(self):
+        """
+        Subscribes to the push channel and applies all received settings until the connection is closed.
+        On reconnects, the id of the last received event is sent, so the server can resend missed changes.
+
+        Runs in a separate daemon thread, since a blocking read on the stream can not be interrupted.
+        Stops the settings loader if the access is denied.
+        """
+        headers = {'Accept': 'text/event-stream'}
+        if self._last_event_id is not None:
+            headers['Last-Event-ID'] = self._last_event_id
+
+        try:
+            with requests.get(self._push_url,
+                              params={'name': self._name, 'api_key': self._api_key},
+                              headers=headers, stream=True,
+                              timeout=(10, self._push_read_timeout)) as response:
+                self._breaker.record_success(response.status_code == HTTPStatus.OK)
+                if response.status_code == HTTPStatus.FORBIDDEN:
+                    LOG.error(
+                        "Settings loader: Access denied. Please check your api key.")
+                    self._run_settings_loader = False
+                    return
+
+                if response.status_code != HTTPStatus.OK or \
+                        not response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                    LOG.info("Settings loader: Push channel not available (status code %s), polling instead.",
+                             response.status_code)
+                    return
 
-            # Retries exceeded, stop uploader
-            if try_count == self._retry_count - 1:
-                LOG.error("Settings loader: Failed to get settings after %s tries, giving up. "
-                          "Are you sure the server is up?", self._retry_count)
-                self._run_settings_loader = False
+                LOG.info("Settings loader: Subscribed to push channel.")
+                self._push_backoff = 1
+                # Server-sent events are always utf-8, requests would fall back to latin-1 for text/* otherwise
+                response.encoding = 'utf-8'
+                # Read byte wise, otherwise events are only processed once a full chunk was received
+                for event_id, event_type, data in parse_server_sent_events(
+                        response.iter_lines(chunk_size=1, decode_unicode=True)):
+                    if not self._run_settings_loader:
+                        break
+
+                    if event_type == 'settings':
+                        self._apply_settings(json.loads(data))
+                    if event_id is not None:
+                        self._last_event_id = event_id
+
+            if self._run_settings_loader:
+                LOG.warning("Settings loader: Push channel closed, polling until resubscribing.")
+
+        except (requests.exceptions.RequestException, ValueError) as error:
+            # An idle channel is no failure, the server was reachable. Read timeouts of the stream are raised
+            # as connection errors by requests.
+            read_timeout = error.args and isinstance(error.args[0], ReadTimeoutError)
+            if isinstance(error, requests.exceptions.ConnectionError) and not read_timeout:
+                self._breaker.record_failure()
+            if self._run_settings_loader:
+                LOG.warning("Settings loader: Push channel closed, polling until resubscribing.")
+                LOG.warning(error)
+
+    def run(self):
+        """
+        Runs the thread.
+        """
+        LOG.info("Settings loader started...")
+        while self._run_settings_loader:
+            # Subscribing is no probe, polling tells once the server is reachable again
+            if self._push_url and time.monotonic() >= self._next_push_attempt and self._breaker.state == CLOSED:
+                receiver = Thread(target=self._receive_pushes, name='Settings push receiver', daemon=True)
+                receiver.start()
+                while self._run_settings_loader and receiver.is_alive():
+                    receiver.join(0.5)
+
+                # Poll once to not miss changes while resubscribing, then retry with increasing delays
+                self._next_push_attempt = time.monotonic() + self._push_backoff
+                self._push_backoff = min(self._push_backoff * 2, self._max_push_backoff)
+
+            if not self._run_settings_loader or not self._load_settings():
                 return
 
             # Wait until next iteration
             for _ in range(10):
-                time.sleep(1)
-                if not self._run_settings_loader:
+                if not self._run_settings_loader or \
+                        (self._push_url and time.monotonic() >= self._next_push_attempt):
                     break
+                time.sleep(1)
@@ -0,0 +1,167 @@
+import logging
+import os
+import time
+from threading import Thread
+
+from berry_cam.tracing import PROFILER
+
+LOG = logging.getLogger(__name__)
+
+# No throttling
+NORMAL = 0
+# Capture less often and pause between uploads
+WARM = 1
+# Additionally capture with a lower resolution
+HOT = 2
+
+LEVEL_NAMES = {NORMAL: 'normal', WARM: 'warm', HOT: 'hot'}
+
+
+class ThermalMonitor(Thread):
+    """
+    This thread regularly reads the SoC temperature and the system load and throttles capturing and
+    uploading if they get too high, so the pipeline does not stall once the SoC throttles itself.
+
+    The throttling is applied via the worker handles of the image capturing and uploader threads,
+    so it survives thread restarts.
+    """
+
+    def __init__(self, image_capturing=None, uploader=None,
+                 temperature_path='/sys/class/thermal/thermal_zone0/temp', load_path='/proc/loadavg',
+                 warm_temperature=70, hot_temperature=78, max_load=1.5, hysteresis=5, interval=10,
+                 warm_throttle=2, hot_throttle=4, hot_resolution=(640, 480), warm_upload_pause=0.5,
+                 hot_upload_pause=2, cpu_count=None):
+        """
+        Creates a new thermal monitor thread.
+
+        :param image_capturing: The worker handle of the image capturing thread to throttle.
+        :param uploader: The worker handle of the uploader thread to throttle.
+        :param temperature_path: The file to read the SoC temperature from, in millidegrees celsius.
+        :param load_path: The file to read the system load from, in /proc/loadavg format.
+        :param warm_temperature: The temperature in degrees celsius to start throttling.
+        :param hot_temperature: The temperature in degrees celsius to throttle harder.
+        :param max_load: The 1 minute load average per cpu to start throttling.
+        :param hysteresis: The temperature needs to drop this many degrees below a threshold to stop throttling.
+                           The load needs to drop by this many tenths.
+        :param interval: The time between two checks in seconds.
+        :param warm_throttle: The factor to increase the frame interval by if warm.
+        :param hot_throttle: The factor to increase the frame interval by if hot.
+        :param hot_resolution: The resolution to capture with if hot.
+        :param warm_upload_pause: The pause in seconds after each upload if warm.
+        :param hot_upload_pause: The pause in seconds after each upload if hot.
+        :param cpu_count: The amount of cpus to normalize the load with. Detected if not set.
+        """
+        super().__init__()
+        self._image_capturing = image_capturing
+        self._uploader = uploader
+        self._temperature_path = temperature_path
+        self._load_path = load_path
+        self._warm_temperature = warm_temperature
+        self._hot_temperature = hot_temperature
+        self._max_load = max_load
+        self._hysteresis = hysteresis
+        self._interval = interval
+        self._throttling = {
+            NORMAL: {'throttle': 1, 'capture_resize': None, 'upload_pause': 0},
+            WARM: {'throttle': warm_throttle, 'capture_resize': None, 'upload_pause': warm_upload_pause},
+            HOT: {'throttle': hot_throttle, 'capture_resize': tuple(hot_resolution),
+                  'upload_pause': hot_upload_pause}
+        }
+        self._cpu_count = cpu_count or os.cpu_count() or 1
+
+        self.level = NORMAL
+        self._unavailable = set()  # Paths that could not be read, only logged once
+
+        self._run_monitor = True
+
+    def stop(self):
+        """
+        Signals this thread to stop as soon as possible.
+        """
+        self._run_monitor = False
+
+    def _read(self, path):
+        """
+        Reads the first value of a sysfs or procfs file.
+
+        :param path: The path of the file.
+        :return: The value or None if the file can not be read.
+        """
+        try:
+            with open(path) as value_file:
+                value = float(value_file.read().split()[0])
+        except (OSError, ValueError, IndexError) as error:
+            if path not in self._unavailable:
+                LOG.warning("Thermal monitor: Can not read %s, ignoring it: %s", path, error)
+                self._unavailable.add(path)
+            return None
+
+        self._unavailable.discard(path)
+        return value
+
+    def _level_for(self, temperature, load):
+        """
+        Determines the throttling level. Thresholds of the current and lower levels are lowered by the
+        hysteresis, so the level does not flip on every check.
+
+        :param temperature: The SoC temperature in degrees celsius or None if unknown.
+        :param load: The load average per cpu or None if unknown.
+        :return: The throttling level.
+        """
+        def exceeds(value, threshold, level, hysteresis):
+            if value is None:
+                return False
+            return value >= (threshold - hysteresis if self.level >= level else threshold)
+
+        if exceeds(temperature, self._hot_temperature, HOT, self._hysteresis):
+            return HOT
+        if exceeds(temperature, self._warm_temperature, WARM, self._hysteresis) or \
+                exceeds(load, self._max_load, WARM, self._hysteresis / 10):
+            return WARM
+        return NORMAL
+
+    def check(self):
+        """
+        Reads temperature and load once and updates the throttling if needed.
+        """
+        temperature = self._read(self._temperature_path)
+        if temperature is not None:
+            temperature /= 1000
+        load = self._read(self._load_path)
+        if load is not None:
+            load /= self._cpu_count
+
+        level = self._level_for(temperature, load)
+        if level == self.level:
+            return
+
+        throttling = self._throttling[level]
+        message = "Thermal monitor: %s (temperature %s °C, load per cpu %s), %s: frame interval x%s, " \
+                  "resolution %s, upload pause %s s."
+        log = LOG.warning if level > self.level else LOG.info
+        log(message, LEVEL_NAMES[level],
+            'unknown' if temperature is None else '{:.1f}'.format(temperature),
+            'unknown' if load is None else '{:.2f}'.format(load),
+            'throttling' if level > NORMAL else 'stop throttling', throttling['throttle'],
+            throttling['capture_resize'] or 'unchanged', throttling['upload_pause'])
+
+        self.level = level
+        if self._image_capturing is not None:
+            self._image_capturing.configure(throttle=throttling['throttle'],
+                                            capture_resize=throttling['capture_resize'])
+        if self._uploader is not None:
+            self._uploader.configure(upload_pause=throttling['upload_pause'])
+
+    def run(self):
+        """
+        Runs the thread.
+        """
+        LOG.info("Thermal monitor started...")
+        while self._run_monitor:
+            PROFILER.poll()
+            self.check()
+
+            # Wait until next iteration
+            next_check = time.monotonic() + self._interval
+            while self._run_monitor and time.monotonic() < next_check:
+                time.sleep(max(0, min(0.5, next_check - time.monotonic())))
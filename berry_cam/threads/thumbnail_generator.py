@@ -0,0 +1,150 @@
+import logging
+import multiprocessing
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue, Empty, Full
+from threading import Thread
+
+from berry_cam.capture_record import IMAGE, as_record
+from berry_cam.images import create_thumbnail
+from berry_cam.threads.uploader import UploadProducer
+from berry_cam.tracing import PROFILER, TRACER, trace_id_for
+
+LOG = logging.getLogger(__name__)
+
+
+def _create_pool(workers):
+    """
+    Creates the pool of worker processes. The workers are started by a fork server, forking this process would
+    copy the locks other threads hold at that moment, e.g. of logging, and could deadlock the workers.
+
+    :param workers: The amount of worker processes. Uses one per cpu if None.
+    :return: The pool.
+    """
+    if sys.version_info < (3, 7):
+        # The start method can not be selected before Python 3.7
+        return ProcessPoolExecutor(workers)
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('forkserver'))
+
+
+class ThumbnailGenerator(Thread):
+    """
+    This thread creates a thumbnail of each captured image in a pool of worker processes, so all cores
+    can be used. The thumbnail is put into the upload queue before its image, so a preview is
+    available on the server fast. Images are forwarded in the order they were captured.
+
+    Needs Pillow, which is installed with the 'thumbnails' extra.
+    """
+
+    def __init__(self, upload_queue, input_queue=None, size=(160, 120), quality=75, workers=None):
+        """
+        Creates a new thumbnail generator thread.
+
+        :param upload_queue: The queue to put the thumbnails and images into.
+        :param input_queue: The queue to read the captured images from. Passing the queue of a previous
+                            generator keeps the pending images e.g. when restarting the generator.
+        :param size: The maximum width and height of the thumbnails.
+        :param quality: The jpeg quality of the thumbnails.
+        :param workers: The amount of worker processes. Uses one per cpu if not set.
+        """
+        super().__init__()
+        self._upload_queue = upload_queue
+        self._input_queue = input_queue if input_queue is not None else Queue()
+        self._size = tuple(size)
+        self._quality = quality
+        self._workers = workers
+
+        self.generated = 0  # Successfully created thumbnails
+        self.failed = 0  # Images forwarded without thumbnail
+
+        self._run_generator = True
+
+    @property
+    def input_queue(self):
+        """
+        Returns the input queue.
+
+        :return: A handle to which only new elements can be added, but not deleted.
+        """
+        return UploadProducer(self._input_queue)
+
+    def stop(self):
+        """
+        Signals this thread to stop as soon as possible. Thumbnails already being created are finished.
+        """
+        self._run_generator = False
+
+    def _put(self, item):
+        """
+        Puts a thumbnail or image into the upload queue.
+
+        :param item: The queued item.
+        """
+        # Blocks if the upload queue is full and configured to block, so keep checking for stop requests
+        while True:
+            try:
+                self._upload_queue.put(item, True, 0.5)
+                return
+            except Full:
+                if not self._run_generator:
+                    LOG.warning("Thumbnail generator: Thread stopped while upload queue was full, %s not queued.",
+                                as_record(item).path)
+                    return
+
+    def _forward_finished(self, pending, wait=False):
+        """
+        Puts the thumbnails and images of the finished jobs into the upload queue, keeping the capture order.
+
+        :param pending: The pending jobs as deque of (queued item, submit time, future or None if
+                        no thumbnail is created).
+        :param wait: If set, waits for all jobs to finish.
+        """
+        while pending and (wait or pending[0][2] is None or pending[0][2].done()):
+            image, submitted, future = pending.popleft()
+            if future is None:
+                # Nothing to create a thumbnail of
+                self._put(image)
+                self._input_queue.task_done()
+                continue
+
+            record = as_record(image)
+            try:
+                future.result()
+                self._put(record.thumbnail())
+                self.generated += 1
+                if TRACER.enabled:
+                    TRACER.record('thumbnail', trace_id_for(record.path), submitted, time.time() - submitted)
+            except Exception as error:
+                # Still upload the image, only the preview is missing
+                LOG.warning("Thumbnail generator: Could not create thumbnail of %s: %s", record.path, error)
+                self.failed += 1
+            self._put(image)
+            self._input_queue.task_done()
+
+    def run(self):
+        """
+        Runs the thread.
+        """
+        LOG.info("Thumbnail generator started...")
+        pending = deque()
+        with _create_pool(self._workers) as pool:
+            while self._run_generator:
+                PROFILER.poll()
+                self._forward_finished(pending)
+                try:
+                    # Check the running jobs more often
+                    image = self._input_queue.get(True, 0.05 if pending else 0.5)
+                except Empty:
+                    continue
+
+                record = as_record(image)
+                if record.kind != IMAGE:
+                    # Event archives are passed on in order
+                    pending.append((image, time.time(), None))
+                else:
+                    pending.append((image, time.time(),
+                                    pool.submit(create_thumbnail, record.path, self._size, self._quality)))
+
+            self._forward_finished(pending, wait=True)
@@ -2,17 +2,24 @@
 import logging
 import time
 from http import HTTPStatus
-from queue import Queue, Empty
+from queue import Queue, Empty, Full
 from threading import Thread
 
 import requests
 
+from berry_cam.capture_record import MANIFEST, THUMBNAIL, as_record
+from berry_cam.circuit_breaker import CircuitBreaker
+from berry_cam.event_archive import COMPRESSIONS, CONTENT_TYPES, NONE, stream_archive
+from berry_cam.images import content_hash
+from berry_cam.tracing import PROFILER, TRACER, trace_id_for
+
 LOG = logging.getLogger(__name__)
 
 
 class DeleteProtectedQueue:
     """
     A queue to only add or read elements, but not remove them.
+    Resolves each access dynamically, prefer the UploadProducer handle for hot paths.
     """
 
     def __init__(self, queue):
@@ -38,25 +45,78 @@ class DeleteProtectedQueue:
         return None
 
 
+class UploadProducer:
+    """
+    The handle of a producer to an upload queue. Only allows adding elements and reading the queue state,
+    but not removing elements.
+
+    The methods of the queue are bound once when the handle is created, so calls go directly to the queue.
+    """
+
+    __slots__ = ('put', 'put_nowait', 'full', 'qsize', 'empty', 'join')
+
+    def __init__(self, queue):
+        """
+        Creates a new producer handle.
+
+        :param queue: The queue to add elements to.
+        """
+        self.put = queue.put
+        self.put_nowait = queue.put_nowait
+        self.full = queue.full
+        self.qsize = queue.qsize
+        self.empty = queue.empty
+        self.join = queue.join
+
+
 class Uploader(Thread):
     """
     This thread will upload images put into upload_queue to an image server.
     """
 
-    def __init__(self, url, api_key, retry_count):
+    def __init__(self, url, api_key, retry_count, upload_queue=None, dedup=False, timeout=None, breaker=None,
+                 archive_url=None, archive_compression=NONE, name=None, image_store=None):
         """
         Creates a new uploader thread.
 
         :param url: The url to upload the images
         :param api_key: The api key to authenticate at the server
         :param retry_count: The amount of retries to upload before failing
+        :param upload_queue: The queue to read the images to upload from. Passing the queue of a previous
+                             uploader keeps the pending images e.g. when restarting the uploader.
+        :param dedup: If set, the server is asked via HEAD request whether it already has a picture
+                      before uploading it. Also sends the checksum as idempotency key.
+        :param timeout: The timeout for the requests to the server in seconds, None to wait forever.
+        :param breaker: The circuit breaker shared by all threads using the server. While the server is
+                        unreachable, the pictures stay queued instead of using up the retries.
+        :param archive_url: The url to upload event archives to. Queued event manifests are uploaded as
+                            archive of all frames of the event, see event_archive.
+        :param archive_compression: The compression of the event archives, one of event_archive.COMPRESSIONS.
+        :param name: The name of the camera, sent with the event archives.
+        :param image_store: The image store to mark the uploaded pictures in, so they are not queued again
+                            on the next start.
         """
+        if archive_compression not in COMPRESSIONS:
+            raise ValueError("Invalid archive compression '{}'. Can be one of {}".format(
+                archive_compression, COMPRESSIONS))
+
         super().__init__()
         self._url = url
         self._api_key = api_key
         self._retry_count = retry_count
+        self._dedup = dedup
+        self._timeout = timeout
+        self._breaker = breaker if breaker is not None else CircuitBreaker(None)
+        self._archive_url = archive_url
+        self._archive_compression = archive_compression
+        self._name = name
+        self._image_store = image_store
+
+        self.skipped_uploads = 0  # Pictures the server already had
+        self.upload_pause = 0  # Pause in seconds after each upload, e.g. updated by the thermal monitor
 
-        self._upload_queue = Queue()
+        self._session = requests.Session()
+        self._upload_queue = upload_queue if upload_queue is not None else Queue()
         self._run_uploader = True
 
     @property
@@ -64,9 +124,9 @@ class Uploader(Thread):
         """
         Returns the upload queue.
 
-        :return: A queue to which only new elements can be added, but not deleted.
+        :return: A handle to which only new elements can be added, but not deleted.
         """
-        return DeleteProtectedQueue(self._upload_queue)
+        return UploadProducer(self._upload_queue)
 
     def stop(self):
         """
@@ -74,61 +134,214 @@ class Uploader(Thread):
         """
         self._run_uploader = False
 
+    def reconfigure(self, url, api_key, retry_count, dedup=False, timeout=None, archive_url=None,
+                    archive_compression=NONE, name=None):
+        """
+        Updates the settings of the running thread. Applied from the next picture on, the queued pictures
+        are kept.
+
+        :param url: The url to upload the images
+        :param api_key: The api key to authenticate at the server
+        :param retry_count: The amount of retries to upload before failing
+        :param dedup: If set, the server is asked via HEAD request whether it already has a picture
+                      before uploading it.
+        :param timeout: The timeout for the requests to the server in seconds, None to wait forever.
+        :param archive_url: The url to upload event archives to.
+        :param archive_compression: The compression of the event archives, one of event_archive.COMPRESSIONS.
+        :param name: The name of the camera, sent with the event archives.
+        """
+        if archive_compression not in COMPRESSIONS:
+            raise ValueError("Invalid archive compression '{}'. Can be one of {}".format(
+                archive_compression, COMPRESSIONS))
+
+        self._url = url
+        self._api_key = api_key
+        self._retry_count = retry_count
+        self._dedup = dedup
+        self._timeout = timeout
+        self._archive_url = archive_url
+        self._archive_compression = archive_compression
+        self._name = name
+
+    def _exists_on_server(self, checksum):
+        """
+        Checks if the server already has a picture. Disables the check if the server does not support it.
+
+        :param checksum: The content checksum of the picture.
+        :return: True if the server already has the picture.
+        """
+        response = self._session.head(self._url,
+                                      params={'api_key': self._api_key, 'checksum': checksum},
+                                      timeout=self._timeout)
+        # Only asks for a picture, so it does not count as sign of life of the camera
+        self._breaker.record_success(False)
+        if response.status_code == HTTPStatus.OK:
+            return True
+
+        if response.status_code not in (HTTPStatus.NOT_FOUND, HTTPStatus.FORBIDDEN):
+            LOG.info("Uploader: Server does not support checking for existing pictures "
+                     "(status code %s), disabling the check.", response.status_code)
+            self._dedup = False
+        return False
+
+    def _mark_uploaded(self, record):
+        """
+        Marks a picture as uploaded in the image store. Thumbnails are not tracked by the image store.
+
+        :param CaptureRecord record: The record of the picture.
+        """
+        if self._image_store is not None and record.kind != THUMBNAIL:
+            self._image_store.mark_uploaded(record.path)
+
+    def _requeue(self, record):
+        """
+        Puts a picture that could not be uploaded back into the queue for the next uploader.
+
+        :param CaptureRecord record: The record of the picture.
+        """
+        record.retries += 1
+        try:
+            # Do not wait forever if the producer filled a bounded queue in the meantime
+            self._upload_queue.put(record, True, 1)
+        except Full:
+            LOG.error("Uploader: Upload queue full, dropping picture %s", record.path)
+
+    def _upload(self, record):
+        """
+        Uploads a single picture, retrying on connection errors.
+
+        :param CaptureRecord record: The record of the picture to upload.
+        :return: False if the uploader should stop, e.g. because the retries are exceeded.
+        """
+        picture = record.path
+        LOG.info("Uploading picture %s", picture)
+        if record.retries:
+            LOG.debug("Picture %s was requeued %s times before", picture, record.retries)
+        archive = record.kind == MANIFEST
+        # Event archives are traced on their own, they share the capture time with their first frame
+        trace_id = trace_id_for(picture, None if archive else record.capture_time)
+        if archive and not self._archive_url:
+            LOG.error("Uploader: No archive url configured, dropping event archive %s", picture)
+            return True
+
+        checksum = None
+        if self._dedup and not archive:
+            with TRACER.span('hash', trace_id):
+                checksum = content_hash(picture)
+
+        try_count = 0
+        while try_count < self._retry_count:
+            if not self._breaker.acquire_while(lambda: self._run_uploader):
+                # Stopped while the server is unreachable, keep the picture queued for the next uploader
+                self._requeue(record)
+                break
+
+            try:
+                # Avoid sending the picture again e.g. if the response of a previous upload got lost.
+                # Event archives have no checksum, they are always sent.
+                if checksum and self._dedup:
+                    with TRACER.span('exists', trace_id):
+                        exists = self._exists_on_server(checksum)
+                    if exists:
+                        LOG.info("Picture %s already on server, skipping upload", picture)
+                        self.skipped_uploads += 1
+                        self._mark_uploaded(record)
+                        break
+
+                data = {'api_key': self._api_key}
+                headers = {}
+                if checksum:
+                    data['checksum'] = checksum
+                    headers['Idempotency-Key'] = checksum
+                if record.thumbnail_of:
+                    # Lets the server attach the preview to the image uploaded later
+                    data['thumbnail_of'] = record.thumbnail_of
+                elif record.roi_of:
+                    # Lets the server restore the full frame from the key frame
+                    data['roi_of'] = record.roi_of
+                    data['roi'] = ','.join(str(coordinate) for coordinate in record.roi)
+
+                with TRACER.span('encode', trace_id):
+                    if archive:
+                        # The archive is packed while sending, so it is sent with chunked transfer encoding
+                        request = self._session.prepare_request(
+                            requests.Request('POST', self._archive_url,
+                                             params={'api_key': self._api_key, 'name': self._name},
+                                             headers={'Content-Type': CONTENT_TYPES[self._archive_compression]},
+                                             data=stream_archive(picture, self._archive_compression)))
+                    else:
+                        with open(picture, 'rb') as picture_file:
+                            request = self._session.prepare_request(
+                                requests.Request('POST', self._url, data=data, headers=headers,
+                                                 files={'file': (picture, picture_file, 'image/jpeg')}))
+
+                with TRACER.span('upload', trace_id):
+                    response = self._session.send(request, timeout=self._timeout)
+                self._breaker.record_success(response.status_code == HTTPStatus.OK)
+
+                if response.status_code == HTTPStatus.FORBIDDEN:
+                    LOG.error(
+                        "Uploader: Access denied. Please check your api key.")
+                    self._requeue(record)
+                    return False
+
+                if response.status_code == HTTPStatus.OK:
+                    LOG.info(
+                        "Upload succeeded after %s tries", try_count)
+                    self._mark_uploaded(record)
+                    break  # Wait for the next picture
+
+                if 'message' in response.json():
+                    LOG.error("Upload failed. Status code: %s, message: %s",
+                              response.status_code, response.json()['message'])
+                    if 'errors' in response.json():
+                        LOG.error(response.json()['errors'])
+                else:
+                    LOG.error("Upload failed. Status code: %s, message: %s",
+                              response.status_code, response.content)
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+                LOG.error(
+                    "Uploader: Error while connecting to server. Retrying...")
+                LOG.error(error)
+                # If the server is known to be unreachable, wait for it without using up the retries
+                if not self._breaker.record_failure():
+                    try_count += 1
+                    time.sleep(1)
+                continue
+
+            try_count += 1
+        else:
+            # Retries exceeded, stop uploader. Keep the picture queued for the next uploader.
+            LOG.error("Uploader: Failed to upload file after %s tries, giving up. "
+                      "Are you sure the server is up?", self._retry_count)
+            self._requeue(record)
+            return False
+
+        return True
+
     def run(self):
         """
         Runs the thread.
         """
         LOG.info("Uploader started...")
         while self._run_uploader:
+            PROFILER.poll()
             try:
-                picture = self._upload_queue.get(True, 0.5)
-
-                LOG.info("Uploading picture %s", picture)
-                try_count = 0
-                for try_count in range(self._retry_count):
-                    if not self._run_uploader:
-                        break
-
-                    picture_data = {
-                        'file': (picture, open(picture, 'rb'), 'image/jpeg')
-                    }
-                    try:
-                        response = requests.post(self._url,
-                                                 data={
-                                                     'api_key': self._api_key},
-                                                 files=picture_data)
-                        if response.status_code == HTTPStatus.FORBIDDEN:
-                            LOG.error(
-                                "Uploader: Access denied. Please check your api key.")
-                            return
-
-                        if response.status_code == HTTPStatus.OK:
-                            LOG.info(
-                                "Upload succeeded after %s tries", try_count)
-                            break  # Wait for the next picture
-
-                        if 'message' in response.json():
-                            LOG.error("Upload failed. Status code: %s, message: %s",
-                                      response.status_code, response.json()['message'])
-                            if 'errors' in response.json():
-                                LOG.error(response.json()['errors'])
-                        else:
-                            LOG.error("Upload failed. Status code: %s, message: %s",
-                                      response.status_code, response.content)
-
-                    except requests.exceptions.ConnectionError as error:
-                        LOG.error(
-                            "Uploader: Error while connecting to server. Retrying...")
-                        LOG.error(error)
-                        time.sleep(1)
-
-                # Retries exceeded, stop uploader
-                if try_count == self._retry_count - 1:
-                    LOG.error("Uploader: Failed to upload file after %s tries, giving up. "
-                              "Are you sure the server is up?", self._retry_count)
-                    return
+                record = as_record(self._upload_queue.get(True, 0.5))
 
             # If the queue is still empty, ignore it. Then check if we should stop the thread and
             # try to fetch images from queue again.
             except Empty:
-                pass
+                continue
+
+            try:
+                if not self._upload(record):
+                    return
+            finally:
+                self._upload_queue.task_done()
+
+            # Leave some cpu time to the other threads if throttled
+            pause_end = time.monotonic() + self.upload_pause
+            while self._run_uploader and time.monotonic() < pause_end:
+                time.sleep(max(0, min(0.5, pause_end - time.monotonic())))
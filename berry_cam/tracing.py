@@ -0,0 +1,236 @@
+"""
+Lightweight tracing and profiling for berry cam.
+
+The threads record spans for their processing stages (e.g. capturing, writing, uploading). All spans of an
+image share the same trace id, so the time an image spends in each stage can be analyzed afterwards.
+Tracing is disabled by default and then only costs a single attribute check per span.
+"""
+import cProfile
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+LOG = logging.getLogger(__name__)
+
+
+def trace_id_for(image_path, capture_time=None):
+    """
+    Returns the trace id for an image. The image name is unique, so it is used as trace id.
+
+    :param image_path: The path of the image.
+    :param capture_time: The capture time of the image. Images are named by it, so if it is set, it is used
+                         instead of the name, e.g. to trace cropped images and thumbnails as their captured frame.
+    :return: The trace id.
+    """
+    if capture_time is not None:
+        return str(capture_time)
+    return os.path.splitext(os.path.basename(image_path))[0]
+
+
+class _NullSpan:
+    """
+    A span that does nothing. Used if tracing is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """
+    A single measured stage.
+    """
+
+    __slots__ = ('_tracer', '_name', '_trace_id', '_start')
+
+    def __init__(self, tracer, name, trace_id):
+        self._tracer = tracer
+        self._name = name
+        self._trace_id = trace_id
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._tracer.record(self._name, self._trace_id, self._start, time.time() - self._start,
+                            exc_type is None)
+        return False
+
+
+class Tracer:
+    """
+    Collects spans and exports them as json lines or in chrome trace format.
+    """
+
+    def __init__(self, max_spans=100000):
+        """
+        Creates a new tracer.
+
+        :param max_spans: The maximum amount of spans to keep. Older spans will be discarded.
+        """
+        self.enabled = False
+        self._spans = deque(maxlen=max_spans)
+
+    def span(self, name, trace_id=None):
+        """
+        Returns a context manager measuring the time of a stage.
+
+        :param name: The name of the stage, e.g. 'capture'.
+        :param trace_id: The id of the traced image.
+        :return: The span to be used in a with statement.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, trace_id)
+
+    def record(self, name, trace_id, start, duration, success=True):
+        """
+        Records a finished span.
+
+        :param name: The name of the stage.
+        :param trace_id: The id of the traced image.
+        :param start: The start time as unix timestamp.
+        :param duration: The duration in seconds.
+        :param success: False if the stage failed with an exception.
+        """
+        self._spans.append({
+            'name': name,
+            'trace_id': trace_id,
+            'start': start,
+            'duration': duration,
+            'thread': threading.current_thread().name,
+            'success': success
+        })
+
+    @property
+    def spans(self):
+        """
+        Returns the recorded spans.
+
+        :return: A list of the recorded spans, oldest first.
+        """
+        return list(self._spans)
+
+    def clear(self):
+        """
+        Removes all recorded spans.
+        """
+        self._spans.clear()
+
+    def export_json_lines(self, output):
+        """
+        Writes all recorded spans as json lines.
+
+        :param output: A writable text file.
+        """
+        for span in self.spans:
+            output.write(json.dumps(span))
+            output.write('\n')
+
+    def export_chrome_trace(self, output):
+        """
+        Writes all recorded spans in chrome trace format, to be viewed e.g. in chrome://tracing.
+
+        :param output: A writable text file.
+        """
+        events = [{
+            'name': span['name'],
+            'cat': 'berry_cam',
+            'ph': 'X',
+            'ts': span['start'] * 1e6,
+            'dur': span['duration'] * 1e6,
+            'pid': os.getpid(),
+            'tid': span['thread'],
+            'args': {'trace_id': span['trace_id'], 'success': span['success']}
+        } for span in self.spans]
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, output)
+
+    def export(self, path, trace_format='jsonl'):
+        """
+        Writes all recorded spans to a file.
+
+        :param path: The file to write to.
+        :param trace_format: Either 'jsonl' or 'chrome'.
+        """
+        with open(path, 'w') as output:
+            if trace_format == 'chrome':
+                self.export_chrome_trace(output)
+            else:
+                self.export_json_lines(output)
+
+
+class ProfileSwitch:
+    """
+    Enables cProfile in all polling threads for a limited time window while the daemon keeps running.
+    cProfile only profiles the thread that enabled it, so each thread needs to call poll() regularly.
+    """
+
+    def __init__(self):
+        """
+        Creates a new profile switch.
+        """
+        self._until = 0
+        self._local = threading.local()
+        self.output_dir = tempfile.gettempdir()
+
+    @property
+    def active(self):
+        """
+        Returns if the profiling window is currently open.
+
+        :return: True if the threads should profile.
+        """
+        return time.monotonic() < self._until
+
+    def start(self, duration, output_dir=None):
+        """
+        Opens a profiling window.
+
+        :param duration: The duration of the window in seconds.
+        :param output_dir: The directory to write the profiles to. One file per thread will be written.
+        """
+        if output_dir:
+            self.output_dir = output_dir
+        LOG.info("Profiling for %s seconds, writing results to %s", duration, self.output_dir)
+        self._until = time.monotonic() + duration
+
+    def poll(self):
+        """
+        Starts or stops profiling of the current thread depending on the profiling window.
+        """
+        profile = getattr(self._local, 'profile', None)
+        if self.active:
+            if profile is None:
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError as error:  # Another profiler is already active
+                    LOG.warning("Profiling not possible: %s", error)
+                    self._until = 0
+                    return
+                self._local.profile = profile
+
+        elif profile is not None:
+            profile.disable()
+            self._local.profile = None
+            profile_path = os.path.join(self.output_dir, '{}-{}.prof'.format(
+                threading.current_thread().name, int(time.time())))
+            profile.dump_stats(profile_path)
+            LOG.info("Profile written to %s", profile_path)
+
+
+# The tracer and profile switch used by the threads.
+TRACER = Tracer()
+PROFILER = ProfileSwitch()
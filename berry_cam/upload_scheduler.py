@@ -0,0 +1,367 @@
+"""
+Scheduling of the images to upload.
+"""
+import heapq
+import itertools
+import logging
+import os
+import time
+from queue import Queue
+
+from berry_cam.capture_record import IMAGE, MANIFEST, THUMBNAIL, CaptureRecord, as_record
+from berry_cam.images import create_thumbnail
+
+LOG = logging.getLogger(__name__)
+
+# Upload in capture order
+FIFO = 'fifo'
+# Upload the first frames of the newest events first, then the remaining frames of the newest events.
+NEWEST_EVENT_FIRST = 'newest_event_first'
+
+POLICIES = (FIFO, NEWEST_EVENT_FIRST)
+
+# Block the producer until an image was uploaded
+BLOCK = 'block'
+# Drop the image that is queued the longest
+DROP_OLDEST = 'drop_oldest'
+# Drop the new image
+DROP_NEWEST = 'drop_newest'
+# Drop an image from the middle of the event with the most queued images, keeping the first and last frames
+THIN = 'thin'
+
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, THIN)
+
+# Upload a thumbnail instead of the stale image. Needs Pillow.
+STALE_THUMBNAIL = 'thumbnail'
+# Upload the stale image after all other images
+STALE_ARCHIVE = 'archive'
+# Do not upload the stale image
+STALE_DROP = 'drop'
+
+STALE_POLICIES = (STALE_THUMBNAIL, STALE_ARCHIVE, STALE_DROP)
+
+# Priority of the archived stale images, after all other images
+_ARCHIVE_TIER = 2
+
+
+def _is_protected(record):
+    """
+    Checks if an image must not be dropped. Event manifests are always protected, as the frames they list
+    are only uploaded with them.
+
+    :param CaptureRecord record: The record of the image.
+    :return: True if the image is protected.
+    """
+    return record.protected or record.kind == MANIFEST
+
+
+class UploadScheduler(Queue):
+    """
+    An upload queue that orders the images by a scheduling policy instead of strict FIFO.
+
+    Images are grouped into motion events by their capture time: an image captured more than
+    event_gap seconds after the previous image starts a new event. With the 'newest_event_first'
+    policy, the key frames (the first frames of each event) of the newest events are uploaded first,
+    so the server gets an image of a new event fast even if a large backlog is pending.
+    Thumbnails are uploaded before all full resolution images, newest first.
+
+    If the queue is bounded, the overflow policy decides which image to drop if a new image is put into
+    the full queue. With the 'block' policy, the producer waits until an image was uploaded instead.
+
+    If a maximum age is set, images captured longer ago are stale once they are taken from the queue,
+    e.g. after a long outage. Depending on the stale policy, they are replaced by a thumbnail, moved behind
+    all other images or dropped, so current images are not delayed by old ones.
+
+    Protected images, e.g. the key frames of cropped images and event manifests, are neither dropped nor
+    replaced. Stale protected images are moved behind all other images. Only if nothing else is queued,
+    a protected image is dropped to keep the queue bounded.
+    """
+
+    def __init__(self, policy=NEWEST_EVENT_FIRST, event_gap=2, key_frames=1, maxsize=0, overflow=BLOCK,
+                 delete_dropped=True, max_age=None, stale_policy=STALE_ARCHIVE, clock=time.time):
+        """
+        Creates a new upload scheduler.
+
+        :param policy: The scheduling policy, one of POLICIES.
+        :param event_gap: The time between two images in seconds that starts a new event.
+        :param key_frames: The amount of frames at the start of each event that are prioritized.
+        :param maxsize: The maximum amount of images in the queue, 0 for unlimited.
+        :param overflow: The policy if the queue is full, one of OVERFLOW_POLICIES.
+        :param delete_dropped: If set, the files of dropped images are deleted. Also applies to stale images
+                               that were dropped or replaced by a thumbnail.
+        :param max_age: The time in seconds after the capture an image is stale. Images never get stale if None.
+        :param stale_policy: The policy for stale images, one of STALE_POLICIES.
+        :param clock: The wall clock to compare the capture times with.
+        """
+        if policy not in POLICIES:
+            raise ValueError("Invalid scheduling policy '{}'. Can be one of {}".format(policy, POLICIES))
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Invalid overflow policy '{}'. Can be one of {}".format(overflow, OVERFLOW_POLICIES))
+        if stale_policy not in STALE_POLICIES:
+            raise ValueError("Invalid stale policy '{}'. Can be one of {}".format(stale_policy, STALE_POLICIES))
+
+        self._policy = policy
+        self._event_gap = event_gap
+        self._key_frames = key_frames
+        self._overflow = overflow
+        self._delete_dropped = delete_dropped
+        self._max_age = max_age
+        self._stale_policy = stale_policy
+        self._clock = clock
+        self.dropped = 0  # Images dropped since the queue was full
+        self.downgraded = 0  # Stale images replaced by a thumbnail
+        self.archived = 0  # Stale images moved behind all other images
+        self.expired = 0  # Stale images dropped
+        super().__init__(maxsize)
+
+    def put(self, item, block=True, timeout=None):
+        """
+        Puts an image into the queue. If the queue is full, an image is dropped depending on the overflow policy.
+
+        :param item: The path of the image.
+        :param block: Only used by the 'block' policy, see Queue.put().
+        :param timeout: Only used by the 'block' policy, see Queue.put().
+        """
+        if self._overflow == BLOCK or self.maxsize <= 0:
+            super().put(item, block, timeout)
+            return
+
+        protected = _is_protected(as_record(item))
+        with self.not_full:
+            dropped = None
+            if self._qsize() < self.maxsize:
+                self.unfinished_tasks += 1
+            else:
+                index = None
+                if self._overflow != DROP_NEWEST or protected:
+                    index = self._select_thinned() if self._overflow == THIN else None
+                    if index is None:
+                        index = self._select_oldest(protected)
+
+                if index is None:
+                    # Drops the new image instead
+                    dropped = os.fspath(item)
+                    item = None
+                else:
+                    # Replaces the dropped image, so the amount of unfinished tasks stays the same
+                    dropped = self._remove(index)
+
+            if item is not None:
+                self._put(item)
+                self.not_empty.notify()
+            if dropped is not None:
+                self.dropped += 1
+
+        if dropped is not None:
+            self._drop(dropped)
+
+    def get(self, block=True, timeout=None):
+        """
+        Removes and returns the next image from the queue. Stale images are handled by the stale policy.
+
+        :param block: See Queue.get().
+        :param timeout: See Queue.get().
+        :return: The record or path of the image to upload.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            item = super().get(block, None if deadline is None else max(0, deadline - time.monotonic()))
+            record = as_record(item)
+            if not self._is_stale(item, record):
+                return item
+
+            LOG.warning("Upload queue: Images older than %s s are stale ('%s' policy).", self._max_age,
+                        self._stale_policy)
+            LOG.debug("Stale image %s", record.path)
+            if self._stale_policy == STALE_ARCHIVE or _is_protected(record):
+                with self.mutex:
+                    # Replaces the taken image, so the amount of unfinished tasks stays the same
+                    self._archived.add(item)
+                    heapq.heappush(self.queue, ((_ARCHIVE_TIER, -record.capture_time, 0, next(self._counter)),
+                                                item, record))
+                    self.archived += 1
+                    self.not_empty.notify()
+            elif self._stale_policy == STALE_DROP:
+                self.expired += 1
+                self._delete(record.path)
+                self.task_done()
+            else:
+                thumbnail = self._downgrade(item, record)
+                if thumbnail is not None:
+                    return thumbnail
+
+    def _is_stale(self, item, record):
+        """
+        Checks if an image taken from the queue is stale. Archived images are not checked again.
+
+        :param item: The queued item.
+        :param CaptureRecord record: The record of the item.
+        :return: True if the image is stale.
+        """
+        if self._max_age is None:
+            return False
+        with self.mutex:
+            if item in self._archived:
+                self._archived.discard(item)
+                return False
+        return record.capture_time is not None and self._clock() - record.capture_time > self._max_age
+
+    def _downgrade(self, item, record):
+        """
+        Replaces a stale image by its thumbnail. Thumbnails and event manifests are uploaded unchanged.
+
+        :param item: The queued item.
+        :param CaptureRecord record: The record of the item.
+        :return: The item to upload instead or None if the thumbnail was already created before.
+        """
+        if record.kind != IMAGE:
+            return item
+
+        thumbnail = record.thumbnail()
+        if os.path.exists(thumbnail.path):
+            # Created by the thumbnail generator, so it is already queued or uploaded
+            self.downgraded += 1
+            self._delete(record.path)
+            self.task_done()
+            return None
+
+        try:
+            create_thumbnail(record.path)
+        except (ImportError, OSError) as error:
+            LOG.warning("Could not create thumbnail of stale image %s, uploading it: %s", record.path, error)
+            return item
+        self.downgraded += 1
+        self._delete(record.path)
+        # Keep the type of the queued items, producers may still queue paths
+        return thumbnail if isinstance(item, CaptureRecord) else thumbnail.path
+
+    def _drop(self, image_path):
+        """
+        Handles a dropped image.
+
+        :param image_path: The path of the dropped image.
+        """
+        LOG.warning("Upload queue full, dropping images ('%s' policy).", self._overflow)
+        LOG.debug("Dropped image %s", image_path)
+        self._delete(image_path)
+
+    def _delete(self, image_path):
+        """
+        Deletes the file of an image that is not uploaded, if configured.
+
+        :param image_path: The path of the image.
+        """
+        if self._delete_dropped:
+            try:
+                os.remove(image_path)
+            except OSError as error:
+                LOG.warning("Could not delete dropped image %s: %s", image_path, error)
+
+    def _select_oldest(self, protected=False):
+        """
+        Selects the unprotected image queued the longest. Needs to be called with the queue lock held.
+
+        :param protected: If set, the new image is protected. Then a protected image is selected if
+                          only protected images are queued, to keep the queue bounded.
+        :return: The index of the image in the heap or None if the new image should be dropped instead.
+        """
+        indexes = [index for index, entry in enumerate(self.queue) if not _is_protected(entry[2])]
+        if not indexes:
+            if not protected:
+                return None
+            indexes = range(len(self.queue))
+        return min(indexes, key=lambda index: self.queue[index][0][-1])
+
+    def _remove(self, index):
+        """
+        Removes an image from the queue. Needs to be called with the queue lock held.
+
+        :param index: The index of the image in the heap.
+        :return: The removed image.
+        """
+        entry = self.queue[index]
+        self.queue[index] = self.queue[-1]
+        self.queue.pop()
+        heapq.heapify(self.queue)
+        self._archived.discard(entry[1])
+        return entry[2].path
+
+    def _select_thinned(self):
+        """
+        Selects the image to drop to thin out the event with the most queued images. From this event,
+        the image whose neighbours are closest is dropped, so the remaining images are evenly spread.
+        Key frames, protected images and the last frame of each event are kept.
+        Needs to be called with the queue lock held.
+
+        :return: The index of the image in the heap or None if there is no event to thin out.
+        """
+        images = sorted((entry[2].capture_time, index) for index, entry in enumerate(self.queue)
+                        if entry[2].kind != THUMBNAIL and entry[2].capture_time is not None)
+
+        events = []
+        for image in images:
+            if not events or image[0] - events[-1][-1][0] > self._event_gap:
+                events.append([])
+            events[-1].append(image)
+
+        largest = max(events, key=len, default=[])
+        candidates = [frame for frame in range(max(self._key_frames, 1), len(largest) - 1)
+                      if not _is_protected(self.queue[largest[frame][1]][2])]
+        if not candidates:
+            return None
+        selected = min(candidates, key=lambda frame: largest[frame + 1][0] - largest[frame - 1][0])
+        return largest[selected][1]
+
+    # The following methods are called by Queue with the queue lock held
+
+    def _init(self, maxsize):
+        self.queue = []
+        self._archived = set()  # Stale images moved behind all other images, they are not checked again
+        self._counter = itertools.count()
+        self._event = 0
+        self._frame_index = 0
+        self._last_capture_time = None
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        record = as_record(item)
+        heapq.heappush(self.queue, (self._priority(record), item, record))
+
+    def _get(self):
+        return heapq.heappop(self.queue)[1]
+
+    def _priority(self, record):
+        """
+        Calculates the priority of a new image. Lower values are uploaded first.
+
+        :param CaptureRecord record: The record of the image.
+        :return: The priority as sortable tuple.
+        """
+        sequence = next(self._counter)
+        if self._policy == FIFO:
+            return (0, sequence)
+
+        image_time = record.capture_time
+        if image_time is None:
+            # Unknown capture time, upload after the key frames in the order the images were added
+            return (0, 0, 0, sequence)
+
+        if record.kind == THUMBNAIL:
+            # Previews are small, upload them before all full resolution images
+            return (-1, -image_time, 0, sequence)
+
+        if self._last_capture_time is not None and image_time < self._last_capture_time:
+            # Re-added older image, e.g. after a failed upload. Upload after all other images.
+            return (1, 0, 0, sequence)
+
+        if self._last_capture_time is None or image_time - self._last_capture_time > self._event_gap:
+            self._event += 1
+            self._frame_index = 0
+        else:
+            self._frame_index += 1
+        self._last_capture_time = image_time
+
+        is_key_frame = self._frame_index < self._key_frames
+        return (0 if is_key_frame else 1, -self._event, self._frame_index, sequence)
@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 
 common_packages = [
     'pyyaml', 'requests'
@@ -11,14 +11,22 @@ setup(
                 'via PIR sensor. Images are directly uploaded to a server.',
     author='Felix Wohlfrom',
     author_email='FelixWohlfrom@users.noreply.github.com',
-    packages=['berry_cam'],
+    packages=['berry_cam', 'berry_cam.threads'],
     install_requires=common_packages,
+    entry_points={
+        'console_scripts': [
+            'berry_cam = berry_cam.run_cam:main'
+        ]
+    },
     extras_require={
         # TODO: Add this dynamically if on raspi
         'raspi': [
             'RPi.GPIO',
             'picamera'
         ],
+        'thumbnails': [
+            'Pillow'
+        ],
         'test': [
             'pytest', 'coverage', 'fake_rpi', 'testfixtures', 'requests-mock'
         ]
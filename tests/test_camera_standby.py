@@ -0,0 +1,126 @@
+import pytest
+
+from berry_cam.camera_standby import LOCK, METER, OFF, CameraStandby
+
+
+class FakeCamera:
+    """
+    A camera recording the metering captures.
+    """
+
+    def __init__(self):
+        self.captures = []
+        self.shutter_speed = 0
+        self.exposure_speed = 8000
+        self.exposure_mode = 'auto'
+        self.awb_mode = 'auto'
+        self.awb_gains = (1.5, 1.2)
+
+    def capture(self, output, format=None, use_video_port=False, resize=None):
+        self.captures.append((format, use_video_port, resize))
+
+
+class FakeClock:
+    """
+    A manually advanced clock.
+    """
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_invalid_mode():
+    """
+    Verifies that an invalid standby mode is rejected.
+    """
+
+    with pytest.raises(ValueError):
+        CameraStandby(FakeCamera(), 'invalid')
+
+
+def test_off():
+    """
+    Verifies that the camera is not used if standby is off.
+    """
+
+    camera = FakeCamera()
+    standby = CameraStandby(camera, OFF)
+    standby.idle()
+
+    assert camera.captures == []
+
+
+def test_meter():
+    """
+    Verifies that small metering frames are captured in the given interval.
+    """
+
+    camera = FakeCamera()
+    clock = FakeClock()
+    standby = CameraStandby(camera, METER, interval=10, metering_resolution=(64, 48), clock=clock)
+
+    standby.idle()
+    clock.now = 5
+    standby.idle()
+    assert camera.captures == [('jpeg', True, (64, 48))]
+
+    clock.now = 10
+    standby.idle()
+    assert standby.meterings == 2
+
+
+def test_lock():
+    """
+    Verifies that exposure and white balance are locked after settling and unlocked for refreshing.
+    """
+
+    camera = FakeCamera()
+    clock = FakeClock()
+    standby = CameraStandby(camera, LOCK, interval=10, settle_time=2, clock=clock)
+
+    # Unlocked for metering first
+    standby.idle()
+    assert camera.exposure_mode == 'auto'
+
+    # Locked after settling
+    clock.now = 2
+    standby.idle()
+    assert camera.exposure_mode == 'off'
+    assert camera.awb_mode == 'off'
+    assert camera.shutter_speed == 8000
+    assert camera.awb_gains == (1.5, 1.2)
+
+    # Unlocked again for refreshing
+    clock.now = 12
+    standby.idle()
+    assert camera.exposure_mode == 'auto'
+    assert camera.shutter_speed == 0
+    assert standby.meterings == 3
+
+
+def test_wake_unlocks():
+    """
+    Verifies that locked values are released on motion and locked again afterwards.
+    """
+
+    camera = FakeCamera()
+    clock = FakeClock()
+    standby = CameraStandby(camera, LOCK, interval=10, settle_time=2, clock=clock)
+    standby.idle()
+    clock.now = 2
+    standby.idle()
+    assert camera.exposure_mode == 'off'
+
+    standby.wake()
+    assert camera.exposure_mode == 'auto'
+    assert camera.awb_mode == 'auto'
+
+    # Relocked after the motion
+    clock.now = 3
+    standby.idle()
+    clock.now = 5
+    standby.idle()
+    assert camera.exposure_mode == 'off'
@@ -0,0 +1,108 @@
+import pytest
+
+from berry_cam.capture_scheduler import CaptureScheduler
+
+
+class FakeClock:
+    """
+    A manually advanced clock.
+    """
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def capture(scheduler, clock, duration, capture_time=0.1):
+    """
+    Simulates the capture loop for some time.
+
+    :param CaptureScheduler scheduler: The scheduler to use.
+    :param FakeClock clock: The clock of the scheduler.
+    :param duration: The simulated time in seconds.
+    :param capture_time: The time a capture takes in seconds.
+    :return: The times the captures started.
+    """
+    captures = []
+    end = clock.now + duration
+    while clock.now < end:
+        if scheduler.due():
+            captures.append(clock.now)
+            clock.now += capture_time
+            scheduler.captured()
+        clock.now += scheduler.wait_time()
+    return captures
+
+
+def test_invalid_intervals():
+    """
+    Verifies that invalid intervals are rejected.
+    """
+
+    with pytest.raises(ValueError):
+        CaptureScheduler(0)
+    with pytest.raises(ValueError):
+        CaptureScheduler(1, max_interval=0.5)
+
+
+def test_no_drift():
+    """
+    Verifies that the captures are scheduled independent of the capture time.
+    """
+
+    clock = FakeClock()
+    scheduler = CaptureScheduler(0.5, clock=clock)
+    scheduler.start()
+
+    assert capture(scheduler, clock, 2.1, capture_time=0.2) == pytest.approx([0, 0.5, 1, 1.5, 2])
+    assert scheduler.finish() == pytest.approx((2, 2))
+
+
+def test_slow_capture():
+    """
+    Verifies that frames are skipped instead of captured in a burst if capturing takes too long.
+    """
+
+    clock = FakeClock()
+    scheduler = CaptureScheduler(0.5, clock=clock)
+    scheduler.start()
+
+    assert capture(scheduler, clock, 2.1, capture_time=0.7) == pytest.approx([0, 1, 2])
+    assert scheduler.skipped == 2
+    assert scheduler.finish() == pytest.approx((1, 2))
+
+
+def test_adaptive_interval():
+    """
+    Verifies that the interval grows to the maximum interval while the motion lasts.
+    """
+
+    clock = FakeClock()
+    scheduler = CaptureScheduler(0.5, max_interval=2, ramp_time=3, clock=clock)
+    scheduler.start()
+
+    captures = capture(scheduler, clock, 10, capture_time=0)
+    intervals = [second - first for first, second in zip(captures, captures[1:])]
+    assert intervals[0] == pytest.approx(0.5)
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == pytest.approx(2)
+
+    # The next motion starts with the target interval again
+    scheduler.finish()
+    scheduler.start()
+    assert scheduler.interval == 0.5
+
+
+def test_single_frame():
+    """
+    Verifies that no rates are reported for motions with a single frame.
+    """
+
+    clock = FakeClock()
+    scheduler = CaptureScheduler(0.5, clock=clock)
+    scheduler.start()
+    capture(scheduler, clock, 0.3)
+
+    assert scheduler.finish() is None
@@ -0,0 +1,125 @@
+import time
+from threading import Thread
+
+from berry_cam.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def test_disabled():
+    """
+    Verifies that the circuit never opens without failure threshold.
+    """
+
+    breaker = CircuitBreaker(None)
+    for _ in range(10):
+        assert not breaker.record_failure()
+
+    assert breaker.state == CLOSED
+    assert breaker.acquire(0)
+
+
+def test_open_after_failures():
+    """
+    Verifies that the circuit opens after the failure threshold and requests are rejected immediately.
+    """
+
+    breaker = CircuitBreaker(3, reset_timeout=10)
+    assert not breaker.record_failure()
+    breaker.record_success()  # Only failures in a row count
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert breaker.trips == 1
+    assert not breaker.acquire(0.1)
+
+
+def test_single_probe():
+    """
+    Verifies that only a single probe is sent once the reset timeout passed.
+    """
+
+    breaker = CircuitBreaker(1, reset_timeout=0.2)
+    breaker.record_failure()
+
+    assert breaker.acquire(1)
+    assert breaker.state == HALF_OPEN
+    assert not breaker.acquire(0.1)
+
+
+def test_probe_success_resumes_waiting():
+    """
+    Verifies that all waiting callers continue once the probe succeeded.
+    """
+
+    breaker = CircuitBreaker(1, reset_timeout=0.2)
+    breaker.record_failure()
+    assert breaker.acquire(1)  # The probe
+
+    results = []
+    waiting = [Thread(target=lambda: results.append(breaker.acquire(2))) for _ in range(3)]
+    for thread in waiting:
+        thread.start()
+    time.sleep(0.1)
+    assert not results
+
+    breaker.record_success()
+    for thread in waiting:
+        thread.join(1)
+    assert results == [True, True, True]
+    assert breaker.state == CLOSED
+
+
+def test_probe_failure():
+    """
+    Verifies that the circuit opens again with a doubled reset timeout if the probe failed.
+    """
+
+    breaker = CircuitBreaker(1, reset_timeout=0.2)
+    breaker.record_failure()
+    assert breaker.acquire(1)
+    assert breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert not breaker.acquire(0.3)
+    assert breaker.acquire(0.3)
+
+
+def test_probe_timeout():
+    """
+    Verifies that another probe is sent if the result of a probe is not recorded.
+    """
+
+    breaker = CircuitBreaker(1, reset_timeout=0, probe_timeout=0.2)
+    breaker.record_failure()
+    assert breaker.acquire(0)
+    assert not breaker.acquire(0.1)
+    assert breaker.acquire(0.3)
+
+
+def test_acquire_while():
+    """
+    Verifies that waiting stops if the caller was stopped.
+    """
+
+    breaker = CircuitBreaker(1, reset_timeout=10)
+    breaker.record_failure()
+
+    stop_at = time.monotonic() + 0.3
+    assert not breaker.acquire_while(lambda: time.monotonic() < stop_at, 0.1)
+
+
+def test_last_success_only_for_accepted_requests():
+    """
+    Verifies that rejected requests close the circuit, but do not count as last success.
+    """
+
+    breaker = CircuitBreaker(1, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_success(False)
+
+    assert breaker.state == CLOSED
+    assert breaker.last_success is None
+
+    breaker.record_success()
+    assert breaker.last_success is not None
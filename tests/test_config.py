@@ -0,0 +1,82 @@
+import pytest
+
+from berry_cam.config import ConfigError, load_config, needs_restart, update_config
+
+CONFIG = """
+camera:
+  name: Test-Camera
+  image_location: /tmp/images
+image_server:
+  server_url: http://localhost
+  api_key: key
+  retry_count: 2
+pir:
+  number_type: BCM
+  pin: 23
+  reset_time: 1
+"""
+
+
+def write_config(tmpdir, text):
+    """
+    Writes a configuration file.
+
+    :param tmpdir: The directory to write the file to.
+    :param text: The yaml text.
+    :return: The path of the file.
+    """
+    path = tmpdir.join('conf.yaml')
+    path.write(text)
+    return str(path)
+
+
+def test_load_config(tmpdir):
+    """
+    Verifies that a valid configuration is loaded and missing optional sections are created.
+    """
+
+    config = load_config(write_config(tmpdir, CONFIG))
+
+    assert config['camera']['name'] == 'Test-Camera'
+    assert config['upload'] == {}
+    assert config['heartbeat'] == {}
+
+
+@pytest.mark.parametrize('text, message', [
+    (CONFIG.replace('  api_key: key\n', ''), "'image_server.api_key' needs to be set."),
+    (CONFIG.replace('retry_count: 2', 'retry_count: two'), "'image_server.retry_count' needs to be an integer"),
+    (CONFIG.replace('reset_time: 1', 'reset_time: -1'), "'pir.reset_time' needs to be a number of at least 0"),
+    (CONFIG + 'upload:\n  scheduling: random\n', "Invalid 'upload.scheduling' 'random'"),
+    (CONFIG.replace('  number_type: BCM\n', ''), "Invalid 'pir.number_type' None"),
+    ('camera: [', "Can not read"),
+    ('- camera', "The configuration needs to be a mapping."),
+])
+def test_invalid_config(tmpdir, text, message):
+    """
+    Verifies that invalid configurations are rejected with a message naming the setting.
+    """
+
+    with pytest.raises(ConfigError) as error:
+        load_config(write_config(tmpdir, text))
+
+    assert message in str(error.value)
+
+
+def test_update_config():
+    """
+    Verifies that a configuration is updated in place and the changed settings are reported.
+    """
+
+    config = {'camera': {'name': 'Camera', 'frame_interval': 0.5}, 'pir': {'pin': 23}, 'upload': {'dedup': True}}
+    camera = config['camera']
+
+    changed = update_config(config, {'camera': {'name': 'Camera', 'frame_interval': 0.2}, 'pir': {'pin': 24},
+                                     'heartbeat': {'interval': 10}})
+
+    assert changed == ['upload', 'camera.frame_interval', 'pir.pin', 'heartbeat']
+    assert config['camera'] is camera
+    assert camera['frame_interval'] == 0.2
+    assert 'upload' not in config
+    assert needs_restart(changed) == changed
+    assert needs_restart(['pir.reset_time', 'camera.frame_interval', 'camera.name', 'thermal.hot_temperature']) == \
+        ['camera.frame_interval', 'thermal.hot_temperature']
@@ -0,0 +1,75 @@
+import io
+import os
+import shutil
+import tarfile
+
+import pytest
+
+from berry_cam.event_archive import GZIP, NONE, is_manifest, read_manifest, stream_archive, write_manifest
+from berry_cam.images import capture_time
+
+TESTIMAGE = os.path.realpath(
+    os.path.join(os.path.dirname(__file__), 'test_data', 'test.jpg'))
+
+
+def create_event(directory, frames=3):
+    """
+    Creates the frames and manifest of an event.
+
+    :param directory: The directory to store the event in.
+    :param frames: The amount of frames.
+    :return: The path of the manifest.
+    """
+    paths = []
+    for index in range(frames):
+        path = os.path.join(str(directory), '{}.jpg'.format(1000 + index * 0.5))
+        shutil.copy(TESTIMAGE, path)
+        paths.append(path)
+    return write_manifest(paths, 1001.5, 1.9, 2.0)
+
+
+def test_manifest(tmpdir):
+    """
+    Verifies that the manifest is named by the first frame and lists all frames.
+
+    :param tmpdir: The temporary directory to store the event in.
+    """
+
+    manifest = create_event(tmpdir)
+
+    assert os.path.basename(manifest) == '1000.0.event.json'
+    assert is_manifest(manifest)
+    assert capture_time(manifest) == 1000.0
+    assert read_manifest(manifest) == {'start': 1000.0, 'end': 1001.5,
+                                       'frames': ['1000.0.jpg', '1000.5.jpg', '1001.0.jpg'],
+                                       'achieved_fps': 1.9, 'target_fps': 2.0}
+
+
+@pytest.mark.parametrize('compression', [NONE, GZIP])
+def test_stream_archive(tmpdir, compression):
+    """
+    Verifies that the streamed archive contains the manifest first, followed by the frames.
+
+    :param tmpdir: The temporary directory to store the event in.
+    :param compression: The compression of the archive.
+    """
+
+    manifest = create_event(tmpdir)
+    chunks = list(stream_archive(manifest, compression))
+
+    assert all(chunks)
+    with tarfile.open(fileobj=io.BytesIO(b''.join(chunks)), mode='r:*') as archive:
+        assert archive.getnames() == ['event.json', '1000.0.jpg', '1000.5.jpg', '1001.0.jpg']
+        with open(TESTIMAGE, 'rb') as image_file:
+            assert archive.extractfile('1000.5.jpg').read() == image_file.read()
+
+
+def test_invalid_compression(tmpdir):
+    """
+    Verifies that an invalid compression is rejected.
+
+    :param tmpdir: The temporary directory to store the event in.
+    """
+
+    with pytest.raises(ValueError):
+        list(stream_archive(create_event(tmpdir), 'zip'))
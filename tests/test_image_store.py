@@ -0,0 +1,96 @@
+import os
+
+from berry_cam.image_store import ImageStore
+
+
+def test_sharded_layout(tmpdir):
+    """
+    Verifies that images are stored in one directory per hour and written atomically.
+
+    :param tmpdir: The temporary directory to store the images in.
+    """
+
+    store = ImageStore(str(tmpdir))
+    path = store.path_for(1591000000.0)
+    store.write(path, b'image')
+
+    assert path == os.path.join(str(tmpdir), '2020-06-01', '08', '1591000000.0.jpg')
+    assert os.listdir(os.path.dirname(path)) == ['1591000000.0.jpg']
+    with open(path, 'rb') as image_file:
+        assert image_file.read() == b'image'
+
+    # Frames of a motion stay together, even if the motion spans two hours
+    assert os.path.dirname(store.path_for(1591002000.0, 1591000000.0)) == os.path.dirname(path)
+    assert ImageStore(str(tmpdir), sharded=False).path_for(1591000000.0) == \
+        os.path.join(str(tmpdir), '1591000000.0.jpg')
+
+
+def test_recover_pending(tmpdir):
+    """
+    Verifies that images queued but not uploaded before a stop are recovered in order and the index is compacted.
+
+    :param tmpdir: The temporary directory to store the images in.
+    """
+
+    store = ImageStore(str(tmpdir))
+    images = [store.path_for(1591000000.0 + i) for i in range(4)]
+    for image in images:
+        store.write(image, b'image')
+        store.add_pending(image)
+    store.mark_uploaded(images[1])
+    os.remove(images[2])  # Dropped from the full upload queue
+    store.close()
+
+    # Killed while appending a line
+    with open(os.path.join(str(tmpdir), 'pending.idx'), 'a') as index_file:
+        index_file.write('-' + os.path.relpath(images[3], str(tmpdir))[:5])
+
+    store = ImageStore(str(tmpdir))
+    assert store.recover() == [images[0], images[3]]
+    with open(os.path.join(str(tmpdir), 'pending.idx')) as index_file:
+        assert len(index_file.readlines()) == 2
+
+    store.mark_uploaded(images[0])
+    store.close()
+    assert ImageStore(str(tmpdir)).recover() == [images[3]]
+
+
+def test_recover_without_index(tmpdir):
+    """
+    Verifies that nothing is recovered on the first start or if the index is disabled.
+
+    :param tmpdir: The temporary directory to store the images in.
+    """
+
+    assert ImageStore(str(tmpdir)).recover() == []
+
+    store = ImageStore(str(tmpdir), index_name=None)
+    store.add_pending(store.path_for(1591000000.0))
+    assert store.recover() == []
+    assert not os.path.exists(os.path.join(str(tmpdir), 'pending.idx'))
+
+
+def test_compact_while_running(tmpdir):
+    """
+    Verifies that the index is compacted while running, so it does not grow with every uploaded image.
+
+    :param tmpdir: The temporary directory to store the images in.
+    """
+
+    store = ImageStore(str(tmpdir), compact_after=3)
+    assert store.recover() == []
+    images = [store.path_for(1591000000.0 + i) for i in range(10)]
+    for image in images:
+        store.write(image, b'image')
+        store.add_pending(image)
+    os.remove(images[9])  # Dropped from the full upload queue
+    for image in images[:6]:
+        store.mark_uploaded(image)
+
+    # Compacted once as many images were uploaded as pending, the dropped image is removed as well
+    with open(os.path.join(str(tmpdir), 'pending.idx')) as index_file:
+        assert [line[0] for line in index_file] == ['+', '+', '+', '+', '-']
+
+    store.mark_uploaded(images[6])
+    store.close()
+    assert ImageStore(str(tmpdir)).recover() == images[7:9]
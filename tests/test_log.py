@@ -0,0 +1,115 @@
+import io
+import logging
+import threading
+
+from queue import Queue
+
+from berry_cam.log import DroppingQueueHandler, LogPipeline, RepeatSuppressionFilter
+
+
+class BlockingStream(io.StringIO):
+    """
+    A stream that blocks all writes until it is released. Simulates a slow console.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.blocked = threading.Event()
+        self.released = threading.Event()
+
+    def write(self, text):
+        self.blocked.set()
+        self.released.wait()
+        return super().write(text)
+
+
+def create_record(msg, level=logging.ERROR):
+    """
+    Creates a log record for testing.
+
+    :param msg: The message of the record.
+    :param level: The level of the record.
+    :return: The created record.
+    """
+    return logging.LogRecord('test', level, __file__, 1, msg, None, None)
+
+
+def test_queue_handler_drops_if_full():
+    """
+    Verifies that the queue handler does not block on a full queue but counts the dropped records.
+    """
+
+    queue = Queue(2)
+    handler = DroppingQueueHandler(queue)
+    for i in range(5):
+        handler.handle(create_record('Message {}'.format(i)))
+
+    assert handler.dropped == 3
+    assert queue.qsize() == 2
+
+    # After space is available, a warning about the dropped records is logged first
+    queue.get()
+    queue.get()
+    handler.handle(create_record('Message 5'))
+    assert queue.get().getMessage() == '3 log messages dropped'
+    assert queue.get().getMessage() == 'Message 5'
+
+    # The warning is only logged if the record fits as well, it does not take the place of the record
+    for i in range(6, 9):
+        handler.handle(create_record('Message {}'.format(i)))
+    queue.get()
+    handler.handle(create_record('Message 9'))
+    assert [queue.get().getMessage() for _ in range(2)] == ['Message 7', 'Message 9']
+    handler.handle(create_record('Message 10'))
+    assert queue.get().getMessage() == '1 log messages dropped'
+    assert queue.get().getMessage() == 'Message 10'
+
+
+def test_repeat_suppression():
+    """
+    Verifies that repeated errors are suppressed within the interval and counted afterwards.
+    """
+
+    repeat_filter = RepeatSuppressionFilter(0.2)
+
+    assert repeat_filter.filter(create_record('Error'))
+    assert not repeat_filter.filter(create_record('Error'))
+    assert not repeat_filter.filter(create_record('Error'))
+    assert repeat_filter.filter(create_record('Other error'))
+    assert repeat_filter.filter(create_record('Info', logging.INFO))
+    assert repeat_filter.filter(create_record('Info', logging.INFO))
+    assert repeat_filter.suppressed == 2
+
+    threading.Event().wait(0.3)
+    record = create_record('Error')
+    assert repeat_filter.filter(record)
+    assert record.getMessage() == 'Error (repeated 2 times)'
+
+
+def test_pipeline_does_not_block():
+    """
+    Verifies that logging does not block if the output stream blocks and that all records
+    are written after the stream is available again.
+    """
+
+    stream = BlockingStream()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    pipeline = LogPipeline([handler], queue_size=10)
+    pipeline.start(logging.INFO)
+
+    try:
+        logger = logging.getLogger('berry_cam.test')
+        logger.info('Message 0')
+        assert stream.blocked.wait(5)
+        for i in range(1, 20):
+            logger.info('Message %s', i)
+
+        # The listener holds the first record, 10 are queued and the others are dropped
+        assert pipeline.dropped == 9
+    finally:
+        stream.released.set()
+        pipeline.stop()
+
+    lines = stream.getvalue().splitlines()
+    assert lines == ['Message {}'.format(i) for i in range(11)]  # Never got space again to report the dropped
@@ -0,0 +1,86 @@
+import io
+import os
+
+from PIL import Image
+
+from berry_cam.images import capture_time, is_roi, parse_roi
+from berry_cam.roi import RoiCropper
+
+TESTIMAGE = os.path.join(os.path.dirname(__file__), 'test_data', 'test.jpg')
+
+
+def create_frame(box=None):
+    """
+    Creates a frame of the camera resolution, optionally with a changed region.
+
+    :param box: The region to paint black as (left, top, right, bottom).
+    :return: The frame as jpeg.
+    """
+    with Image.open(TESTIMAGE) as image:
+        frame = image.convert('RGB').resize((1024, 768))
+    if box:
+        frame.paste((0, 0, 0), box)
+    output = io.BytesIO()
+    frame.save(output, 'JPEG', quality=85)
+    return output.getvalue()
+
+
+def test_crop_changed_region():
+    """
+    Verifies that follow-up frames are cropped to the region that changed since the key frame.
+    """
+
+    cropper = RoiCropper()
+    key_frame = create_frame()
+    assert cropper.crop('/images/1000.0.jpg', key_frame) == ('/images/1000.0.jpg', key_frame)
+
+    path, data = cropper.crop('/images/1000.5.jpg', create_frame((400, 300, 500, 400)))
+
+    assert is_roi(path)
+    assert capture_time(path) == 1000.5
+    key_frame_name, box = parse_roi(path)
+    assert key_frame_name == '1000.0.jpg'
+    assert box[0] <= 400 and box[1] <= 300 and box[2] >= 500 and box[3] >= 400
+    assert all(coordinate % 16 == 0 for coordinate in box)
+    assert (box[2] - box[0]) * (box[3] - box[1]) < 1024 * 768 / 4
+    with Image.open(io.BytesIO(data)) as crop:
+        assert crop.size == (box[2] - box[0], box[3] - box[1])
+    assert len(data) < len(key_frame) / 4
+    assert (cropper.key_frames, cropper.cropped_frames) == (1, 1)
+
+
+def test_new_key_frame():
+    """
+    Verifies that a new key frame is stored if the changed region is too large, after the key frame interval
+    and when a new motion starts.
+    """
+
+    cropper = RoiCropper(key_frame_interval=1)
+    cropper.crop('/images/1000.0.jpg', create_frame())
+
+    # Too large
+    assert cropper.crop('/images/1000.5.jpg', create_frame((0, 0, 1000, 700)))[0] == '/images/1000.5.jpg'
+    # Key frame interval
+    assert is_roi(cropper.crop('/images/1001.0.jpg', create_frame((0, 0, 1000, 700)))[0])
+    assert cropper.crop('/images/1001.5.jpg', create_frame((0, 0, 1000, 700)))[0] == '/images/1001.5.jpg'
+    # New motion
+    cropper.start()
+    assert cropper.crop('/images/1002.0.jpg', create_frame((0, 0, 1000, 700)))[0] == '/images/1002.0.jpg'
+    assert (cropper.key_frames, cropper.cropped_frames) == (4, 1)
+
+
+def test_new_key_frame_on_resize():
+    """
+    Verifies that a new key frame is stored if the resolution of the frames changes, as crops can only be
+    restored onto a key frame of the same resolution.
+    """
+
+    cropper = RoiCropper()
+    cropper.crop('/images/1000.0.jpg', create_frame())
+
+    output = io.BytesIO()
+    with Image.open(io.BytesIO(create_frame((400, 300, 500, 400)))) as frame:
+        frame.resize((640, 480)).save(output, 'JPEG', quality=85)
+    assert cropper.crop('/images/1000.5.jpg', output.getvalue())[0] == '/images/1000.5.jpg'
+    assert is_roi(cropper.crop('/images/1001.0.jpg', output.getvalue())[0])
+    assert (cropper.key_frames, cropper.cropped_frames) == (2, 1)
@@ -0,0 +1,202 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from tempfile import TemporaryDirectory
+
+from berry_cam.image_store import ImageStore
+from berry_cam.run_cam import queue_pending_images
+from berry_cam.upload_scheduler import THIN, UploadScheduler
+
+# Starts the daemon with fake raspberry pi libraries
+RUN_WITH_FAKE_RPI = """
+import sys
+import fake_rpi
+fake_rpi.toggle_print(False)
+sys.modules['RPi'] = fake_rpi.RPi
+sys.modules['RPi.GPIO'] = fake_rpi.RPi.GPIO
+sys.modules['picamera'] = fake_rpi.picamera
+
+from berry_cam.run_cam import main
+main(sys.argv[1:])
+"""
+
+CONFIG = """
+camera:
+  name: Test-Camera
+  image_location: {image_location}
+image_server:
+  server_url: http://invalid_url
+  api_key: invalid_key
+  retry_count: 2
+pir:
+  number_type: {number_type}
+  pin: 23
+  reset_time: 1
+"""
+
+
+def run_daemon(tmpdir, number_type, runtime, reloaded_config=None):
+    """
+    Runs the daemon in a separate process and stops it via SIGTERM.
+
+    :param tmpdir: The directory to store config and images in.
+    :param number_type: The pir number type to configure.
+    :param runtime: The time in seconds to run the daemon before stopping it.
+    :param reloaded_config: If set, the configuration is replaced by this text and reloaded via SIGHUP
+                            after half of the runtime.
+    :return: The finished process, with output as text.
+    """
+    config_path = os.path.join(tmpdir, 'conf.yaml')
+    with open(config_path, 'w') as config_file:
+        config_file.write(CONFIG.format(image_location=tmpdir, number_type=number_type))
+
+    process = subprocess.Popen([sys.executable, '-c', RUN_WITH_FAKE_RPI, '--config', config_path],
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    if reloaded_config is not None:
+        time.sleep(runtime / 2)
+        with open(config_path, 'w') as config_file:
+            config_file.write(reloaded_config)
+        process.send_signal(signal.SIGHUP)
+        runtime /= 2
+    time.sleep(runtime)
+    process.send_signal(signal.SIGTERM)
+    process.output = process.communicate(timeout=10)[0]
+    return process
+
+
+def test_import_is_lazy():
+    """
+    Verifies that importing the daemon module does not import hardware or network libraries.
+    """
+
+    modules = subprocess.check_output(
+        [sys.executable, '-c', 'import sys, berry_cam.run_cam; print(" ".join(sys.modules))'],
+        universal_newlines=True).split()
+
+    for module in ('RPi', 'picamera', 'requests', 'yaml'):
+        assert module not in modules
+
+
+def test_main_startup_and_stop():
+    """
+    Verifies that the daemon starts, reports its startup phases and stops on SIGTERM.
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        process = run_daemon(tmpdir, 'BCM', 2)
+
+    assert process.returncode == 0
+    assert 'Startup: starting upload path took' in process.output
+    assert 'Startup: starting camera took' in process.output
+    assert 'Running... (startup took' in process.output
+    assert 'Finished' in process.output
+
+
+def test_main_invalid_pir_number_type():
+    """
+    Verifies that the daemon does not start if the pir number type is invalid.
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        process = run_daemon(tmpdir, 'INVALID', 2)
+
+    assert process.returncode == 0
+    assert "Invalid configuration: Invalid 'pir.number_type' 'INVALID'" in process.output
+    assert 'Running...' not in process.output
+
+
+def test_main_stops_upload_path_on_setup_error():
+    """
+    Verifies that the already started upload path is stopped if setting up the camera fails.
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        config_path = os.path.join(tmpdir, 'conf.yaml')
+        with open(config_path, 'w') as config_file:
+            config_file.write(CONFIG.format(image_location=tmpdir, number_type='BCM').replace(
+                'camera:\n', 'camera:\n  roi: [invalid]\n'))
+        process = subprocess.run([sys.executable, '-c', RUN_WITH_FAKE_RPI, '--config', config_path],
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True,
+                                 timeout=20)
+
+    assert process.returncode != 0
+    assert 'AttributeError' in process.stdout
+    assert 'Waiting for threads to stop...' in process.stdout
+
+
+def test_main_recovers_pending_images():
+    """
+    Verifies that images not uploaded before the last stop are queued again on startup.
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        os.makedirs(os.path.join(tmpdir, '2020-06-01', '08'))
+        with open(os.path.join(tmpdir, '2020-06-01', '08', '1591000000.0.jpg'), 'wb') as image_file:
+            image_file.write(b'image')
+        with open(os.path.join(tmpdir, 'pending.idx'), 'w') as index_file:
+            index_file.write('+2020-06-01/08/1591000000.0.jpg\n+2020-06-01/08/1591000001.0.jpg\n')
+
+        process = run_daemon(tmpdir, 'BCM', 2)
+
+    assert process.returncode == 0
+    assert 'Image store: 1 images pending for upload.' in process.output
+    assert 'Startup: recovering pending images took' in process.output
+
+
+def test_main_invalid_config():
+    """
+    Verifies that the daemon does not start with an invalid configuration.
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        config = CONFIG.format(image_location=tmpdir, number_type='BCM').replace('retry_count: 2', 'retry_count: 0')
+        config_path = os.path.join(tmpdir, 'conf.yaml')
+        with open(config_path, 'w') as config_file:
+            config_file.write(config)
+        output = subprocess.check_output([sys.executable, '-c', RUN_WITH_FAKE_RPI, '--config', config_path],
+                                         stderr=subprocess.STDOUT, universal_newlines=True, timeout=10)
+
+    assert "Invalid configuration: 'image_server.retry_count' needs to be an integer of at least 1" in output
+    assert 'Running...' not in output
+
+
+def test_main_reloads_config_on_sighup():
+    """
+    Verifies that the configuration is reloaded on SIGHUP and restart-only changes are reported.
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        config = CONFIG.format(image_location=tmpdir, number_type='BCM')
+        config = config.replace('reset_time: 1', 'reset_time: 5').replace('pin: 23', 'pin: 24')
+        config = config.replace('  name: Test-Camera\n', '  name: Renamed-Camera\n  frame_interval: 0.2\n')
+        process = run_daemon(tmpdir, 'BCM', 4, config)
+
+    assert process.returncode == 0
+    assert 'Config: Reloaded, changed camera.name, camera.frame_interval, pir.pin, pir.reset_time.' in process.output
+    assert 'Config: Changes of camera.frame_interval, pir.pin are only applied after a restart.' in process.output
+    assert 'Finished' in process.output
+
+
+def test_queue_pending_images_without_dropping():
+    """
+    Verifies that recovered images are not dropped by the overflow policy if more are pending than fit
+    into the upload queue, but stay pending for the next start.
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        store = ImageStore(tmpdir)
+        images = [store.path_for(1591000000.0 + index) for index in range(5)]
+        for image in images:
+            store.write(image, b'image')
+            store.add_pending(image)
+        store.close()
+
+        upload_queue = UploadScheduler(maxsize=2, overflow=THIN)
+        assert queue_pending_images(ImageStore(tmpdir), upload_queue) == 2
+
+        assert upload_queue.dropped == 0
+        assert all(os.path.exists(image) for image in images)
+        assert ImageStore(tmpdir).recover() == images
@@ -0,0 +1,114 @@
+import threading
+import time
+
+from testfixtures import LogCapture
+
+from berry_cam.supervisor import Supervisor
+
+
+class FakeWorker(threading.Thread):
+    """
+    A worker that runs until it is stopped or fails after a given time.
+    """
+
+    instances = []
+
+    def __init__(self, fail_after=None):
+        super().__init__()
+        self.enabled = False
+        self._fail_after = fail_after
+        self._stopped = threading.Event()
+        FakeWorker.instances.append(self)
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        if self._stopped.wait(self._fail_after) or self._fail_after is None:
+            return
+        raise RuntimeError("Worker failed")
+
+
+def run_supervisor(supervisor):
+    """
+    Runs the supervisor in a separate thread.
+
+    :param Supervisor supervisor: The supervisor to run.
+    :return: The thread running the supervisor.
+    """
+    supervisor_thread = threading.Thread(target=supervisor.run)
+    supervisor.start()
+    supervisor_thread.start()
+    return supervisor_thread
+
+
+def test_stop():
+    """
+    Verifies that all workers are stopped and the supervisor returns on stop().
+    """
+
+    FakeWorker.instances = []
+    supervisor = Supervisor()
+    supervisor.add('first', FakeWorker)
+    supervisor.add('second', FakeWorker)
+    supervisor_thread = run_supervisor(supervisor)
+
+    supervisor.stop()
+    supervisor_thread.join(1)
+    supervisor.join()
+
+    assert len(FakeWorker.instances) == 2
+    assert not supervisor_thread.is_alive()
+    assert not any(worker.is_alive() for worker in FakeWorker.instances)
+
+
+def test_restart_keeps_state():
+    """
+    Verifies that a failed worker is restarted with backoff, keeps its enabled state and the other workers
+    keep running.
+    """
+
+    FakeWorker.instances = []
+    supervisor = Supervisor(backoff=0.1)
+    healthy = supervisor.add('healthy', FakeWorker)
+    failing = supervisor.add('failing', lambda: FakeWorker(0.1))
+    failing.enabled = True
+
+    with LogCapture(names='berry_cam.supervisor') as log:
+        supervisor_thread = run_supervisor(supervisor)
+        first_worker = failing.worker
+        time.sleep(0.3)  # 0.1 s until failure, 0.1 s backoff
+
+        assert failing.worker is not first_worker
+        assert failing.worker.enabled
+        assert healthy.worker.is_alive()
+        log.check_present(
+            ('berry_cam.supervisor', 'WARNING', 'Supervisor: failing exited, restarting in 0.1 seconds.'),
+            ('berry_cam.supervisor', 'INFO', 'Supervisor: Restarting failing')
+        )
+
+        supervisor.stop()
+        supervisor_thread.join(1)
+        assert not supervisor_thread.is_alive()
+
+
+def test_restart_budget_exceeded():
+    """
+    Verifies that all workers are stopped if a worker fails more often than allowed.
+    """
+
+    FakeWorker.instances = []
+    supervisor = Supervisor(max_restarts=2, backoff=0.01)
+    healthy = supervisor.add('healthy', FakeWorker)
+    supervisor.add('failing', lambda: FakeWorker(0.01))
+
+    with LogCapture(names='berry_cam.supervisor') as log:
+        supervisor_thread = run_supervisor(supervisor)
+        supervisor_thread.join(1)
+
+        assert not supervisor_thread.is_alive()
+        assert not healthy.worker.is_alive()
+        assert len(FakeWorker.instances) == 4  # One healthy worker, three failing ones
+        log.check_present(
+            ('berry_cam.supervisor', 'ERROR', 'Supervisor: failing exited 3 times within 600 seconds, giving up.')
+        )
@@ -0,0 +1,136 @@
+import io
+import json
+import os
+import shutil
+import time
+
+from tempfile import TemporaryDirectory
+
+from berry_cam.threads.uploader import Uploader
+from berry_cam.tracing import ProfileSwitch, Tracer, TRACER, trace_id_for
+
+TESTIMAGE = os.path.realpath(
+    os.path.join(os.path.dirname(__file__), 'test_data', 'test.jpg'))
+
+
+def test_disabled_tracer():
+    """
+    Verifies that no spans are recorded if tracing is disabled.
+    """
+
+    tracer = Tracer()
+    with tracer.span('capture', 'id'):
+        pass
+
+    assert tracer.spans == []
+
+
+def test_export_formats():
+    """
+    Verifies that recorded spans can be exported as json lines and chrome trace.
+    """
+
+    tracer = Tracer()
+    tracer.enabled = True
+    with tracer.span('capture', '1.5'):
+        time.sleep(0.01)
+    try:
+        with tracer.span('write', '1.5'):
+            raise OSError()
+    except OSError:
+        pass
+
+    json_lines = io.StringIO()
+    tracer.export_json_lines(json_lines)
+    spans = [json.loads(line) for line in json_lines.getvalue().splitlines()]
+    assert [span['name'] for span in spans] == ['capture', 'write']
+    assert spans[0]['trace_id'] == '1.5'
+    assert spans[0]['duration'] >= 0.01
+    assert spans[0]['success']
+    assert not spans[1]['success']
+
+    chrome_trace = io.StringIO()
+    tracer.export_chrome_trace(chrome_trace)
+    events = json.loads(chrome_trace.getvalue())['traceEvents']
+    assert len(events) == 2
+    assert events[0]['ph'] == 'X'
+    assert events[0]['dur'] >= 10000
+    assert events[0]['args']['trace_id'] == '1.5'
+
+
+def test_profile_window():
+    """
+    Verifies that a profile is written after the profiling window is closed.
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        profiler = ProfileSwitch()
+        profiler.poll()
+        assert os.listdir(tmpdir) == []
+
+        profiler.start(0.1, tmpdir)
+        profiler.poll()
+        time.sleep(0.2)
+        profiler.poll()
+
+        assert len(os.listdir(tmpdir)) == 1
+
+
+def test_uploader_spans(requests_mock):
+    """
+    Verifies that the uploader records the encoding and uploading of an image.
+
+    :param requests_mock.Mocker requests_mock: The requests mocker
+    """
+
+    requests_mock.post('http://valid_url/')
+
+    TRACER.enabled = True
+    TRACER.clear()
+    try:
+        uploader = Uploader('http://valid_url', 'valid_key', 2)
+        uploader.start()
+        uploader.upload_queue.put(TESTIMAGE)
+        time.sleep(1)
+        uploader.stop()
+        uploader.join(1.5)
+
+        spans = TRACER.spans
+    finally:
+        TRACER.enabled = False
+        TRACER.clear()
+
+    assert [span['name'] for span in spans] == ['encode', 'upload']
+    assert all(span['trace_id'] == trace_id_for(TESTIMAGE) for span in spans)
+
+
+def test_uploader_spans_of_cropped_image(requests_mock):
+    """
+    Verifies that a cropped image is traced as the frame it was captured as.
+
+    :param requests_mock.Mocker requests_mock: The requests mocker
+    """
+
+    requests_mock.post('http://valid_url/')
+
+    with TemporaryDirectory() as tmpdir:
+        picture = os.path.join(tmpdir, '1000.5.roi_1000.0_0_0_16_16.jpg')
+        shutil.copy(TESTIMAGE, picture)
+
+        TRACER.enabled = True
+        TRACER.clear()
+        try:
+            uploader = Uploader('http://valid_url', 'valid_key', 2)
+            uploader.start()
+            uploader.upload_queue.put(picture)
+            time.sleep(1)
+            uploader.stop()
+            uploader.join(1.5)
+
+            spans = TRACER.spans
+        finally:
+            TRACER.enabled = False
+            TRACER.clear()
+
+    assert [span['name'] for span in spans] == ['encode', 'upload']
+    assert all(span['trace_id'] == '1000.5' for span in spans)
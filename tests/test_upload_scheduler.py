@@ -0,0 +1,341 @@
+import os
+import shutil
+from queue import Empty, Full
+
+import pytest
+
+from berry_cam.capture_record import CaptureRecord
+from berry_cam.images import thumbnail_path
+from berry_cam.upload_scheduler import BLOCK, DROP_NEWEST, DROP_OLDEST, FIFO, NEWEST_EVENT_FIRST, STALE_ARCHIVE, \
+    STALE_DROP, STALE_THUMBNAIL, THIN, UploadScheduler
+
+TESTIMAGE = os.path.join(os.path.dirname(__file__), 'test_data', 'test.jpg')
+
+
+def put_event(scheduler, start, frames):
+    """
+    Puts the images of a motion event into the scheduler. Images are captured every 0.5 seconds.
+
+    :param UploadScheduler scheduler: The scheduler to put the images into.
+    :param start: The capture time of the first image.
+    :param frames: The amount of images.
+    :return: The paths of the images.
+    """
+    images = ['/images/{}.jpg'.format(start + frame * 0.5) for frame in range(frames)]
+    for image in images:
+        scheduler.put(image)
+    return images
+
+
+def get_all(scheduler):
+    """
+    Reads all images from the scheduler.
+
+    :param UploadScheduler scheduler: The scheduler to read from.
+    :return: The images in upload order.
+    """
+    images = []
+    while not scheduler.empty():
+        images.append(scheduler.get_nowait())
+    return images
+
+
+def test_invalid_policy():
+    """
+    Verifies that an invalid policy is rejected.
+    """
+
+    with pytest.raises(ValueError):
+        UploadScheduler('invalid')
+
+
+def test_fifo():
+    """
+    Verifies that the fifo policy keeps the order of the images.
+    """
+
+    scheduler = UploadScheduler(FIFO)
+    first_event = put_event(scheduler, 1000, 3)
+    second_event = put_event(scheduler, 1010, 3)
+
+    assert get_all(scheduler) == first_event + second_event
+
+
+def test_newest_event_first():
+    """
+    Verifies that the key frames of the newest events are uploaded first, then the remaining frames
+    of the newest events.
+    """
+
+    scheduler = UploadScheduler(NEWEST_EVENT_FIRST, event_gap=2, key_frames=1)
+    first_event = put_event(scheduler, 1000, 3)
+    second_event = put_event(scheduler, 1010, 3)
+    third_event = put_event(scheduler, 1020, 2)
+
+    assert get_all(scheduler) == [third_event[0], second_event[0], first_event[0],
+                                  third_event[1], second_event[1], second_event[2],
+                                  first_event[1], first_event[2]]
+
+
+def test_multiple_key_frames():
+    """
+    Verifies that multiple frames per event can be prioritized.
+    """
+
+    scheduler = UploadScheduler(NEWEST_EVENT_FIRST, key_frames=2)
+    first_event = put_event(scheduler, 1000, 3)
+    second_event = put_event(scheduler, 1010, 3)
+
+    assert get_all(scheduler) == [second_event[0], second_event[1], first_event[0], first_event[1],
+                                  second_event[2], first_event[2]]
+
+
+def test_readded_and_unknown_images():
+    """
+    Verifies that re-added old images are uploaded last and images without capture time after the key frames.
+    """
+
+    scheduler = UploadScheduler(NEWEST_EVENT_FIRST)
+    event = put_event(scheduler, 1000, 2)
+    scheduler.put('/images/999.jpg')
+    scheduler.put('/images/test.jpg')
+
+    assert get_all(scheduler) == [event[0], '/images/test.jpg', event[1], '/images/999.jpg']
+
+
+def test_thumbnails_first():
+    """
+    Verifies that thumbnails are uploaded before all full resolution images, newest first.
+    """
+
+    scheduler = UploadScheduler(NEWEST_EVENT_FIRST)
+    event = put_event(scheduler, 1000, 2)
+    scheduler.put('/images/1000.0.thumb.jpg')
+    scheduler.put('/images/1010.0.thumb.jpg')
+    scheduler.put('/images/1010.0.jpg')
+
+    assert get_all(scheduler) == ['/images/1010.0.thumb.jpg', '/images/1000.0.thumb.jpg',
+                                  '/images/1010.0.jpg', event[0], event[1]]
+
+
+def test_invalid_overflow_policy():
+    """
+    Verifies that an invalid overflow policy is rejected.
+    """
+
+    with pytest.raises(ValueError):
+        UploadScheduler(overflow='invalid')
+
+
+def test_overflow_block():
+    """
+    Verifies that the producer is blocked if the queue is full.
+    """
+
+    scheduler = UploadScheduler(FIFO, maxsize=2, overflow=BLOCK)
+    put_event(scheduler, 1000, 2)
+
+    with pytest.raises(Full):
+        scheduler.put('/images/1001.0.jpg', timeout=0.1)
+    assert scheduler.dropped == 0
+
+
+def test_overflow_drop_oldest(tmpdir):
+    """
+    Verifies that the image queued the longest is dropped and its file deleted.
+
+    :param tmpdir: The temporary directory to store the images in.
+    """
+
+    images = [str(tmpdir.join('{}.jpg'.format(1000 + index))) for index in range(4)]
+    for image in images:
+        open(image, 'w').close()
+
+    scheduler = UploadScheduler(FIFO, maxsize=3, overflow=DROP_OLDEST)
+    for image in images:
+        scheduler.put(image)
+
+    assert get_all(scheduler) == images[1:]
+    assert scheduler.dropped == 1
+    assert not os.path.exists(images[0])
+    assert os.path.exists(images[1])
+
+
+def test_overflow_drop_newest():
+    """
+    Verifies that new images are dropped if the queue is full and the amount of unfinished tasks is kept.
+    """
+
+    scheduler = UploadScheduler(FIFO, maxsize=2, overflow=DROP_NEWEST, delete_dropped=False)
+    images = put_event(scheduler, 1000, 3)
+
+    assert get_all(scheduler) == images[:2]
+    assert scheduler.dropped == 1
+    scheduler.task_done()
+    scheduler.task_done()
+    scheduler.join()  # Returns only if all remaining images are done
+
+
+def test_overflow_thin():
+    """
+    Verifies that images from the middle of the largest event are dropped, keeping the key frames
+    and the last frames of the events.
+    """
+
+    scheduler = UploadScheduler(FIFO, maxsize=6, overflow=THIN, delete_dropped=False)
+    first_event = put_event(scheduler, 1000, 2)
+    second_event = put_event(scheduler, 1010, 6)
+
+    assert get_all(scheduler) == first_event + [second_event[0], second_event[2], second_event[4],
+                                                second_event[5]]
+    assert scheduler.dropped == 2
+
+
+def test_overflow_thin_nothing_to_thin():
+    """
+    Verifies that the oldest image is dropped if no event can be thinned out.
+    """
+
+    scheduler = UploadScheduler(NEWEST_EVENT_FIRST, maxsize=2, overflow=THIN, delete_dropped=False)
+    put_event(scheduler, 1000, 1)
+    second_event = put_event(scheduler, 1010, 1)
+    third_event = put_event(scheduler, 1020, 1)
+
+    assert get_all(scheduler) == third_event + second_event
+
+
+def test_overflow_keeps_protected_images():
+    """
+    Verifies that protected images, e.g. the key frames of cropped images, are not dropped by any overflow policy.
+    """
+
+    for overflow in (DROP_OLDEST, DROP_NEWEST, THIN):
+        scheduler = UploadScheduler(FIFO, maxsize=3, overflow=overflow, delete_dropped=False)
+        records = [CaptureRecord('/images/{}.jpg'.format(1000 + frame * 0.5), capture_time=1000 + frame * 0.5,
+                                 protected=frame in (0, 1, 3)) for frame in range(5)]
+        for record in records:
+            scheduler.put(record)
+
+        assert [record.protected for record in get_all(scheduler)] == [True, True, True], overflow
+        assert scheduler.dropped == 2
+
+
+def test_event_manifests_are_protected(tmpdir):
+    """
+    Verifies that event manifests are neither dropped by the overflow policies nor expired as stale,
+    as the frames they list are only uploaded with them.
+
+    :param tmpdir: The temporary directory to store the manifest in.
+    """
+
+    for overflow in (DROP_OLDEST, THIN):
+        scheduler = UploadScheduler(FIFO, maxsize=2, overflow=overflow, delete_dropped=False)
+        manifest = CaptureRecord.from_path('/images/1000.0.event.json')
+        scheduler.put(manifest)
+        for frame in range(3):
+            scheduler.put(CaptureRecord('/images/{}.jpg'.format(1010 + frame), capture_time=1010 + frame))
+
+        assert manifest in get_all(scheduler), overflow
+        assert scheduler.dropped == 2
+
+    manifest = CaptureRecord.from_path(str(tmpdir.join('1000.0.event.json')))
+    open(manifest.path, 'w').close()
+    scheduler = UploadScheduler(FIFO, max_age=60, stale_policy=STALE_DROP, clock=lambda: 1100)
+    scheduler.put(manifest)
+
+    assert get_all(scheduler) == [manifest]
+    assert scheduler.expired == 0
+    assert os.path.exists(manifest.path)
+
+
+def test_invalid_stale_policy():
+    """
+    Verifies that an invalid stale policy is rejected.
+    """
+
+    with pytest.raises(ValueError):
+        UploadScheduler(stale_policy='invalid')
+
+
+def test_stale_archive():
+    """
+    Verifies that stale images are uploaded after all current images, newest first.
+    """
+
+    scheduler = UploadScheduler(FIFO, max_age=60, stale_policy=STALE_ARCHIVE, clock=lambda: 1100)
+    old_event = put_event(scheduler, 1000, 2)
+    current_event = put_event(scheduler, 1090, 2)
+
+    assert get_all(scheduler) == current_event + old_event[::-1]
+    assert scheduler.archived == 2
+    for _ in range(4):
+        scheduler.task_done()
+    scheduler.join()  # Returns only if all images are done
+
+
+def test_stale_drop(tmpdir):
+    """
+    Verifies that stale images are dropped and their files deleted.
+
+    :param tmpdir: The temporary directory to store the images in.
+    """
+
+    images = [str(tmpdir.join('{}.jpg'.format(time))) for time in (1000, 1090)]
+    for image in images:
+        open(image, 'w').close()
+
+    scheduler = UploadScheduler(FIFO, max_age=60, stale_policy=STALE_DROP, clock=lambda: 1100)
+    for image in images:
+        scheduler.put(image)
+
+    assert scheduler.get_nowait() == images[1]
+    with pytest.raises(Empty):
+        scheduler.get_nowait()
+    assert scheduler.expired == 1
+    assert not os.path.exists(images[0])
+    scheduler.task_done()
+    scheduler.join()
+
+
+def test_stale_thumbnail(tmpdir):
+    """
+    Verifies that stale images are replaced by their thumbnail, unless the thumbnail was already created.
+
+    :param tmpdir: The temporary directory to store the images in.
+    """
+
+    images = [str(tmpdir.join('{}.jpg'.format(time))) for time in (1000, 1001, 1090)]
+    for image in images:
+        shutil.copy(TESTIMAGE, image)
+    shutil.copy(TESTIMAGE, thumbnail_path(images[1]))
+
+    scheduler = UploadScheduler(FIFO, max_age=60, stale_policy=STALE_THUMBNAIL, clock=lambda: 1100)
+    for image in images:
+        scheduler.put(image)
+
+    assert get_all(scheduler) == [thumbnail_path(images[0]), images[2]]
+    assert scheduler.downgraded == 2
+    assert os.path.exists(thumbnail_path(images[0]))
+    assert not os.path.exists(images[0])
+    assert not os.path.exists(images[1])
+
+
+def test_stale_protected_images_are_archived(tmpdir):
+    """
+    Verifies that stale protected images are uploaded after all current images instead of being dropped.
+
+    :param tmpdir: The temporary directory to store the images in.
+    """
+
+    key_frame = CaptureRecord(str(tmpdir.join('1000.jpg')), capture_time=1000, protected=True)
+    open(key_frame.path, 'w').close()
+    current = CaptureRecord(str(tmpdir.join('1090.jpg')), capture_time=1090)
+
+    for stale_policy in (STALE_DROP, STALE_THUMBNAIL):
+        scheduler = UploadScheduler(FIFO, max_age=60, stale_policy=stale_policy, clock=lambda: 1100)
+        scheduler.put(key_frame)
+        scheduler.put(current)
+
+        assert get_all(scheduler) == [current, key_frame]
+        assert scheduler.archived == 1
+        assert os.path.exists(key_frame.path)
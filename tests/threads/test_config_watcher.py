@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+
+from testfixtures import LogCapture
+
+from berry_cam.threads.config_watcher import ConfigWatcher
+
+CONFIG = """
+camera:
+  name: Test-Camera
+  image_location: /tmp/images
+image_server:
+  server_url: http://localhost
+  api_key: key
+  retry_count: 2
+pir:
+  number_type: BCM
+  pin: 23
+  reset_time: {reset_time}
+"""
+
+
+def write_config(path, reset_time, mtime=None):
+    """
+    Writes a configuration file.
+
+    :param path: The path of the file.
+    :param reset_time: The pir reset time to write.
+    :param mtime: If set, the modification time to set on the file.
+    """
+    with open(path, 'w') as config_file:
+        config_file.write(CONFIG.format(reset_time=reset_time))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_reload_on_change(tmpdir):
+    """
+    Verifies that the configuration is applied when the file changed.
+    """
+
+    path = str(tmpdir.join('conf.yaml'))
+    write_config(path, 1, 1000)
+    applied = []
+    watcher = ConfigWatcher(path, applied.append, interval=0.1)
+    watcher.start()
+    try:
+        time.sleep(0.2)
+        assert not applied
+
+        write_config(path, 5, 2000)
+        deadline = time.monotonic() + 5
+        while not applied and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+        watcher.join()
+
+    assert [config['pir']['reset_time'] for config in applied] == [5]
+    assert watcher.reloads == 1
+
+
+def test_invalid_config_is_rejected(tmpdir):
+    """
+    Verifies that an invalid configuration is not applied.
+    """
+
+    path = str(tmpdir.join('conf.yaml'))
+    write_config(path, -1)
+    applied = []
+    watcher = ConfigWatcher(path, applied.append)
+
+    with LogCapture() as log:
+        assert not watcher.reload()
+
+    assert not applied
+    assert watcher.rejected == 1
+    log.check(('berry_cam.threads.config_watcher', 'ERROR',
+               "Config watcher: Invalid configuration, keeping the running configuration: "
+               "'pir.reset_time' needs to be a number of at least 0, found -1."))
+
+
+def test_request_reload(tmpdir):
+    """
+    Verifies that a requested reload is applied, also when requested before the watcher was restarted.
+    """
+
+    path = str(tmpdir.join('conf.yaml'))
+    write_config(path, 1)
+    applied = []
+    reload_requested = threading.Event()
+    reload_requested.set()
+    watcher = ConfigWatcher(path, applied.append, reload_requested, watch=False)
+    watcher.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not applied and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert len(applied) == 1
+
+        reload_requested.set()
+        while len(applied) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+        watcher.join(2)
+
+    assert len(applied) == 2
+    assert not watcher.is_alive()
@@ -2,8 +2,10 @@ import time
 import pytest
 
 from http import HTTPStatus
+from threading import Thread
 from testfixtures import LogCapture
 
+from berry_cam.circuit_breaker import CircuitBreaker
 from berry_cam.threads.heartbeat import Heartbeat
 
 
@@ -118,3 +120,56 @@ def test_send_multiple_hearbeats(requests_mock):
         assert requests_mock.request_history[0].body == 'name=Test-Camera&api_key=valid_key&enabled=False'
         assert requests_mock.request_history[1].body == 'name=Test-Camera&api_key=valid_key&enabled=True'
         assert not heartbeat.is_alive()
+
+
+def test_skip_while_active(requests_mock):
+    """
+    Verifies that heartbeats are skipped while other requests reach the server, unless 'enabled' changed.
+
+    :param requests_mock.Mocker requests_mock: The requests mocker
+    """
+
+    request_times = []  # Of all requests the server accepted
+
+    def accept_heartbeat(request, context):
+        request_times.append(time.monotonic())
+        return ''
+
+    requests_mock.post('http://valid_url/', text=accept_heartbeat)
+    breaker = CircuitBreaker()
+    other_traffic = True
+
+    def send_other_requests():
+        while other_traffic:
+            breaker.record_success()
+            request_times.append(time.monotonic())
+            time.sleep(0.2)
+        # Rejected requests do not prove that the camera is alive
+        breaker.record_success(False)
+
+    traffic = Thread(target=send_other_requests)
+    traffic.start()
+    try:
+        heartbeat = Heartbeat('Test-Camera', 'http://valid_url', 'valid_key', 2, breaker,
+                              interval=1, skip_while_active=True)
+        heartbeat.start()
+        time.sleep(2.5)
+        heartbeat.enabled = True
+        time.sleep(1)
+    finally:
+        other_traffic = False
+        traffic.join()
+    time.sleep(1.5)
+    heartbeat.stop()
+    heartbeat.join(1.5)
+
+    # The first heartbeat, one after the change and one after the other requests stopped
+    assert [request.body for request in requests_mock.request_history] == [
+        'name=Test-Camera&api_key=valid_key&enabled=False',
+        'name=Test-Camera&api_key=valid_key&enabled=True',
+        'name=Test-Camera&api_key=valid_key&enabled=True']
+    assert heartbeat.skipped_heartbeats == 3
+    assert not heartbeat.is_alive()
+    # The server never waits much longer than the interval for a sign of life
+    request_times.sort()
+    assert max(later - earlier for earlier, later in zip(request_times, request_times[1:])) < 1.2
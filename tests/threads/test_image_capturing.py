@@ -8,12 +8,16 @@ sys.modules['RPi.GPIO'] = fake_rpi.RPi.GPIO  # Fake GPIO
 sys.modules['picamera'] = fake_rpi.picamera  # Fake picamera
 
 # Now add the real imports
+import os
 import time
 
 from queue import Queue
 from testfixtures import LogCapture
 from tempfile import TemporaryDirectory
 
+from berry_cam.capture_record import IMAGE, MANIFEST
+from berry_cam.event_archive import read_manifest
+from berry_cam.images import roi_path
 from berry_cam.threads.image_capturing import ImageCapturing
 
 from fake_rpi.RPi import GPIO
@@ -115,3 +119,140 @@ def test_enabled_with_movement():
             # We expect 1 or 2 images to be taken, depending on timings
             assert upload_queue.qsize() in [1, 2]
             assert not image_capturing.is_alive()
+
+
+def test_frame_interval():
+    """
+    Verifies that images are captured with the configured frame interval and the achieved rate is reported.
+    """
+
+    with LogCapture(names='berry_cam.threads.image_capturing') as log:
+        with TemporaryDirectory() as tmpdir:
+            GPIO.set_input(23, 0)
+            upload_queue = Queue()
+            image_capturing = ImageCapturing(GPIO.BCM, GPIO_PIN, tmpdir, 0, upload_queue, frame_interval=0.1)
+            image_capturing.start()
+            image_capturing.enabled = True
+            time.sleep(0.5)
+            GPIO.set_input(23, 1)  # Movement detected
+            time.sleep(1)
+            GPIO.set_input(23, 0)  # Movement stopped
+            time.sleep(0.6)
+            image_capturing.stop()
+            image_capturing.join(1)
+
+            assert 'Captured {} images at'.format(upload_queue.qsize()) in str(log)
+            assert '(target 10.00 fps)' in str(log)
+            assert 8 <= upload_queue.qsize() <= 11
+            assert not image_capturing.is_alive()
+
+            # The records keep the metadata of the capture
+            record = upload_queue.get_nowait()
+            assert record.kind == IMAGE
+            assert record.event == 1
+            assert record.size == 0  # The fake camera does not write any data
+            assert record.path.endswith('{}.jpg'.format(record.capture_time))
+
+
+def test_backpressure():
+    """
+    Verifies that the capture rate is reduced while the upload queue is full.
+    """
+
+    with LogCapture(names='berry_cam.threads.image_capturing') as log:
+        with TemporaryDirectory() as tmpdir:
+            GPIO.set_input(23, 0)
+            upload_queue = Queue()
+            full_queue = Queue(1)
+            full_queue.put('pending')
+            image_capturing = ImageCapturing(GPIO.BCM, GPIO_PIN, tmpdir, 0, upload_queue, frame_interval=0.1,
+                                             backpressure_queue=full_queue, backpressure_factor=10)
+            image_capturing.start()
+            image_capturing.enabled = True
+            time.sleep(0.5)
+            GPIO.set_input(23, 1)  # Movement detected
+            time.sleep(1)
+            GPIO.set_input(23, 0)  # Movement stopped
+            time.sleep(0.6)
+            image_capturing.stop()
+            image_capturing.join(1)
+
+            log.check_present(
+                ('berry_cam.threads.image_capturing', 'WARNING', 'Upload queue full, reducing capture rate.')
+            )
+            assert upload_queue.qsize() in [1, 2]
+            assert not image_capturing.is_alive()
+
+
+def test_archive_events():
+    """
+    Verifies that only the manifest of a motion is queued if events are archived.
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        GPIO.set_input(23, 0)
+        upload_queue = Queue()
+        image_capturing = ImageCapturing(GPIO.BCM, GPIO_PIN, tmpdir, 0, upload_queue, frame_interval=0.2,
+                                         archive_events=True)
+        image_capturing.start()
+        image_capturing.enabled = True
+        time.sleep(0.5)
+        GPIO.set_input(23, 1)  # Movement detected
+        time.sleep(1)
+        GPIO.set_input(23, 0)  # Movement stopped
+        time.sleep(0.6)
+        image_capturing.stop()
+        image_capturing.join(1)
+
+        assert upload_queue.qsize() == 1
+        record = upload_queue.get_nowait()
+        assert record.kind == MANIFEST
+        manifest = record.path
+        frames = read_manifest(manifest)['frames']
+        assert 4 <= len(frames) <= 6
+        # All frames of the motion are stored next to the manifest
+        assert sorted(os.listdir(os.path.dirname(manifest))) == sorted(frames + [os.path.basename(manifest)])
+        assert not image_capturing.is_alive()
+
+
+class FakeRoiCropper:
+    """
+    A region of interest cropper using the first frame of a motion as key frame and cropping all others.
+    """
+
+    def __init__(self):
+        self._key_frame = None
+
+    def start(self):
+        self._key_frame = None
+
+    def crop(self, image_path, data):
+        if self._key_frame is None:
+            self._key_frame = image_path
+            return image_path, data
+        return roi_path(image_path, self._key_frame, (0, 0, 16, 16)), data
+
+
+def test_roi_key_frames_protected():
+    """
+    Verifies that the key frames of cropped images are protected from being dropped by the upload queue.
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        GPIO.set_input(23, 0)
+        upload_queue = Queue()
+        image_capturing = ImageCapturing(GPIO.BCM, GPIO_PIN, tmpdir, 0, upload_queue, frame_interval=0.2,
+                                         roi_cropper=FakeRoiCropper())
+        image_capturing.start()
+        image_capturing.enabled = True
+        time.sleep(0.5)
+        GPIO.set_input(23, 1)  # Movement detected
+        time.sleep(1)
+        GPIO.set_input(23, 0)  # Movement stopped
+        time.sleep(0.6)
+        image_capturing.stop()
+        image_capturing.join(1)
+
+        records = [upload_queue.get_nowait() for _ in range(upload_queue.qsize())]
+        assert [record.protected for record in records] == [True] + [False] * (len(records) - 1)
+        assert records[1].roi_of == os.path.basename(records[0].path)
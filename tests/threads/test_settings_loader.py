@@ -4,7 +4,9 @@ import pytest
 from http import HTTPStatus
 from testfixtures import LogCapture
 
-from berry_cam.threads.settings_loader import SettingsLoader
+from benchmarks.standin_server import StandinServer
+from berry_cam.circuit_breaker import CLOSED, CircuitBreaker
+from berry_cam.threads.settings_loader import SettingsLoader, parse_server_sent_events
 
 
 def test_invalid_url():
@@ -124,3 +126,126 @@ def test_send_multiple_updates(requests_mock):
              "Settings loader: Read setting 'enabled': False")
         )
         assert not settings_loader.is_alive()
+
+
+def test_parse_server_sent_events():
+    """
+    Verifies that server-sent events are parsed correctly.
+    """
+
+    lines = [':keep alive', '', 'id: 1', 'event: settings', 'data: {"enabled":', 'data: true}', '',
+             'data:no space', '', 'id: 2', '']
+
+    assert list(parse_server_sent_events(lines)) == [
+        ('1', 'settings', '{"enabled":\ntrue}'),
+        ('1', 'message', 'no space')
+    ]
+
+
+def wait_for(condition, timeout):
+    """
+    Waits until the condition is true.
+
+    :param condition: A callable returning the condition.
+    :param timeout: The maximum time to wait in seconds.
+    :return: The time waited in seconds.
+    """
+    start = time.monotonic()
+    while not condition() and time.monotonic() - start < timeout:
+        time.sleep(0.001)
+    return time.monotonic() - start
+
+
+def test_push_updates():
+    """
+    Verifies that pushed settings are applied right away and the channel is resumed after reconnecting.
+    """
+
+    class test_updater:
+        enabled = None
+
+    with StandinServer(enabled=False, keepalive_interval=0.1) as server:
+        settings_loader = SettingsLoader(
+            'Test-Camera', server.url + '/api/camera/', 'valid_key', 2, [test_updater],
+            push_url=server.url + '/api/camera/events/')
+        settings_loader.start()
+
+        with LogCapture(names='berry_cam.threads.settings_loader') as log:
+            wait_for(lambda: server.push_subscriptions, 1)
+            assert wait_for(lambda: test_updater.enabled is False, 1) < 1
+
+            server.push_settings(True)
+            assert wait_for(lambda: test_updater.enabled, 1) < 0.1
+
+            # Reconnect after the connection is closed and resume after the last received event
+            server.disconnect_subscribers()
+            wait_for(lambda: len(server.push_subscriptions) == 2, 2)
+            assert server.push_subscriptions == [None, '1']
+
+            server.push_settings(False)
+            assert wait_for(lambda: test_updater.enabled is False, 1) < 0.1
+
+            settings_loader.stop()
+            settings_loader.join(1.5)
+
+            log.check_present(
+                ('berry_cam.threads.settings_loader', 'WARNING',
+                 'Settings loader: Push channel closed, polling until resubscribing.'),
+                ('berry_cam.threads.settings_loader', 'INFO', 'Settings loader: Subscribed to push channel.')
+            )
+            assert not settings_loader.is_alive()
+
+
+def test_push_channel_idle():
+    """
+    Verifies that an idle push channel is resubscribed without counting the read timeout as failure.
+    """
+
+    class test_updater:
+        enabled = None
+
+    breaker = CircuitBreaker(failure_threshold=1)
+    with StandinServer(enabled=False, keepalive_interval=10) as server:
+        settings_loader = SettingsLoader(
+            'Test-Camera', server.url + '/api/camera/', 'valid_key', 2, [test_updater],
+            push_url=server.url + '/api/camera/events/', push_read_timeout=0.2, breaker=breaker)
+        settings_loader.start()
+
+        resubscribed = wait_for(lambda: len(server.push_subscriptions) == 2, 3)
+        settings_loader.stop()
+        settings_loader.join(1.5)
+
+    assert resubscribed < 3
+    assert breaker.state == CLOSED
+    assert breaker.trips == 0
+    assert not settings_loader.is_alive()
+
+
+def test_push_not_available(requests_mock):
+    """
+    Verifies that the settings are polled if the server does not support the push channel.
+
+    :param requests_mock.Mocker requests_mock: The requests mocker
+    """
+
+    requests_mock.get('http://valid_url/events/', status_code=HTTPStatus.NOT_FOUND)
+    requests_mock.get('http://valid_url/', json={'enabled': True})
+
+    class test_updater:
+        enabled = False
+
+    with LogCapture(names='berry_cam.threads.settings_loader') as log:
+        settings_loader = SettingsLoader(
+            'Test-Camera', 'http://valid_url/', 'valid_key', 2, [test_updater],
+            push_url='http://valid_url/events/')
+        settings_loader.start()
+        time.sleep(0.5)
+        settings_loader.stop()
+        settings_loader.join(1.5)
+
+        assert test_updater.enabled
+        log.check_present(
+            ('berry_cam.threads.settings_loader', 'INFO',
+             'Settings loader: Push channel not available (status code 404), polling instead.')
+        )
+        assert not settings_loader.is_alive()
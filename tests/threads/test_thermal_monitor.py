@@ -0,0 +1,158 @@
+import os
+
+from testfixtures import LogCapture
+
+from berry_cam.supervisor import WorkerHandle
+from berry_cam.threads.thermal_monitor import HOT, NORMAL, WARM, ThermalMonitor
+
+
+class FakeWorker:
+    """
+    A worker recording the throttling attributes.
+    """
+
+    throttle = 1
+    capture_resize = None
+    upload_pause = 0
+
+
+class FakeSysfs:
+    """
+    A fake sysfs and procfs tree in a temporary directory.
+    """
+
+    def __init__(self, directory):
+        self.temperature_path = os.path.join(str(directory), 'temp')
+        self.load_path = os.path.join(str(directory), 'loadavg')
+        self.set(45, 0.2)
+
+    def set(self, temperature, load):
+        """
+        Updates the files.
+
+        :param temperature: The temperature in degrees celsius.
+        :param load: The 1 minute load average.
+        """
+        with open(self.temperature_path, 'w') as temperature_file:
+            temperature_file.write('{}\n'.format(int(temperature * 1000)))
+        with open(self.load_path, 'w') as load_file:
+            load_file.write('{} 0.50 0.40 1/123 4567\n'.format(load))
+
+
+def create_monitor(sysfs):
+    """
+    Creates a thermal monitor throttling fake workers.
+
+    :param FakeSysfs sysfs: The fake sysfs tree to read from.
+    :return: The monitor and the handles of the image capturing and uploader workers.
+    """
+    image_capturing = WorkerHandle('Image capturing', FakeWorker)
+    image_capturing.create()
+    uploader = WorkerHandle('Uploader', FakeWorker)
+    uploader.create()
+    monitor = ThermalMonitor(image_capturing, uploader, sysfs.temperature_path, sysfs.load_path,
+                             warm_temperature=70, hot_temperature=80, max_load=1.5, hysteresis=5, cpu_count=2)
+    return monitor, image_capturing, uploader
+
+
+def test_temperature_throttling(tmpdir):
+    """
+    Verifies that capturing and uploading are throttled depending on the temperature, with hysteresis.
+
+    :param tmpdir: The temporary directory for the fake sysfs tree.
+    """
+
+    sysfs = FakeSysfs(tmpdir)
+    monitor, image_capturing, uploader = create_monitor(sysfs)
+
+    with LogCapture(names='berry_cam.threads.thermal_monitor') as log:
+        monitor.check()
+        assert monitor.level == NORMAL
+        assert image_capturing.worker.throttle == 1
+
+        sysfs.set(72, 0.2)
+        monitor.check()
+        assert monitor.level == WARM
+        assert image_capturing.worker.throttle == 2
+        assert image_capturing.worker.capture_resize is None
+        assert uploader.worker.upload_pause == 0.5
+
+        sysfs.set(81, 0.2)
+        monitor.check()
+        assert monitor.level == HOT
+        assert image_capturing.worker.throttle == 4
+        assert image_capturing.worker.capture_resize == (640, 480)
+        assert uploader.worker.upload_pause == 2
+
+        # Restarted workers are throttled as well
+        assert image_capturing.create().capture_resize == (640, 480)
+
+        sysfs.set(77, 0.2)  # Within hysteresis
+        monitor.check()
+        assert monitor.level == HOT
+
+        sysfs.set(60, 0.2)
+        monitor.check()
+        assert monitor.level == NORMAL
+        assert image_capturing.worker.throttle == 1
+        assert image_capturing.worker.capture_resize is None
+        assert uploader.worker.upload_pause == 0
+
+        log.check_present(
+            ('berry_cam.threads.thermal_monitor', 'WARNING',
+             'Thermal monitor: warm (temperature 72.0 °C, load per cpu 0.10), throttling: frame interval x2, '
+             'resolution unchanged, upload pause 0.5 s.'),
+            ('berry_cam.threads.thermal_monitor', 'INFO',
+             'Thermal monitor: normal (temperature 60.0 °C, load per cpu 0.10), stop throttling: '
+             'frame interval x1, resolution unchanged, upload pause 0 s.')
+        )
+
+
+def test_load_throttling(tmpdir):
+    """
+    Verifies that capturing and uploading are throttled if the system is overloaded.
+
+    :param tmpdir: The temporary directory for the fake sysfs tree.
+    """
+
+    sysfs = FakeSysfs(tmpdir)
+    monitor, image_capturing, _ = create_monitor(sysfs)
+
+    sysfs.set(45, 3.2)
+    monitor.check()
+    assert monitor.level == WARM
+    assert image_capturing.worker.throttle == 2
+
+
+def test_missing_files(tmpdir):
+    """
+    Verifies that missing files are ignored and only logged once.
+
+    :param tmpdir: The temporary directory for the fake sysfs tree.
+    """
+
+    missing = os.path.join(str(tmpdir), 'missing')
+    monitor = ThermalMonitor(temperature_path=missing, load_path=missing)
+
+    with LogCapture(names='berry_cam.threads.thermal_monitor') as log:
+        monitor.check()
+        monitor.check()
+
+        assert monitor.level == NORMAL
+        assert len(log.records) == 1
+
+
+def test_fast_stop(tmpdir):
+    """
+    Verifies that the thread stops fast after .stop() is called.
+
+    :param tmpdir: The temporary directory for the fake sysfs tree.
+    """
+
+    sysfs = FakeSysfs(tmpdir)
+    monitor, _, _ = create_monitor(sysfs)
+    monitor.start()
+    monitor.stop()
+    monitor.join(1)
+
+    assert not monitor.is_alive()
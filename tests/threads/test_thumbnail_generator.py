@@ -0,0 +1,134 @@
+import os
+import shutil
+import time
+from queue import Queue
+
+import pytest
+from testfixtures import LogCapture
+
+from berry_cam.capture_record import THUMBNAIL
+from berry_cam.images import thumbnail_path
+from berry_cam.threads.thumbnail_generator import ThumbnailGenerator
+
+Image = pytest.importorskip('PIL.Image')
+
+TESTIMAGE = os.path.realpath(
+    os.path.join(os.path.dirname(__file__), '..', 'test_data', 'test.jpg'))
+
+
+def copy_images(directory, count):
+    """
+    Copies the test image, named by capture time.
+
+    :param directory: The directory to copy the images to.
+    :param count: The amount of images.
+    :return: The paths of the images.
+    """
+    images = []
+    for index in range(count):
+        image = os.path.join(str(directory), '{}.jpg'.format(1000 + index * 0.5))
+        shutil.copy(TESTIMAGE, image)
+        images.append(image)
+    return images
+
+
+def run_generator(images, **kwargs):
+    """
+    Passes the images through a thumbnail generator.
+
+    :param images: The images to put into the generator.
+    :param kwargs: Further arguments of the generator.
+    :return: The generator and the content of the upload queue in order.
+    """
+    upload_queue = Queue()
+    generator = ThumbnailGenerator(upload_queue, workers=2, **kwargs)
+    generator.start()
+    for image in images:
+        generator.input_queue.put(image)
+    generator._input_queue.join()
+    generator.stop()
+    generator.join(5)
+    assert not generator.is_alive()
+
+    result = []
+    while not upload_queue.empty():
+        result.append(upload_queue.get_nowait())
+    return generator, result
+
+
+def test_thumbnails_before_images(tmpdir):
+    """
+    Verifies that a thumbnail is created for each image and queued before it, in capture order.
+
+    :param tmpdir: The temporary directory to store the images in.
+    """
+
+    images = copy_images(tmpdir, 3)
+    generator, result = run_generator(images, size=(50, 40))
+
+    expected = []
+    for image in images:
+        expected += [thumbnail_path(image), image]
+    assert [os.fspath(item) for item in result] == expected
+    assert result[0].kind == THUMBNAIL
+    assert result[0].thumbnail_of == os.path.basename(images[0])
+    assert generator.generated == 3
+
+    with Image.open(thumbnail_path(images[0])) as thumbnail:
+        assert thumbnail.size == (40, 40)  # Aspect ratio is kept
+
+
+def test_failed_thumbnail(tmpdir):
+    """
+    Verifies that the image is still queued if no thumbnail can be created.
+
+    :param tmpdir: The temporary directory to store the images in.
+    """
+
+    image = os.path.join(str(tmpdir), '1000.0.jpg')
+    with open(image, 'wb') as image_file:
+        image_file.write(b'no image')
+
+    with LogCapture(names='berry_cam.threads.thumbnail_generator') as log:
+        generator, result = run_generator([image])
+
+        assert result == [image]
+        assert generator.failed == 1
+        assert 'Could not create thumbnail of {}'.format(image) in str(log)
+
+
+def test_fast_fail_empty_queue():
+    """
+    Verifies that the thread stops even if the input queue is empty.
+    """
+
+    generator = ThumbnailGenerator(Queue(), workers=1)
+    generator.start()
+    generator.stop()
+    generator.join(1.5)
+
+    assert not generator.is_alive()
+
+
+def test_stop_while_upload_queue_full(tmpdir):
+    """
+    Verifies that the thread stops even if the bounded upload queue stays full.
+
+    :param tmpdir: The temporary directory to store the images in.
+    """
+
+    image = copy_images(tmpdir, 1)[0]
+    upload_queue = Queue(1)
+    upload_queue.put('queued.jpg')
+
+    with LogCapture(names='berry_cam.threads.thumbnail_generator') as log:
+        generator = ThumbnailGenerator(upload_queue, workers=1)
+        generator.start()
+        generator.input_queue.put(image)
+        # Give the thumbnail time to be created, its forwarding then blocks on the full queue
+        time.sleep(1)
+        generator.stop()
+        generator.join(5)
+
+        assert not generator.is_alive()
+        assert 'Thread stopped while upload queue was full' in str(log)
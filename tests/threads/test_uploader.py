@@ -1,10 +1,19 @@
 import os
+import shutil
 import time
 import pytest
+import requests
 
 from http import HTTPStatus
+from queue import Queue
 from testfixtures import LogCapture
 
+from benchmarks.standin_server import StandinServer
+from berry_cam.capture_record import MANIFEST, CaptureRecord
+from berry_cam.circuit_breaker import CLOSED, CircuitBreaker
+from berry_cam.event_archive import GZIP, write_manifest
+from berry_cam.image_store import ImageStore
+from berry_cam.images import content_hash
 from berry_cam.threads.uploader import Uploader
 
 TESTIMAGE = os.path.realpath(
@@ -184,3 +193,244 @@ def test_upload_failed_with_other_failure(requests_mock):
              "Upload failed. Status code: {0}, message: b'\"Other failure\"'".format(HTTPStatus.BAD_REQUEST))
         )
         assert not uploader.is_alive()
+
+
+def test_keep_picture_on_failure():
+    """
+    Verifies that a picture that could not be uploaded stays in the upload queue,
+    so it can be uploaded by a restarted uploader.
+    """
+
+    upload_queue = Queue()
+    uploader = Uploader('http://invalid_url', 'invalid_key', 2, upload_queue)
+    uploader.upload_queue.put(TESTIMAGE)
+    uploader.start()
+    uploader.join(3)
+
+    assert not uploader.is_alive()
+    requeued = upload_queue.get_nowait()
+    assert requeued.path == TESTIMAGE
+    assert requeued.retries == 1
+
+
+def test_dedup_skips_existing_picture(requests_mock):
+    """
+    Verifies that a picture is not uploaded again if the server already has it.
+
+    :param requests_mock.Mocker requests_mock: The requests mocker
+    """
+
+    requests_mock.head('http://valid_url/')
+    requests_mock.post('http://valid_url/')
+
+    with LogCapture(names='berry_cam.threads.uploader') as log:
+        uploader = Uploader('http://valid_url', 'valid_key', 2, dedup=True)
+        uploader.start()
+        uploader.upload_queue.put(TESTIMAGE)
+        uploader.upload_queue.join()
+        uploader.stop()
+        uploader.join(1.5)
+
+        log.check_present(
+            ('berry_cam.threads.uploader', 'INFO', 'Picture {} already on server, skipping upload'.format(TESTIMAGE))
+        )
+        assert [request.method for request in requests_mock.request_history] == ['HEAD']
+        assert requests_mock.request_history[0].qs['checksum'] == [content_hash(TESTIMAGE)]
+        assert uploader.skipped_uploads == 1
+
+
+def test_dedup_uploads_new_picture(requests_mock):
+    """
+    Verifies that a picture unknown to the server is uploaded with checksum and idempotency key.
+
+    :param requests_mock.Mocker requests_mock: The requests mocker
+    """
+
+    requests_mock.head('http://valid_url/', status_code=HTTPStatus.NOT_FOUND)
+    requests_mock.post('http://valid_url/')
+
+    uploader = Uploader('http://valid_url', 'valid_key', 2, dedup=True)
+    uploader.start()
+    uploader.upload_queue.put(TESTIMAGE)
+    uploader.upload_queue.put(TESTIMAGE)
+    uploader.upload_queue.join()
+    uploader.stop()
+    uploader.join(1.5)
+
+    assert [request.method for request in requests_mock.request_history] == ['HEAD', 'POST', 'HEAD', 'POST']
+    assert requests_mock.request_history[1].headers['Idempotency-Key'] == content_hash(TESTIMAGE)
+    assert content_hash(TESTIMAGE).encode() in requests_mock.request_history[1].body
+    assert uploader.skipped_uploads == 0
+
+
+def test_dedup_not_supported(requests_mock):
+    """
+    Verifies that the check for existing pictures is disabled if the server does not support it.
+
+    :param requests_mock.Mocker requests_mock: The requests mocker
+    """
+
+    requests_mock.head('http://valid_url/', status_code=HTTPStatus.METHOD_NOT_ALLOWED)
+    requests_mock.post('http://valid_url/')
+
+    uploader = Uploader('http://valid_url', 'valid_key', 2, dedup=True)
+    uploader.start()
+    uploader.upload_queue.put(TESTIMAGE)
+    uploader.upload_queue.put(TESTIMAGE)
+    uploader.upload_queue.join()
+    uploader.stop()
+    uploader.join(1.5)
+
+    assert [request.method for request in requests_mock.request_history] == ['HEAD', 'POST', 'POST']
+
+
+def test_thumbnail_upload(requests_mock, tmpdir):
+    """
+    Verifies that thumbnails are uploaded with the name of their full resolution image.
+
+    :param requests_mock.Mocker requests_mock: The requests mocker
+    :param tmpdir: The temporary directory to store the thumbnail in.
+    """
+
+    requests_mock.post('http://valid_url/')
+    thumbnail = os.path.join(str(tmpdir), '1000.5.thumb.jpg')
+    shutil.copy(TESTIMAGE, thumbnail)
+
+    uploader = Uploader('http://valid_url', 'valid_key', 2)
+    uploader.start()
+    uploader.upload_queue.put(thumbnail)
+    uploader.upload_queue.join()
+    uploader.stop()
+    uploader.join(1.5)
+
+    assert b'name="thumbnail_of"\r\n\r\n1000.5.jpg' in requests_mock.request_history[0].body
+
+
+def test_mark_uploaded(requests_mock, tmpdir):
+    """
+    Verifies that uploaded pictures are not recovered from the image store, but failed ones are.
+
+    :param requests_mock.Mocker requests_mock: The requests mocker
+    :param tmpdir: The temporary directory to store the pictures in.
+    """
+
+    requests_mock.post('http://valid_url/', [{'status_code': HTTPStatus.OK},
+                                             {'status_code': HTTPStatus.FORBIDDEN}])
+    store = ImageStore(str(tmpdir))
+    pictures = [store.path_for(1000.5 + i) for i in range(2)]
+    for picture in pictures:
+        shutil.copy(TESTIMAGE, picture)
+        store.add_pending(picture)
+
+    uploader = Uploader('http://valid_url', 'valid_key', 2, image_store=store)
+    uploader.start()
+    for picture in pictures:
+        uploader.upload_queue.put(picture)
+    uploader.join(1.5)
+    store.close()
+
+    assert ImageStore(str(tmpdir)).recover() == [pictures[1]]
+
+
+def test_roi_upload(requests_mock, tmpdir):
+    """
+    Verifies that cropped frames are uploaded with their key frame and crop box.
+
+    :param requests_mock.Mocker requests_mock: The requests mocker
+    :param tmpdir: The temporary directory to store the cropped frame in.
+    """
+
+    requests_mock.post('http://valid_url/')
+    cropped = os.path.join(str(tmpdir), '1000.5.roi_1000.0_16_32_128_96.jpg')
+    shutil.copy(TESTIMAGE, cropped)
+
+    uploader = Uploader('http://valid_url', 'valid_key', 2)
+    uploader.start()
+    uploader.upload_queue.put(cropped)
+    uploader.upload_queue.join()
+    uploader.stop()
+    uploader.join(1.5)
+
+    assert b'name="roi_of"\r\n\r\n1000.0.jpg' in requests_mock.request_history[0].body
+    assert b'name="roi"\r\n\r\n16,32,128,96' in requests_mock.request_history[0].body
+
+
+def test_circuit_breaker(requests_mock):
+    """
+    Verifies that the uploader waits for the server instead of giving up while the circuit is open.
+
+    :param requests_mock.Mocker requests_mock: The requests mocker
+    """
+
+    requests_mock.post('http://valid_url/', [{'exc': requests.exceptions.ConnectionError},
+                                             {'exc': requests.exceptions.ConnectionError},
+                                             {'status_code': HTTPStatus.OK}])
+
+    breaker = CircuitBreaker(1, reset_timeout=0.2)
+    uploader = Uploader('http://valid_url', 'valid_key', 1, breaker=breaker)
+    uploader.start()
+    uploader.upload_queue.put(TESTIMAGE)
+    uploader.upload_queue.join()
+
+    assert len(requests_mock.request_history) == 3
+    assert breaker.state == CLOSED
+    assert uploader.is_alive()
+    uploader.stop()
+    uploader.join(1.5)
+
+
+def test_event_archive(tmpdir):
+    """
+    Verifies that event manifests are uploaded as archive of all frames of the event.
+
+    :param tmpdir: The temporary directory to store the event in.
+    """
+
+    frames = []
+    for index in range(3):
+        frame = os.path.join(str(tmpdir), '{}.jpg'.format(1000 + index))
+        with open(TESTIMAGE, 'rb') as source, open(frame, 'wb') as target:
+            target.write(source.read() + str(index).encode())
+        frames.append(frame)
+    manifest = write_manifest(frames, 1003)
+
+    with StandinServer() as server:
+        uploader = Uploader(server.url + '/api/picture/', server.api_key, 2,
+                            archive_url=server.url + '/api/event/', archive_compression=GZIP, name='Test-Camera')
+        uploader.start()
+        uploader.upload_queue.put(manifest)
+        uploader.upload_queue.join()
+        uploader.stop()
+        uploader.join(1.5)
+
+        assert server.requests[('POST', '/api/event/')] == 1
+        assert server.requests[('POST', '/api/picture/')] == 0
+        assert [event['frames'] for event in server.events] == [['1000.jpg', '1001.jpg', '1002.jpg']]
+        assert sorted(server.pictures) == sorted(content_hash(frame) for frame in frames)
+
+
+def test_event_archive_with_dedup(requests_mock, tmpdir):
+    """
+    Verifies that event archives are always sent, without asking the server for a picture checksum.
+
+    :param requests_mock.Mocker requests_mock: The requests mocker
+    :param tmpdir: The temporary directory to store the event in.
+    """
+
+    requests_mock.head('http://valid_url/')
+    requests_mock.post('http://valid_url/event/')
+    frame = os.path.join(str(tmpdir), '1000.jpg')
+    shutil.copy(TESTIMAGE, frame)
+    manifest = write_manifest([frame], 1001)
+
+    uploader = Uploader('http://valid_url', 'valid_key', 2, dedup=True, archive_url='http://valid_url/event/',
+                        name='Test-Camera')
+    uploader.start()
+    uploader.upload_queue.put(CaptureRecord(manifest, MANIFEST, 1000))
+    uploader.upload_queue.put(TESTIMAGE)
+    uploader.upload_queue.join()
+    uploader.stop()
+    uploader.join(1.5)
+
+    assert [request.method for request in requests_mock.request_history] == ['POST', 'HEAD']
+    assert uploader.skipped_uploads == 1